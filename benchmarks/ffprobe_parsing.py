@@ -0,0 +1,71 @@
+import json
+import timeit
+
+from src.schemas import FFprobeFileData, FFprobeFullData, StreamType
+
+# Микробенчмарк разбора вывода ffprobe для файла с большим числом дорожек:
+#   python -m benchmarks.ffprobe_parsing
+# Сравнивает прежний путь (json.loads + конструктор модели, фильтрация потоков при каждом запросе)
+# с разбором байтов валидатором pydantic и индексом потоков по типу
+
+
+def make_probe_output(audio: int = 40, subtitles: int = 80, attachments: int = 20) -> bytes:
+    """ Синтетический полный вывод ``ffprobe -show_format -show_streams`` """
+    streams = [{
+        'index': 0, 'codec_name': 'hevc', 'codec_long_name': 'H.265 / HEVC', 'profile': 'Main 10',
+        'codec_type': 'video', 'codec_tag_string': '[0][0][0][0]', 'codec_tag': '0x0000',
+        'width': 1920, 'height': 1080, 'coded_width': 1920, 'coded_height': 1080, 'has_b_frames': 2,
+        'pix_fmt': 'yuv420p10le', 'level': 120, 'r_frame_rate': '24000/1001', 'avg_frame_rate': '24000/1001',
+        'time_base': '1/1000', 'start_pts': 0, 'start_time': '0.000000',
+        'tags': {'language': 'jpn', 'BPS': '4000000', 'DURATION': '00:24:00.000000000'},
+    }]
+    kinds = [('audio', 'aac', audio), ('subtitle', 'ass', subtitles), ('attachment', 'ttf', attachments)]
+    for codec_type, codec_name, count in kinds:
+        for _ in range(count):
+            streams.append({
+                'index': len(streams), 'codec_name': codec_name, 'codec_long_name': codec_name.upper(),
+                'codec_type': codec_type, 'codec_tag_string': '[0][0][0][0]', 'codec_tag': '0x0000',
+                'r_frame_rate': '0/0', 'avg_frame_rate': '0/0', 'time_base': '1/1000',
+                'start_pts': 0, 'start_time': '0.000000', 'extradata_size': 1024,
+                'tags': {'language': 'rus', 'title': f'{codec_type} {len(streams)}', 'NUMBER_OF_BYTES': '123456'},
+            })
+    data = {
+        'streams': streams,
+        'format': {
+            'filename': 'episode.mkv', 'nb_streams': len(streams), 'format_name': 'matroska,webm',
+            'format_long_name': 'Matroska / WebM', 'duration': '1440.000000', 'size': '1073741824',
+            'bit_rate': '5965232', 'probe_score': 100, 'tags': {'encoder': 'libebml'},
+        },
+    }
+    return json.dumps(data, indent=4).encode('utf-8')
+
+
+def legacy(raw: bytes) -> None:
+    data = FFprobeFullData(**json.loads(raw.decode('utf-8')))
+    for stream_type in (StreamType.VIDEO, StreamType.AUDIO, StreamType.SUBTITLE, StreamType.SUBTITLE):
+        _ = [s for s in data.streams if s.codec_type == stream_type]
+
+
+def current(raw: bytes, model: type[FFprobeFileData] = FFprobeFullData) -> None:
+    data = model.model_validate_json(raw)
+    for stream_type in (StreamType.VIDEO, StreamType.AUDIO, StreamType.SUBTITLE, StreamType.SUBTITLE):
+        _ = data.get_streams_of_type(stream_type)
+
+
+def main(number: int = 200) -> None:
+    raw = make_probe_output()
+    cases = [
+        ('json.loads + FFprobeFullData(**data)', lambda: legacy(raw)),
+        ('FFprobeFullData.model_validate_json', lambda: current(raw)),
+        ('FFprobeFileData.model_validate_json', lambda: current(raw, FFprobeFileData)),
+    ]
+    print(f'Вывод ffprobe: {len(raw) / 1024:.0f} КБ, потоков: {len(json.loads(raw)["streams"])}')
+    baseline = None
+    for title, func in cases:
+        best = min(timeit.repeat(func, number=number, repeat=5)) / number
+        baseline = baseline or best
+        print(f'{title:<40} {best * 1e6:8.1f} мкс  x{baseline / best:.2f}')
+
+
+if __name__ == '__main__':
+    main()
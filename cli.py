@@ -0,0 +1,338 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from settings import Defaults, FFmpegSettings, REMUX_PRESET
+from src.schemas import FileList, FileItem, FFprobeFileData, FileProgress, BatchProgress
+from src.services.ffmpeg import FFmpeg
+from src.services.jobs import Job
+from src.services.loop import HeadlessLoop
+from src.services.pairing import pair_tracks, describe_pairs
+from src.services.pipeline import Pipeline
+from src.services.sync import sync_available
+from src.utils.string import strip_markup
+
+# Консольный запуск операций MovieKit без GUI. Kivy при этом не импортируется:
+#   python cli.py convert D:/video --to mkv
+#   python cli.py extract D:/video -o D:/subs
+#   python cli.py add-subtitles D:/video D:/subs --shift 1.5
+#   python cli.py add-subtitles D:/video D:/subs --dry-run
+#   python cli.py add-subtitles D:/video D:/subs --auto-sync
+#   python cli.py subtitles D:/subs --shift -0.5 --to srt
+#   python cli.py add-audio D:/video D:/dubs -r --language rus
+#   python cli.py pipeline D:/video --to mp4 --subtitles D:/subs --audio D:/dubs
+#   python cli.py resume 3
+
+
+class ConsoleReporter:
+    """ Коллбэки ``FFmpeg``, выводящие результаты в консоль """
+
+    def __init__(self, progress_interval: float = 1.0) -> None:
+        """
+        :param progress_interval: как часто (в секундах) выводить строку прогресса
+        """
+        self.errors = 0
+        self.progress_interval = progress_interval
+        self.__last_progress = 0.0
+
+    @staticmethod
+    def __title(f: FileItem) -> str:
+        return f'{f.index:02}. {f.fullname}'
+
+    async def success(self, f: FileItem, result: str) -> None:
+        print(f'{self.__title(f)}: {result}')
+
+    async def error(self, f: FileItem, result: str) -> None:
+        self.errors += 1
+        print(f'{self.__title(f)}: {result}', file=sys.stderr)
+
+    async def info(self, f: FileItem, output: FFprobeFileData) -> None:
+        print(f'{self.__title(f)}\n{strip_markup(output.describe_as_text())}\n')
+
+    async def info_full(self, f: FileItem, output: FFprobeFileData) -> None:
+        print(f'{self.__title(f)}\n{output.model_dump_json(indent=2, exclude_none=True)}\n')
+
+    async def info_error(self, f: FileItem, output: FFprobeFileData) -> None:
+        self.errors += 1
+        print(f'{self.__title(f)}: ошибка чтения метаданных', file=sys.stderr)
+
+    async def progress(self, f: FileItem, progress: FileProgress, batch: BatchProgress) -> None:
+        now = time.monotonic()
+        if now - self.__last_progress < self.progress_interval and not progress.finished:
+            return
+        self.__last_progress = now
+        print(f'[{batch.describe()}]', file=sys.stderr)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='moviekit',
+        description='Пакетная обработка видеофайлов посредством ffmpeg без GUI',
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-o', '--output', type=Path, default=None, help='каталог для результатов')
+    common.add_argument('-f', '--formats', nargs='+', default=Defaults.video_supported_formats,
+                        help='форматы входных видеофайлов')
+    common.add_argument('-r', '--recursive', action='store_true', help='искать файлы в подкаталогах')
+    common.add_argument('-j', '--jobs', type=int, default=None,
+                        help='число одновременно запущенных процессов ffmpeg')
+    common.add_argument('--no-cache', action='store_true', help='не использовать кэш метаданных ffprobe')
+    common.add_argument('--force', action='store_true',
+                        help='обрабатывать файлы заново, даже если результаты не изменились')
+    common.add_argument('-q', '--quiet', action='store_true', help='не выводить прогресс')
+
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    info = commands.add_parser('info', parents=[common], help='метаданные медиафайлов')
+    info.add_argument('input', type=Path)
+    info.add_argument('--full', action='store_true', help='полный вывод ffprobe в JSON')
+
+    convert = commands.add_parser('convert', parents=[common], help='перепаковка видео в другой контейнер')
+    convert.add_argument('input', type=Path)
+    convert.add_argument('--to', required=True, choices=Defaults.video_supported_formats, dest='output_format')
+    convert.add_argument('--preset', default=REMUX_PRESET, choices=[REMUX_PRESET, *FFmpegSettings().ENCODER_PRESETS],
+                         help='пресет перекодирования несовместимых с контейнером потоков')
+    convert.add_argument('--segments', type=int, default=None,
+                         help='кодировать долгие файлы частями: на сколько частей делить видео')
+    convert.add_argument('--segment-workers', type=int, default=None,
+                         help='сколько частей кодировать одновременно')
+
+    extract = commands.add_parser('extract', parents=[common], help='извлечение субтитров')
+    extract.add_argument('input', type=Path)
+    extract.add_argument('-l', '--languages', nargs='+', default=None, help='языки извлекаемых субтитров')
+
+    add = commands.add_parser('add-subtitles', parents=[common], help='добавление субтитров к видео')
+    add.add_argument('input', type=Path)
+    add.add_argument('subtitles', type=Path)
+    add.add_argument('--subtitle-formats', nargs='+', default=Defaults.subtitle_supported_formats)
+    add.add_argument('--shift', type=float, default=0, help='сдвиг субтитров (в секундах)')
+    add.add_argument('--language', default='rus', help='язык субтитров, если он не указан в имени файла')
+    add.add_argument('--auto-sync', action='store_true',
+                     help='подобрать сдвиг каждого файла субтитров по звуку видео (нужен numpy)')
+    add.add_argument('--dry-run', action='store_true', help='только показать пары видео - субтитры (и сдвиги)')
+
+    subtitles = commands.add_parser('subtitles', parents=[common],
+                                    help='сдвиг и конвертация субтитров ASS/SRT без ffmpeg')
+    subtitles.add_argument('input', type=Path)
+    subtitles.add_argument('--subtitle-formats', nargs='+', default=Defaults.subtitle_supported_formats)
+    subtitles.add_argument('--to', default=None, choices=Defaults.subtitle_supported_formats, dest='output_format',
+                           help='формат результата (по умолчанию - формат исходного файла)')
+    subtitles.add_argument('--shift', type=float, default=0, help='сдвиг субтитров (в секундах)')
+    subtitles.add_argument('--scale', type=float, default=1,
+                           help='коэффициент масштабирования времени, например, 1.0427 для 23.976 -> 25 fps')
+
+    audio = commands.add_parser('add-audio', parents=[common], help='добавление аудиодорожек к видео')
+    audio.add_argument('input', type=Path)
+    audio.add_argument('audiotracks', type=Path)
+    audio.add_argument('--audio-formats', nargs='+', default=Defaults.audio_supported_formats)
+    audio.add_argument('--shift', type=float, default=0, help='сдвиг аудиодорожек (в секундах)')
+    audio.add_argument('--language', default=None, help='язык добавляемых дорожек (ISO 639-2)')
+
+    pipeline = commands.add_parser('pipeline', parents=[common],
+                                   help='перепаковка, добавление субтитров и аудиодорожек за один проход')
+    pipeline.add_argument('input', type=Path)
+    pipeline.add_argument('--to', default=None, choices=Defaults.video_supported_formats, dest='output_format',
+                          help='формат результата (по умолчанию - формат исходного видео)')
+    pipeline.add_argument('--preset', default=REMUX_PRESET, choices=[REMUX_PRESET, *FFmpegSettings().ENCODER_PRESETS],
+                          help='пресет перекодирования несовместимых с контейнером потоков')
+    pipeline.add_argument('--subtitles', type=Path, default=None, help='каталог добавляемых субтитров')
+    pipeline.add_argument('--subtitle-formats', nargs='+', default=Defaults.subtitle_supported_formats)
+    pipeline.add_argument('--subtitle-shift', type=float, default=0, help='сдвиг субтитров (в секундах)')
+    pipeline.add_argument('--audio', type=Path, default=None, help='каталог добавляемых аудиодорожек')
+    pipeline.add_argument('--audio-formats', nargs='+', default=Defaults.audio_supported_formats)
+    pipeline.add_argument('--audio-shift', type=float, default=0, help='сдвиг аудиодорожек (в секундах)')
+    pipeline.add_argument('--language', default=None, help='язык добавляемых аудиодорожек (ISO 639-2)')
+
+    resume = commands.add_parser('resume', parents=[common],
+                                 help='продолжение операции, прерванной падением или закрытием приложения')
+    resume.add_argument('batch_id', type=int, nargs='?', default=None,
+                        help='номер операции в журнале (без номера - список прерванных операций)')
+    resume.add_argument('--discard', action='store_true', help='удалить операцию из журнала, не продолжая ее')
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    settings = FFmpegSettings()
+    if args.jobs:
+        settings.MAX_CONCURRENT_REMUXES = args.jobs
+        settings.MAX_CONCURRENT_ENCODES = args.jobs
+    if getattr(args, 'segments', None) is not None:
+        settings.SEGMENT_COUNT = args.segments
+        settings.SEGMENT_MIN_DURATION_SECONDS = 0
+    if getattr(args, 'segment_workers', None):
+        settings.SEGMENT_WORKERS = args.segment_workers
+    if getattr(args, 'languages', None):
+        settings.SUBTITLE_LANGUAGES_TO_EXTRACT = args.languages
+
+    ffmpeg = FFmpeg(
+        output=str(args.output) if args.output else None,
+        use_cache=not args.no_cache,
+        incremental=not args.force,
+        settings=settings,
+    )
+    reporter = ConsoleReporter()
+    on_progress = None if args.quiet else reporter.progress
+    job = Job()
+
+    if args.command == 'resume':
+        interrupted = {batch.id: batch for batch in FFmpeg.job_journal().interrupted()}
+        if args.batch_id is None:
+            for batch in interrupted.values():
+                print(batch.describe())
+            return 0
+        batch = interrupted.get(args.batch_id)
+        if batch is None:
+            print(f'Прерванная операция #{args.batch_id} не найдена', file=sys.stderr)
+            return 1
+        if args.discard:
+            FFmpeg.job_journal().discard(batch.id)
+            return 0
+        ffmpeg = FFmpeg(
+            output=str(batch.output),
+            use_cache=not args.no_cache,
+            incremental=not args.force,
+            settings=settings,
+        )
+        HeadlessLoop().run(ffmpeg.resume(
+            batch,
+            on_success=reporter.success,
+            on_error=reporter.error,
+            on_progress=on_progress,
+            job=job,
+        ), on_interrupt=job.cancel)
+        if job.cancelled:
+            return 130
+        return 1 if reporter.errors else 0
+
+    if args.command == 'subtitles':
+        HeadlessLoop().run(ffmpeg.convert_subtitles(
+            FileList.from_path(args.input, formats=args.subtitle_formats, recursively=args.recursive).active,
+            output_format=args.output_format,
+            shift=args.shift,
+            scale=args.scale,
+            on_success=reporter.success,
+            on_error=reporter.error,
+            job=job,
+        ), on_interrupt=job.cancel)
+        return 1 if reporter.errors else 0
+
+    videos = FileList.from_path(args.input, formats=args.formats, recursively=args.recursive).active
+    match args.command:
+        case 'info':
+            coro = ffmpeg.info(
+                videos,
+                on_success=reporter.info_full if args.full else reporter.info,
+                on_error=reporter.info_error,
+                job=job,
+                full=args.full,
+            )
+        case 'convert':
+            coro = ffmpeg.convert_video(
+                videos,
+                output_format=args.output_format,
+                preset=settings.ENCODER_PRESETS.get(args.preset),
+                on_success=reporter.success,
+                on_error=reporter.error,
+                on_progress=on_progress,
+                job=job,
+            )
+        case 'extract':
+            coro = ffmpeg.extract_subtitles(
+                videos,
+                on_success=reporter.success,
+                on_error=reporter.error,
+                on_progress=on_progress,
+                job=job,
+            )
+        case 'add-subtitles':
+            subtitles = FileList.from_path(
+                args.subtitles,
+                formats=args.subtitle_formats,
+                recursively=args.recursive,
+            ).active
+            if args.dry_run:
+                for line in describe_pairs(pair_tracks(videos, subtitles), subtitles):
+                    print(line)
+            subtitle_shifts = {}
+            if args.auto_sync:
+                if not sync_available():
+                    print('Для подбора сдвига нужен numpy: pip install numpy', file=sys.stderr)
+                    return 1
+                estimates = HeadlessLoop().run(ffmpeg.estimate_subtitle_shifts(
+                    videos,
+                    subtitles,
+                    on_success=reporter.success,
+                    on_error=reporter.error,
+                    job=job,
+                ), on_interrupt=job.cancel)
+                if job.cancelled:
+                    return 130
+                subtitle_shifts = {path: estimate.shift for path, estimate in estimates.items()}
+            if args.dry_run:
+                return 0
+            coro = ffmpeg.add_subtitles(
+                videos,
+                subtitles,
+                subtitle_shift=args.shift,
+                language=args.language,
+                subtitle_shifts=subtitle_shifts,
+                on_success=reporter.success,
+                on_error=reporter.error,
+                on_progress=on_progress,
+                job=job,
+            )
+        case 'add-audio':
+            audiotracks = FileList.from_path(
+                args.audiotracks,
+                formats=args.audio_formats,
+                recursively=args.recursive,
+            ).active
+            coro = ffmpeg.add_audiotracks(
+                videos,
+                audiotracks,
+                audiotrack_shift=args.shift,
+                language=args.language,
+                on_success=reporter.success,
+                on_error=reporter.error,
+                on_progress=on_progress,
+                job=job,
+            )
+        case 'pipeline':
+            chain = Pipeline()
+            if args.output_format is not None or args.preset != REMUX_PRESET:
+                chain.convert(args.output_format, preset=settings.ENCODER_PRESETS.get(args.preset))
+            if args.subtitles is not None:
+                chain.add_subtitles(
+                    FileList.from_path(args.subtitles, formats=args.subtitle_formats, recursively=args.recursive).active,
+                    shift=args.subtitle_shift,
+                )
+            if args.audio is not None:
+                chain.add_audiotracks(
+                    FileList.from_path(args.audio, formats=args.audio_formats, recursively=args.recursive).active,
+                    shift=args.audio_shift,
+                    language=args.language,
+                )
+            coro = ffmpeg.run_pipeline(
+                videos,
+                chain,
+                on_success=reporter.success,
+                on_error=reporter.error,
+                on_progress=on_progress,
+                job=job,
+            )
+        case _:
+            raise ValueError(f'Неизвестная команда {args.command}')
+
+    # Ctrl+C отменяет операцию: процессы ffmpeg завершаются, недописанные файлы удаляются
+    HeadlessLoop().run(coro, on_interrupt=job.cancel)
+    if job.cancelled:
+        return 130
+    return 1 if reporter.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,20 @@
+import atexit
+import copy
+import functools
 import re
-import yaml
 from pathlib import Path
 from typing import Any, Type
 
+from pydantic import PrivateAttr
 from pydantic.dataclasses import dataclass
-from pydantic import BaseModel, ConfigDict
 from kivy.metrics import dp
 from kivy.lang import Builder
 from kivy.properties import ObservableList, ObservableDict
 from kivymd.uix.widget import MDWidget
 
+from settings import Defaults, DataModel, FFmpegSettings, LogSettings, REMUX_PRESET
+from src.services.store import YamlStore
+
 KIVY_RGBA = tuple[float, float, float, float]
 
 
@@ -26,58 +31,42 @@ def yamlable(value: Any) -> str | int | float | bool | list | dict:
             return value
 
 
-class Defaults:
-    base_dir = Path(__file__).resolve().parent
-    video_supported_formats = ['ts', 'mkv', 'mp4', 'avi', 'webm']
-    audio_supported_formats = ['mp3', 'wav', 'mka']
-    subtitle_supported_formats = ['ass', 'srt']
-
-    @classmethod
-    def input(cls, subdir: str) -> str:
-        path = cls.base_dir / 'input' / subdir
-        path.mkdir(exist_ok=True, parents=True)
-        return str(path)
-
-    @classmethod
-    def output(cls) -> str:
-        path = cls.base_dir / 'output'
-        path.mkdir(exist_ok=True, parents=True)
-        return str(path)
-
-
-yaml_config_default = {
-    'page_settings': {
-        'videoconversion': {
-            'video_input_dir': Defaults.input('video'),
-            'video_input_formats': Defaults.video_supported_formats,
-            'output_dir': Defaults.output(),
-            'video_output_format': '',
+@functools.cache
+def get_yaml_config_default() -> dict[str, Any]:
+    """
+    Содержимое конфиг-файла по умолчанию.
+    Вычисляется (и создает каталоги по умолчанию) только при первом обращении
+    """
+    return {
+        'page_settings': {
+            'videoconversion': {
+                'video_input_dir': Defaults.input('video'),
+                'video_input_formats': Defaults.video_supported_formats,
+                'output_dir': Defaults.output(),
+                'video_output_format': '',
+                'video_conversion_preset': REMUX_PRESET,
+            },
+            'subtitleextraction': {
+                'video_input_dir': Defaults.input('video'),
+                'video_input_formats': Defaults.video_supported_formats,
+                'output_dir': Defaults.output(),
+            },
+            'subtitleadding': {
+                'video_input_dir': Defaults.input('video'),
+                'video_input_formats': Defaults.video_supported_formats,
+                'subtitle_input_dir': Defaults.input('subtitle'),
+                'subtitle_input_formats': Defaults.subtitle_supported_formats,
+                'output_dir': Defaults.output(),
+            },
+            'audiotrackadding': {
+                'video_input_dir': Defaults.input('video'),
+                'video_input_formats': Defaults.video_supported_formats,
+                'audiotrack_input_dir': Defaults.input('audiotrack'),
+                'audiotrack_input_formats': Defaults.audio_supported_formats,
+                'output_dir': Defaults.output(),
+            },
         },
-        'subtitleextraction': {
-            'video_input_dir': Defaults.input('video'),
-            'video_input_formats': Defaults.video_supported_formats,
-            'output_dir': Defaults.output(),
-        },
-        'subtitleadding': {
-            'video_input_dir': Defaults.input('video'),
-            'video_input_formats': Defaults.video_supported_formats,
-            'subtitle_input_dir': Defaults.input('subtitle'),
-            'subtitle_input_formats': Defaults.subtitle_supported_formats,
-            'output_dir': Defaults.output(),
-        },
-        'audiotrackadding': {
-            'video_input_dir': Defaults.input('video'),
-            'video_input_formats': Defaults.video_supported_formats,
-            'audiotrack_input_dir': Defaults.input('audiotrack'),
-            'audiotrack_input_formats': Defaults.audio_supported_formats,
-            'output_dir': Defaults.output(),
-        },
-    },
-}
-
-
-class DataModel(BaseModel):
-    model_config = ConfigDict(arbitrary_types_allowed=True)
+    }
 
 
 @dataclass
@@ -146,6 +135,10 @@ class GUI(DataModel):
     FILE_VIEWER_PADDING: float
     FILE_VIEWER_CHECKBOX_MARGIN_LEFT: float
     SCROLL_BAR_WIDTH: float
+    # как часто (раз в секунду) обновлять на экране прогресс операции
+    PROGRESS_REFRESH_RATE: float
+    # сколько предлагаемых пар показывать в окне подтверждения (полный список пишется в журнал)
+    PAIRING_PREVIEW_LINES: int
     colors: Colors
 
     @property
@@ -155,6 +148,10 @@ class GUI(DataModel):
 
 class Pagination(DataModel):
     HIERARCHY_MAX_LENGTH: int
+    # загружать ли остальные страницы в фоне после показа первой
+    PREWARM_PAGES: bool
+    # пауза между загрузкой страниц (в секундах), чтобы не задерживать обработку ввода
+    PREWARM_DELAY: float
 
 
 class Titles(DataModel):
@@ -162,11 +159,21 @@ class Titles(DataModel):
     OUTPUT_DIR: str
     INPUT_FORMATS: str
     OUTPUT_FORMAT: str
+    ENCODER_PRESET: str
     GO: str
+    STOP: str
+    RESUME_HEADLINE: str
+    RESUME: str
+    DISCARD: str
+    PAIRING_HEADLINE: str
+    CANCEL: str
+    SYNC: str
+    SYNC_UNAVAILABLE: str
 
 
 class PersistentPageSettings(DataModel):
     """ Настройки страницы, дублируемые в конфиг-файл """
+    _store: YamlStore | None = PrivateAttr(default=None)
 
     @staticmethod
     def __get_page_key(cls: Type['PersistentPageSettings']) -> str:
@@ -177,12 +184,9 @@ class PersistentPageSettings(DataModel):
             raise AttributeError(f'{self.__class__.__name__} не имеет поля {field}')
 
         setattr(self, field, value)
-        base_dir = Path(__file__).resolve().parent
-        with open(base_dir / 'config.yaml', 'r', encoding='utf-8') as f:
-            yaml_config = yaml.safe_load(f)
-        yaml_config['page_settings'][self.__get_page_key(self.__class__)][field.lower()] = yamlable(value)
-        with open(base_dir / 'config.yaml', 'w', encoding='utf-8') as f:
-            yaml.safe_dump(yaml_config, f, encoding='utf-8')
+        if self._store is not None:
+            # запись на диск отложена и выполняется в фоне, см. YamlStore
+            self._store.set(('page_settings', self.__get_page_key(self.__class__), field.lower()), yamlable(value))
 
     def update(self, field: str, value: Any) -> None:
         """ Обновляет настройку, дублирует изменения в конфиг-файл """
@@ -192,17 +196,23 @@ class PersistentPageSettings(DataModel):
         """ Возвращает настройке значение по умолчанию, дублирует изменения в конфиг-файл """
         self.__update_value(
             field=field,
-            value=yaml_config_default['page_settings'][self.__get_page_key(self.__class__)][field.lower()],
+            value=get_yaml_config_default()['page_settings'][self.__get_page_key(self.__class__)][field.lower()],
         )
 
     @classmethod
-    def from_yaml(cls, loaded_yaml: dict[str]) -> 'PersistentPageSettings':
-        """ Загружает настройки из конфиг-файла """
+    def from_yaml(cls, loaded_yaml: dict[str], store: YamlStore | None = None) -> 'PersistentPageSettings':
+        """
+        Загружает настройки из конфиг-файла
+        :param loaded_yaml: содержимое конфиг-файла
+        :param store: куда сохранять изменения настроек
+        """
         kwargs = {}
         for key, value in loaded_yaml['page_settings'][cls.__get_page_key(cls)].items():
             kwargs[key.upper()] = value
 
-        return cls(**kwargs)
+        instance = cls(**kwargs)
+        instance._store = store
+        return instance
 
 
 class VideoConversionPageSettings(PersistentPageSettings):
@@ -210,6 +220,8 @@ class VideoConversionPageSettings(PersistentPageSettings):
     VIDEO_INPUT_FORMATS: list[str]
     OUTPUT_DIR: Path
     VIDEO_OUTPUT_FORMAT: str
+    # имя пресета из FFmpegSettings.ENCODER_PRESETS либо REMUX_PRESET (только копирование потоков)
+    VIDEO_CONVERSION_PRESET: str = REMUX_PRESET
 
 
 class SubtitleExtractionPageSettings(PersistentPageSettings):
@@ -227,7 +239,11 @@ class SubtitleAddingPageSettings(PersistentPageSettings):
 
 
 class AudiotrackAddingPageSettings(PersistentPageSettings):
-    pass
+    VIDEO_INPUT_DIR: Path
+    VIDEO_INPUT_FORMATS: list[str]
+    AUDIOTRACK_INPUT_DIR: Path
+    AUDIOTRACK_INPUT_FORMATS: list[str]
+    OUTPUT_DIR: Path
 
 
 # т.к. IDE ругается на попытку доступа к атрибуту наследника PersistentPageSettings
@@ -251,7 +267,27 @@ class PageData(DataModel):
     def kv_path(self) -> str:
         return str(config.BASE_DIR / 'data' / 'pages' / f'{self.key}.kv'.lower())
 
+    def ensure_settings_paths(self) -> list[Path]:
+        """
+        Проверяет существование указанных в настройках страницы путей.
+        Если путь не существует - меняет его на дефолтный
+        :return: список путей, замененных на дефолтные
+        """
+        invalid_paths: list[Path] = []
+        if self.settings is None:
+            return invalid_paths
+        for field, value in self.settings.model_dump().items():
+            if isinstance(value, Path):
+                if not value.exists():
+                    self.settings.set_default(field)
+                    invalid_paths.append(value)
+        return invalid_paths
+
     def load(self):
+        # пути проверяются только перед первым показом страницы, а не при запуске для всех страниц сразу
+        invalid_paths = self.ensure_settings_paths()
+        if invalid_paths:
+            print(f'Следующие пути не существуют и были заменены на дефолтные: {invalid_paths}')
         self.content = Builder.load_file(self.kv_path)
 
 
@@ -303,27 +339,6 @@ class PageList(DataModel):
     def titles(self) -> tuple[str, ...]:
         return tuple(page.title for page in self.all)
 
-    def ensure_settings_paths(self) -> list[Path]:
-        """
-        Проверяет существование указанных в настройках страниц путей.
-        Если путь не существует - меняет его на дефолтный
-        :return: список путей, замененных на дефолтные
-        """
-        invalid_paths: list[Path] = []
-        for page in self.all:
-            settings = page.settings
-            if settings is None:
-                continue
-            for field, value in settings.model_dump().items():
-                if isinstance(value, Path):
-                    if not value.exists():
-                        settings.set_default(field)
-                        invalid_paths.append(value)
-        return invalid_paths
-
-
-class FFmpegSettings(DataModel):
-    SUBTITLE_LANGUAGES_TO_EXTRACT: list[str]
 
 
 class Config(DataModel):
@@ -334,20 +349,17 @@ class Config(DataModel):
     titles: Titles
     pages: PageList
     ffmpeg: FFmpegSettings
+    log: LogSettings
+    store: YamlStore
 
 
 def get_config() -> Config:
     # Считываем настройки с конфиг-файла
     # Если файла нет - сначала создаем его и заполняем значениями по умолчанию
-    try:
-        with open(Defaults.base_dir / 'config.yaml', 'r', encoding='utf-8') as f:
-            yaml_config = yaml.safe_load(f)
-            if not yaml_config:
-                raise FileNotFoundError
-    except FileNotFoundError:
-        yaml_config = yaml_config_default
-        with open(Defaults.base_dir / 'config.yaml', 'w', encoding='utf-8') as f:
-            yaml.safe_dump(yaml_config, f, encoding='utf-8')
+    store = YamlStore(Defaults.base_dir / 'config.yaml', default=lambda: copy.deepcopy(get_yaml_config_default()))
+    # на случай завершения без MoviekitApp.on_stop - отложенные изменения не должны потеряться
+    atexit.register(store.flush)
+    yaml_config = store.data
 
     c = Config(
         BASE_DIR=Defaults.base_dir,
@@ -360,6 +372,8 @@ def get_config() -> Config:
             FILE_VIEWER_PADDING=dp(1),
             FILE_VIEWER_CHECKBOX_MARGIN_LEFT=dp(4),
             SCROLL_BAR_WIDTH=dp(10),
+            PROGRESS_REFRESH_RATE=4,
+            PAIRING_PREVIEW_LINES=10,
             colors=Colors(
                 WHITE_VEIL=Color(255, 255, 255, 0.3),
                 WHITE=Color(255, 255, 255, 1, color_name='white'),
@@ -377,6 +391,8 @@ def get_config() -> Config:
         ),
         pagination=Pagination(
             HIERARCHY_MAX_LENGTH=20,
+            PREWARM_PAGES=True,
+            PREWARM_DELAY=0.1,
         ),
         formats=Formats(
             VIDEO=Defaults.video_supported_formats,
@@ -388,7 +404,16 @@ def get_config() -> Config:
             OUTPUT_DIR='Output dir',
             INPUT_FORMATS='Input formats',
             OUTPUT_FORMAT='Output format',
+            ENCODER_PRESET='Preset',
             GO='Go !!!',
+            STOP='Stop',
+            RESUME_HEADLINE='Interrupted job',
+            RESUME='Resume',
+            DISCARD='Discard',
+            PAIRING_HEADLINE='Proposed pairs',
+            CANCEL='Cancel',
+            SYNC='Auto sync',
+            SYNC_UNAVAILABLE='Auto sync (needs numpy)',
         ),
         pages=PageList(
             all=(
@@ -401,33 +426,32 @@ def get_config() -> Config:
                     key='videoconversion',
                     title='Конвертация',
                     verbose='Конвертация видео',
-                    settings=VideoConversionPageSettings.from_yaml(yaml_config),
+                    settings=VideoConversionPageSettings.from_yaml(yaml_config, store=store),
                 ),
                 PageData(
                     key='subtitleextraction',
                     title='-Субтитры',
                     verbose='Извлечение субтитров',
-                    settings=SubtitleExtractionPageSettings.from_yaml(yaml_config),
+                    settings=SubtitleExtractionPageSettings.from_yaml(yaml_config, store=store),
                 ),
                 PageData(
                     key='subtitleadding',
                     title='+Субтитры',
                     verbose='Добавление субтитров',
-                    settings=SubtitleAddingPageSettings.from_yaml(yaml_config),
+                    settings=SubtitleAddingPageSettings.from_yaml(yaml_config, store=store),
+                ),
+                PageData(
+                    key='audiotrackadding',
+                    title='+Аудио',
+                    verbose='Добавление аудиодорожек',
+                    settings=AudiotrackAddingPageSettings.from_yaml(yaml_config, store=store),
                 ),
-                # PageData(
-                #     key='audiotrackadding',
-                #     title='+Аудио',
-                #     verbose='Добавление аудиодорожки',
-                # ),
             ),
         ),
-        ffmpeg=FFmpegSettings(
-            SUBTITLE_LANGUAGES_TO_EXTRACT=['eng', 'rus'],
-        )
+        ffmpeg=FFmpegSettings(),
+        log=LogSettings(),
+        store=store,
     )
-    invalid_paths = c.pages.ensure_settings_paths()
-    print(f'Следующие пути не существуют и были заменены на дефолтные: {invalid_paths}')
     return c
 
 
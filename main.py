@@ -1,31 +1,54 @@
-import time
+from src.utils.timing import Stopwatch
 
+# засекается до импорта Kivy, чтобы отчет о запуске учитывал и его
+startup = Stopwatch('Запуск MovieKit')
+
+import asynckivy
 from kivy.factory import Factory
 from kivy.clock import Clock
 from kivy.core.window import Window
 from kivymd.app import MDApp
 
+startup.mark('импорт Kivy')
+
+from config import config, Defaults
+
+startup.mark('загрузка конфигурации')
+
 from src.components.widgets import (
     Paginator,
     FlexibleDialog,
+    ResumeDialog,
+    ConfirmDialog,
     FlexibleLabel,
     FileItemWidget,
+    FileListView,
+    LogView,
     BlockContainer,
 )
 from src.components.pages import (
+    Page,
     MainPage,
     VideoConversionPage,
     SubtitleExtractionPage,
     SubtitleAddingPage,
     AudiotrackAddingPage,
 )
+from src.services.log import LogSpill
 from src.utils.common import is_desktop
 
+startup.mark('импорт компонентов')
+
 
 class MoviekitApp(MDApp):
     def build(self):
         self.title = 'MovieKit'
-        Clock.schedule_interval(self._update_clock, 1 / 60)
+        if config.log.SPILL_TO_FILE:
+            Page.log_spill = LogSpill(
+                Defaults.logs() / 'moviekit.log',
+                max_bytes=config.log.FILE_MAX_BYTES,
+                backup_count=config.log.FILE_BACKUP_COUNT,
+            )
         self.theme_cls.theme_style = 'Light'
         self.theme_cls.primary_palette = 'Darkslateblue'
         self.root.ids.paginator.go_page()
@@ -33,9 +56,28 @@ class MoviekitApp(MDApp):
             # почему? потому что я забил на адаптивность
             Window.maximize()
             Window.on_restore = Window.maximize
+        startup.mark('первая страница')
 
     def on_start(self):
-        pass
+        Clock.schedule_once(self._on_first_frame)
+
+    def _on_first_frame(self, dt):
+        startup.mark('первый кадр')
+        if config.pagination.PREWARM_PAGES:
+            asynckivy.start(self._prewarm())
+        else:
+            print(startup.report())
+
+    async def _prewarm(self):
+        # остальные страницы загружаются, когда первая уже на экране
+        await self.root.ids.paginator.prewarm(config.pagination.PREWARM_DELAY)
+        startup.mark('фоновая загрузка страниц')
+        print(startup.report())
+
+    def on_stop(self):
+        config.store.flush()
+        if Page.log_spill is not None:
+            Page.log_spill.close()
 
     def on_pause(self):
         return True
@@ -43,15 +85,16 @@ class MoviekitApp(MDApp):
     def on_resume(self):
         pass
 
-    def _update_clock(self, dt):
-        self.time = time.time()
-
 
 if __name__ == '__main__':
     Factory.register('Paginator', Paginator)
     Factory.register('FlexibleDialog', FlexibleDialog)
+    Factory.register('ResumeDialog', ResumeDialog)
+    Factory.register('ConfirmDialog', ConfirmDialog)
     Factory.register('FlexibleLabel', FlexibleLabel)
     Factory.register('FileItemWidget', FileItemWidget)
+    Factory.register('FileListView', FileListView)
+    Factory.register('LogView', LogView)
     Factory.register('BlockContainer', BlockContainer)
     Factory.register('MainPage', MainPage)
     Factory.register('VideoConversionPage', VideoConversionPage)
@@ -0,0 +1,138 @@
+import shutil
+from pathlib import Path
+
+from pydantic import BaseModel, ConfigDict
+
+# Настройки, не зависящие от GUI: модуль не должен импортировать Kivy,
+# чтобы сервисы можно было использовать из консоли (см. cli.py)
+
+
+class Defaults:
+    base_dir = Path(__file__).resolve().parent
+    video_supported_formats = ['ts', 'mkv', 'mp4', 'avi', 'webm']
+    audio_supported_formats = ['mp3', 'wav', 'mka', 'ac3', 'eac3', 'dts', 'aac', 'm4a', 'flac', 'opus']
+    subtitle_supported_formats = ['ass', 'srt']
+
+    @classmethod
+    def input(cls, subdir: str) -> str:
+        path = cls.base_dir / 'input' / subdir
+        path.mkdir(exist_ok=True, parents=True)
+        return str(path)
+
+    @classmethod
+    def output(cls) -> str:
+        path = cls.base_dir / 'output'
+        path.mkdir(exist_ok=True, parents=True)
+        return str(path)
+
+    @classmethod
+    def cache(cls) -> Path:
+        path = cls.base_dir / 'cache'
+        path.mkdir(exist_ok=True, parents=True)
+        return path
+
+    @classmethod
+    def logs(cls) -> Path:
+        path = cls.base_dir / 'logs'
+        path.mkdir(exist_ok=True, parents=True)
+        return path
+
+    @classmethod
+    def tool(cls, name: str) -> str:
+        """
+        Возвращает путь к исполняемому файлу из ``data/tools``.
+        Если его там нет - имя для поиска в ``PATH``
+        """
+        for candidate in (name, f'{name}.exe'):
+            path = cls.base_dir / 'data' / 'tools' / candidate
+            if path.is_file():
+                return str(path)
+
+        return shutil.which(name) or name
+
+
+class DataModel(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+
+class EncoderPreset(DataModel):
+    """
+    Параметры перекодирования потоков, которые нельзя скопировать в целевой контейнер.
+    Совместимые потоки копируются без перекодирования
+    """
+    VIDEO_ENCODER: str
+    # имя кодека в выводе ffprobe - по нему проверяется совместимость с контейнером
+    VIDEO_CODEC: str
+    CRF: int | None = None
+    VIDEO_BITRATE: str | None = None
+    # скорость кодирования (-preset), чем медленнее - тем меньше файл
+    SPEED: str | None = None
+    AUDIO_ENCODER: str = 'aac'
+    AUDIO_CODEC: str = 'aac'
+    AUDIO_BITRATE: str | None = '192k'
+    # дополнительные параметры видеокодера (добавляются, если видео перекодируется)
+    EXTRA_ARGS: list[str] = []
+
+
+# пресет, при котором все потоки только копируются (перепаковка)
+REMUX_PRESET = 'copy'
+
+
+class FFmpegSettings(DataModel):
+    SUBTITLE_LANGUAGES_TO_EXTRACT: list[str] = ['eng', 'rus']
+    # язык (ISO 639-2) добавляемых аудиодорожек
+    AUDIOTRACK_LANGUAGE: str = 'rus'
+    # сделать первую добавленную аудиодорожку дорожкой по умолчанию
+    AUDIOTRACK_MAKE_DEFAULT: bool = True
+    # число одновременно запущенных процессов ffmpeg:
+    # перепаковка (-c copy) упирается в диск, перекодирование - в процессор
+    MAX_CONCURRENT_REMUXES: int = 4
+    MAX_CONCURRENT_ENCODES: int = 1
+    # ffprobe читает только заголовки файлов, поэтому опрашивать файлы можно с большим параллелизмом
+    MAX_CONCURRENT_PROBES: int = 8
+    PROBE_CACHE_MAX_ENTRIES: int = 50_000
+    # ограничения времени работы одного процесса (в секундах), None - без ограничения.
+    # JOB_TIMEOUT_SECONDS действует на перепаковку и извлечение, перекодирование не ограничивается:
+    # его длительность зависит от файла и пресета, а не от сбоев
+    PROBE_TIMEOUT_SECONDS: float | None = 60
+    JOB_TIMEOUT_SECONDS: float | None = 6 * 60 * 60
+    # число повторных запусков после временных сбоев (ошибки ввода-вывода)
+    RETRY_ATTEMPTS: int = 2
+    RETRY_DELAY_SECONDS: float = 5
+    # кодирование долгого файла частями, параллельно на нескольких ядрах.
+    # Видео делится по ключевым кадрам на SEGMENT_COUNT частей (0 или 1 - не делить),
+    # части кодируются не более чем SEGMENT_WORKERS процессами одновременно и склеиваются без перекодирования
+    SEGMENT_COUNT: int = 0
+    SEGMENT_WORKERS: int = 4
+    SEGMENT_MIN_DURATION_SECONDS: float = 20 * 60
+    # автоподбор сдвига субтитров (нужен numpy): речь сравнивается с субтитрами на первых SYNC_ANALYZE_SECONDS
+    # секундах видео, сдвиг ищется в пределах SYNC_MAX_SHIFT_SECONDS в обе стороны с точностью 1 / SYNC_FRAME_RATE с.
+    # Сдвиги с уверенностью (коэффициентом корреляции) ниже SYNC_MIN_CONFIDENCE не предлагаются
+    SYNC_ANALYZE_SECONDS: float = 10 * 60
+    SYNC_MAX_SHIFT_SECONDS: float = 60
+    SYNC_FRAME_RATE: int = 100
+    SYNC_SAMPLE_RATE: int = 8000
+    SYNC_MIN_CONFIDENCE: float = 0.1
+    ENCODER_PRESETS: dict[str, EncoderPreset] = {
+        'h264': EncoderPreset(VIDEO_ENCODER='libx264', VIDEO_CODEC='h264', CRF=20, SPEED='medium'),
+        'h264-fast': EncoderPreset(VIDEO_ENCODER='libx264', VIDEO_CODEC='h264', CRF=23, SPEED='veryfast'),
+        'hevc': EncoderPreset(VIDEO_ENCODER='libx265', VIDEO_CODEC='hevc', CRF=24, SPEED='medium'),
+        'vp9': EncoderPreset(
+            VIDEO_ENCODER='libvpx-vp9', VIDEO_CODEC='vp9', CRF=32, VIDEO_BITRATE='0',
+            AUDIO_ENCODER='libopus', AUDIO_CODEC='opus', AUDIO_BITRATE='128k',
+            EXTRA_ARGS=['-row-mt', '1'],
+        ),
+        'av1': EncoderPreset(
+            VIDEO_ENCODER='libsvtav1', VIDEO_CODEC='av1', CRF=35, SPEED='8',
+            AUDIO_ENCODER='libopus', AUDIO_CODEC='opus', AUDIO_BITRATE='128k',
+        ),
+    }
+
+
+class LogSettings(DataModel):
+    # сколько последних записей журнала хранить в памяти и показывать на странице
+    MAX_ENTRIES: int = 2000
+    # дублировать ли журнал в файл (logs/moviekit.log) для долгих операций
+    SPILL_TO_FILE: bool = False
+    FILE_MAX_BYTES: int = 5 * 1024 * 1024
+    FILE_BACKUP_COUNT: int = 3
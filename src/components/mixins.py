@@ -10,12 +10,13 @@ from kivy.properties import (
 from kivymd.uix.widget import MDWidget
 from kivymd.uix.menu import MDDropdownMenu
 from kivymd.uix.chip import MDChip, MDChipText
-from kivymd.uix.divider import MDDivider
 
-from config import config, Defaults
-from .widgets import FileItemWidget
-from src.schemas import FileList
-from src.utils.string import maxlen, KivyLabelString as _
+from config import config, Defaults, REMUX_PRESET
+from settings import EncoderPreset
+from src.schemas import FileList, FileItem
+from src.services.loop import stream_from_thread
+from src.utils.filesystem import scan_dir_chunks
+from src.utils.string import KivyLabelString as _
 
 
 class BasePageMixin:
@@ -28,6 +29,24 @@ class BasePageMixin:
     on_kv_post: Callable[[MDWidget], None]
     input_area_columns: int
 
+    async def populate_input_files(self, prop: str, input_dir: str, formats: list[str]) -> None:
+        """
+        Заполняет список входных файлов: каталог обходится в фоновом потоке,
+        найденные файлы сразу дописываются в список порциями, а сортируются один раз - после обхода
+        :param prop: имя свойства со списком файлов, оно же - id его ``FileListView``
+        :param input_dir: каталог поиска
+        :param formats: форматы файлов
+        """
+        files = FileList(all=[])
+        setattr(self, prop, files)
+        view = self.ids[prop]
+        view.files = files
+        await stream_from_thread(
+            lambda: scan_dir_chunks(input_dir, formats=formats),
+            lambda chunk: view.extend([FileItem(abs_path=fpath) for fpath in chunk]),
+        )
+        view.sort()
+
 
 class OutputMixin(BasePageMixin):
     output_dir_text = StringProperty(config.titles.OUTPUT_DIR)
@@ -61,6 +80,7 @@ class VideoInputMixin(BasePageMixin):
     video_input_dir_chooser = ObjectProperty()
 
     video_input_files: FileList = ObjectProperty()
+    _video_input_files_task: asynckivy.Task | None = None
 
     video_input_formats_text = StringProperty(config.titles.INPUT_FORMATS)
     video_input_formats = ListProperty([])
@@ -74,17 +94,6 @@ class VideoInputMixin(BasePageMixin):
         self._video_input_dir_pre = self.video_input_dir
         asynckivy.start(self.populate_video_formats_selection())
 
-    @property
-    def video_input_files_widgets(self) -> list[FileItemWidget]:
-        return [w for w in self.ids.video_input_files.children if isinstance(w, FileItemWidget)][::-1]
-
-    def get_video_file_widget(self, filename: str) -> FileItemWidget:
-        for fw in self.video_input_files_widgets:
-            if fw.filename == filename:
-                return fw
-
-        raise ValueError(f'File {filename} not found')
-
     def set_video_input_formats(self, active: bool, fmt: str):
         if active:
             self.video_input_formats.append(fmt)
@@ -112,45 +121,27 @@ class VideoInputMixin(BasePageMixin):
             chip.bind(active=lambda x, y, z=fmt: self.set_video_input_formats(y, z))
             self.ids.video_formats_selection.add_widget(chip)
 
-    def video_file_set_active(self, name: str, fmt: str, active: bool):
-        self.video_input_files.get(name, fmt).active = active
-
-        self.video_input_files.resolve_indexes()
-        for f, fw in zip(
-            self.video_input_files.all,
-            self.video_input_files_widgets,
-        ):
-            fw.index_label.content.text = str(f.index) if f.index is not None else ''
-            # TODO: здесь же менять цвета
+    def video_file_set_active(self, file: FileItem, active: bool):
+        self.video_input_files.set_active(file, active)
+        self.ids.video_input_files.refresh()
 
     def video_file_selectors_check_all(self, check: bool):
-        async def check_all():
-            for fw in self.video_input_files_widgets:
-                await asynckivy.sleep(0)
-                fw.selector.content.active = check
+        if self.video_input_files is None:
+            return
+        self.video_input_files.select_all(check)
+        self.ids.video_input_files.refresh()
 
-        asynckivy.start(check_all())
+    def refresh_video_input_files(self):
+        if self._video_input_files_task is not None:
+            self._video_input_files_task.cancel()
+        self._video_input_files_task = asynckivy.start(self.populate_video_input_files())
 
     async def populate_video_input_files(self):
-        self.ids.video_input_files.clear_widgets()
-        self.video_input_files = FileList.from_path(self.video_input_dir, formats=self.video_input_formats)
-        index_label_num_symbols = maxlen(self.video_input_files.all, key=lambda x: x.index)
-        for idx, file in enumerate(self.video_input_files.all):
-            await asynckivy.sleep(0)
-            fw = FileItemWidget.from_file_item(
-                file,
-                index_label_num_symbols=index_label_num_symbols,
-                index_label_color=config.gui.colors.SUCCESS_LIGHT,
-                checkbox_callback=self.video_file_set_active,
-                input_area_columns=self.input_area_columns,
-            )
-            self.ids.video_input_files.add_widget(fw)
-            if idx < len(self.video_input_files.all) - 1:
-                self.ids.video_input_files.add_widget(MDDivider())
+        await self.populate_input_files('video_input_files', self.video_input_dir, self.video_input_formats)
 
     def on_video_input_dir(self, instance, value: str):
         self.video_input_dir_text = _(f'{config.titles.INPUT_DIR}: {value}').shorten().data
-        asynckivy.start(self.populate_video_input_files())
+        self.refresh_video_input_files()
         config.pages.get(self.name).settings.update('VIDEO_INPUT_DIR', value)
 
     def on_video_input_formats(self, instance, value: list[str]):
@@ -167,6 +158,7 @@ class SubtitleInputMixin(BasePageMixin):
     subtitle_input_dir_chooser = ObjectProperty()
 
     subtitle_input_files: FileList = ObjectProperty()
+    _subtitle_input_files_task: asynckivy.Task | None = None
 
     subtitle_input_formats_text = StringProperty(config.titles.INPUT_FORMATS)
     subtitle_input_formats = ListProperty([])
@@ -180,17 +172,6 @@ class SubtitleInputMixin(BasePageMixin):
         self._subtitle_input_dir_pre = self.subtitle_input_dir
         asynckivy.start(self.populate_subtitle_formats_selection())
 
-    @property
-    def subtitle_input_files_widgets(self) -> list[FileItemWidget]:
-        return [w for w in self.ids.subtitle_input_files.children if isinstance(w, FileItemWidget)][::-1]
-
-    def get_subtitle_file_widget(self, filename: str) -> FileItemWidget:
-        for fw in self.subtitle_input_files_widgets:
-            if fw.filename == filename:
-                return fw
-
-        raise ValueError(f'File {filename} not found')
-
     def set_subtitle_input_formats(self, active: bool, fmt: str):
         if active:
             self.subtitle_input_formats.append(fmt)
@@ -218,45 +199,27 @@ class SubtitleInputMixin(BasePageMixin):
             chip.bind(active=lambda x, y, z=fmt: self.set_subtitle_input_formats(y, z))
             self.ids.subtitle_formats_selection.add_widget(chip)
 
-    def subtitle_file_set_active(self, name: str, fmt: str, active: bool):
-        self.subtitle_input_files.get(name, fmt).active = active
-
-        self.subtitle_input_files.resolve_indexes()
-        for f, fw in zip(
-            self.subtitle_input_files.all,
-            self.subtitle_input_files_widgets,
-        ):
-            fw.index_label.content.text = str(f.index) if f.index is not None else ''
-            # TODO: здесь же менять цвета
+    def subtitle_file_set_active(self, file: FileItem, active: bool):
+        self.subtitle_input_files.set_active(file, active)
+        self.ids.subtitle_input_files.refresh()
 
     def subtitle_file_selectors_check_all(self, check: bool):
-        async def check_all():
-            for fw in self.subtitle_input_files_widgets:
-                await asynckivy.sleep(0)
-                fw.selector.content.active = check
+        if self.subtitle_input_files is None:
+            return
+        self.subtitle_input_files.select_all(check)
+        self.ids.subtitle_input_files.refresh()
 
-        asynckivy.start(check_all())
+    def refresh_subtitle_input_files(self):
+        if self._subtitle_input_files_task is not None:
+            self._subtitle_input_files_task.cancel()
+        self._subtitle_input_files_task = asynckivy.start(self.populate_subtitle_input_files())
 
     async def populate_subtitle_input_files(self):
-        self.ids.subtitle_input_files.clear_widgets()
-        self.subtitle_input_files = FileList.from_path(self.subtitle_input_dir, formats=self.subtitle_input_formats)
-        index_label_num_symbols = maxlen(self.subtitle_input_files.all, key=lambda x: x.index)
-        for idx, file in enumerate(self.subtitle_input_files.all):
-            await asynckivy.sleep(0)
-            fw = FileItemWidget.from_file_item(
-                file,
-                index_label_num_symbols=index_label_num_symbols,
-                index_label_color=config.gui.colors.SUCCESS_LIGHT,
-                checkbox_callback=self.subtitle_file_set_active,
-                input_area_columns=self.input_area_columns,
-            )
-            self.ids.subtitle_input_files.add_widget(fw)
-            if idx < len(self.subtitle_input_files.all) - 1:
-                self.ids.subtitle_input_files.add_widget(MDDivider())
+        await self.populate_input_files('subtitle_input_files', self.subtitle_input_dir, self.subtitle_input_formats)
 
     def on_subtitle_input_dir(self, instance, value: str):
         self.subtitle_input_dir_text = _(f'{config.titles.INPUT_DIR}: {value}').shorten().data
-        asynckivy.start(self.populate_subtitle_input_files())
+        self.refresh_subtitle_input_files()
         config.pages.get(self.name).settings.update('SUBTITLE_INPUT_DIR', value)
 
     def on_subtitle_input_formats(self, instance, value: list[str]):
@@ -264,6 +227,86 @@ class SubtitleInputMixin(BasePageMixin):
         config.pages.get(self.name).settings.update('SUBTITLE_INPUT_FORMATS', value)
 
 
+class AudiotrackInputMixin(BasePageMixin):
+    audiotrack_file_viewer_title = StringProperty('Аудиодорожки')
+
+    audiotrack_input_dir_text = StringProperty(config.titles.INPUT_DIR)
+    audiotrack_input_dir = StringProperty('')
+    _audiotrack_input_dir_pre = StringProperty('')
+    audiotrack_input_dir_chooser = ObjectProperty()
+
+    audiotrack_input_files: FileList = ObjectProperty()
+    _audiotrack_input_files_task: asynckivy.Task | None = None
+
+    audiotrack_input_formats_text = StringProperty(config.titles.INPUT_FORMATS)
+    audiotrack_input_formats = ListProperty([])
+    audiotrack_input_formats_chooser = ObjectProperty()
+
+    def on_kv_post(self, base_widget: MDWidget) -> None:
+        super().on_kv_post(base_widget)
+        page = config.pages.get(self.name)
+        self.audiotrack_input_formats = page.settings.AUDIOTRACK_INPUT_FORMATS
+        self.audiotrack_input_dir = str(page.settings.AUDIOTRACK_INPUT_DIR)
+        self._audiotrack_input_dir_pre = self.audiotrack_input_dir
+        asynckivy.start(self.populate_audiotrack_formats_selection())
+
+    def set_audiotrack_input_formats(self, active: bool, fmt: str):
+        if active:
+            self.audiotrack_input_formats.append(fmt)
+        else:
+            self.audiotrack_input_formats.remove(fmt)
+
+    def preset_audiotrack_input_dir(self, path: str):
+        self._audiotrack_input_dir_pre = path
+
+    def set_audiotrack_input_dir(self):
+        self.audiotrack_input_dir = self._audiotrack_input_dir_pre
+
+    async def populate_audiotrack_formats_selection(self):
+        for fmt in config.formats.AUDIOTRACK:
+            await asynckivy.sleep(0)
+            chip = MDChip(
+                MDChipText(text=f'.{fmt}'),
+                type='filter',
+                theme_bg_color='Custom',
+                md_bg_color=config.gui.colors.WHITE.rgba,
+                selected_color=config.gui.colors.SUCCESS_LIGHT.rgba,
+                active=fmt in self.audiotrack_input_formats,
+                pos_hint={'x': 0.5, 'y': 0.5},
+            )
+            chip.bind(active=lambda x, y, z=fmt: self.set_audiotrack_input_formats(y, z))
+            self.ids.audiotrack_formats_selection.add_widget(chip)
+
+    def audiotrack_file_set_active(self, file: FileItem, active: bool):
+        self.audiotrack_input_files.set_active(file, active)
+        self.ids.audiotrack_input_files.refresh()
+
+    def audiotrack_file_selectors_check_all(self, check: bool):
+        if self.audiotrack_input_files is None:
+            return
+        self.audiotrack_input_files.select_all(check)
+        self.ids.audiotrack_input_files.refresh()
+
+    def refresh_audiotrack_input_files(self):
+        if self._audiotrack_input_files_task is not None:
+            self._audiotrack_input_files_task.cancel()
+        self._audiotrack_input_files_task = asynckivy.start(self.populate_audiotrack_input_files())
+
+    async def populate_audiotrack_input_files(self):
+        await self.populate_input_files(
+            'audiotrack_input_files', self.audiotrack_input_dir, self.audiotrack_input_formats,
+        )
+
+    def on_audiotrack_input_dir(self, instance, value: str):
+        self.audiotrack_input_dir_text = _(f'{config.titles.INPUT_DIR}: {value}').shorten().data
+        self.refresh_audiotrack_input_files()
+        config.pages.get(self.name).settings.update('AUDIOTRACK_INPUT_DIR', value)
+
+    def on_audiotrack_input_formats(self, instance, value: list[str]):
+        self.audiotrack_input_formats_text = _(f'{config.titles.INPUT_FORMATS}: {', '.join(value)}').shorten().data
+        config.pages.get(self.name).settings.update('AUDIOTRACK_INPUT_FORMATS', value)
+
+
 class VideoOutputMixin(OutputMixin):
     video_output_format_text = StringProperty(config.titles.OUTPUT_FORMAT)
     video_output_format = StringProperty()
@@ -303,3 +346,45 @@ class VideoOutputMixin(OutputMixin):
     def set_video_output_format(self, fmt: str):
         self.video_output_format = fmt
         self.video_output_format_menu.dismiss()
+
+
+class EncoderPresetMixin(BasePageMixin):
+    encoder_preset_text = StringProperty(config.titles.ENCODER_PRESET)
+    encoder_preset = StringProperty(REMUX_PRESET)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.encoder_preset_menu: MDDropdownMenu | None = None
+
+    def on_kv_post(self, base_widget: MDWidget) -> None:
+        super().on_kv_post(base_widget)
+        page = config.pages.get(self.name)
+        self.encoder_preset = page.settings.VIDEO_CONVERSION_PRESET
+
+    def on_encoder_preset(self, instance, value: str):
+        self.encoder_preset_text = _(f'{config.titles.ENCODER_PRESET}: {value}').shorten().data
+        config.pages.get(self.name).settings.update('VIDEO_CONVERSION_PRESET', value)
+
+    def get_encoder_preset(self) -> EncoderPreset | None:
+        """ Возвращает выбранный пресет, ``None`` - только копирование потоков """
+        return config.ffmpeg.ENCODER_PRESETS.get(self.encoder_preset)
+
+    def encoder_preset_menu_open(self, item):
+        def onchange(preset: str):
+            def callback():
+                self.encoder_preset = preset
+                self.encoder_preset_menu.dismiss()
+
+            return callback
+
+        self.encoder_preset_menu = MDDropdownMenu(
+            caller=item,
+            items=[
+                {
+                    'text': preset,
+                    'on_release': onchange(preset),
+                } for preset in (REMUX_PRESET, *config.ffmpeg.ENCODER_PRESETS)
+            ],
+        )
+        self.encoder_preset_menu.open()
+
@@ -1,4 +1,5 @@
 import asynckivy
+from kivy.clock import Clock
 from kivy.properties import (
     BooleanProperty,
     NumericProperty,
@@ -6,13 +7,29 @@ from kivy.properties import (
 from kivymd.uix.screen import MDScreen
 
 from src.utils.string import KivyLabelString as _
-from src.schemas import FileList, FileItem, FFprobeFileData
+from src.schemas import (
+    FileList,
+    FileItem,
+    FFprobeFileData,
+    FileProgress,
+    BatchProgress,
+    LogEntry,
+    LogStatus,
+    JournalBatch,
+)
 from src.services.ffmpeg import FFmpeg
+from src.services.jobs import Job
+from src.services.log import LogBuffer, LogSpill
+from src.services.pairing import pair_tracks, describe_pairs
+from src.services.sync import sync_available
+from .widgets import ResumeDialog, ConfirmDialog
 from .mixins import (
     VideoInputMixin,
     SubtitleInputMixin,
+    AudiotrackInputMixin,
     VideoOutputMixin,
     OutputMixin,
+    EncoderPresetMixin,
 )
 from config import config
 
@@ -21,6 +38,19 @@ class Page(MDScreen):
     fullscreen = BooleanProperty(False)
     input_area_columns: int = 0
     suspend = asynckivy.sleep(0)
+    job: Job | None = None
+    # общий для всех страниц файл журнала, создается приложением, если включен в настройках
+    log_spill: LogSpill | None = None
+    # метод FFmpeg, прерванные операции которого страница предлагает продолжить
+    journal_operation: str | None = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.__resume_offered = False
+        self.log_buffer = LogBuffer(config.log.MAX_ENTRIES, spill=self.log_spill)
+        # прогресс перерисовывается не чаще PROGRESS_REFRESH_RATE раз в секунду и только пока он поступает
+        self.__progress: BatchProgress | None = None
+        self.__progress_trigger = Clock.create_trigger(self.__show_progress, 1 / config.gui.PROGRESS_REFRESH_RATE)
 
     def add_widget(self, widget, *args, **kwargs):
         if 'content' in self.ids:
@@ -29,112 +59,212 @@ class Page(MDScreen):
             return self.ids.content.add_widget(widget, *args, **kwargs)
         return super().add_widget(widget, *args, **kwargs)
 
+    def start_job(self) -> Job:
+        """ Создает дескриптор новой операции. Кнопка отмены будет относиться к ней """
+        self.job = Job()
+        return self.job
+
+    def cancel_job(self) -> None:
+        """ Отменяет текущую операцию страницы """
+        if self.job is not None:
+            self.job.cancel()
+
+    def on_enter(self, *args):
+        super().on_enter(*args)
+        if self.journal_operation is not None and not self.__resume_offered:
+            self.__resume_offered = True
+            self.offer_resume()
+
+    def offer_resume(self) -> None:
+        """ Предлагает продолжить последнюю прерванную операцию страницы, остальные только упоминаются в журнале """
+        journal = FFmpeg.job_journal()
+        batches = journal.interrupted(self.journal_operation)
+        if not batches:
+            return
+        for batch in batches:
+            self.write_log(LogStatus.INFO, f'Прервана операция {batch.describe()}')
+        batch = batches[-1]
+        dialog = ResumeDialog(text=batch.describe())
+        dialog.bind(
+            on_resume=lambda *args: self.resume_job(batch),
+            on_discard=lambda *args: journal.discard(batch.id),
+        )
+        dialog.open()
+
+    def resume_job(self, batch: JournalBatch) -> None:
+        ffmpeg = FFmpeg(output=str(batch.output), settings=config.ffmpeg)
+        asynckivy.start(ffmpeg.resume(
+            batch,
+            on_success=self.log_success,
+            on_error=self.log_error,
+            on_progress=self.log_progress,
+            job=self.start_job(),
+        ))
+
     def get_input_files_info(self, input_files: FileList) -> None:
-        ffmpeg = FFmpeg()
+        ffmpeg = FFmpeg(settings=config.ffmpeg)
         asynckivy.start(ffmpeg.info(
             input_files.active,
             on_success=self.log_input_files_info,
             on_error=self.logerr_input_files_info,
+            job=self.start_job(),
         ))
 
+    def write_log(self, status: LogStatus, message: str, f: FileItem | None = None) -> None:
+        """ Добавляет запись в журнал страницы. Самые старые записи вытесняются """
+        entry = LogEntry(status=status, message=message, file=f, source=self.name)
+        if self.log_buffer.append(entry) is not None:
+            self.ids.log.pop_oldest()
+        self.ids.log.push(self.render_log_entry(entry))
+
+    @staticmethod
+    def render_log_entry(entry: LogEntry) -> list[str]:
+        """ Возвращает строки журнала с разметкой Kivy для отображения записи """
+        title = ''
+        if entry.file is not None:
+            title = f'{entry.file.index:02}. ' if entry.file.index is not None else ''
+            title += str(_(entry.file.fullname, is_filename=True).bold().color(config.gui.colors.BLACK.hex))
+        if '\n' in entry.message:
+            return [title, *entry.message.split('\n'), '']
+
+        match entry.status:
+            case LogStatus.SUCCESS:
+                message = _(entry.message).color(config.gui.colors.SUCCESS.hex).bold()
+            case LogStatus.ERROR:
+                message = _(entry.message).color(config.gui.colors.DANGER.hex).bold()
+            case _:
+                message = _(entry.message)
+        return [f'{title} {message}' if title else str(message)]
+
+    async def log_success(self, f: FileItem, result: str) -> None:
+        self.write_log(LogStatus.SUCCESS, result, f)
+
+    async def log_error(self, f: FileItem, result: str) -> None:
+        self.write_log(LogStatus.ERROR, result, f)
+
     async def log_input_files_info(self, f: FileItem, output: FFprobeFileData) -> None:
-        await asynckivy.sleep(0)
-        self.ids.log.text += (f'{f.index:02}. '
-                              f'{_(f.fullname, is_filename=True).bold().color(config.gui.colors.BLACK.hex)}\n')
-        self.ids.log.text += output.describe_as_text()
-        self.ids.log.text += '\n\n'
+        self.write_log(LogStatus.INFO, output.describe_as_text(), f)
 
     async def logerr_input_files_info(self, f: FileItem, output: FFprobeFileData) -> None:
-        await asynckivy.sleep(0)
-        self.ids.log.text += (f'{f.index:02}. '
-                              f'{_(f.fullname, is_filename=True).bold().color(config.gui.colors.DANGER.hex)}\n'
-                              f'Ошибка\n\n')
-        print(output)
+        self.write_log(LogStatus.ERROR, 'Ошибка чтения метаданных', f)
+
+    async def log_progress(self, f: FileItem, progress: FileProgress, batch: BatchProgress) -> None:
+        """ Показывает прогресс всей операции и обрабатываемых в данный момент файлов """
+        self.__progress = batch
+        self.__progress_trigger()
+
+    def __show_progress(self, dt) -> None:
+        batch = self.__progress
+        if batch is None:
+            return
+        lines = [_(batch.describe()).bold().data]
+        for p in batch.active:
+            lines.append(f'{p.file.index:02}. '
+                         f'{_(p.file.fullname, is_filename=True).shorten(40).bold()} '
+                         f'{p.describe()}')
+        self.ids.progress.text = '\n'.join(lines)
+        self.ids.progress_bar.value = batch.percent
 
 
 class MainPage(Page):
     pass
 
 
-class VideoConversionPage(VideoInputMixin, VideoOutputMixin, Page):
+class VideoConversionPage(VideoInputMixin, VideoOutputMixin, EncoderPresetMixin, Page):
     input_area_columns: int = 1
+    journal_operation: str | None = 'convert_video'
 
     def do_convert(self) -> None:
-        ffmpeg = FFmpeg(output=self.output_dir)
+        ffmpeg = FFmpeg(output=self.output_dir, settings=config.ffmpeg)
         asynckivy.start(ffmpeg.convert_video(
             self.video_input_files.active,
             output_format=self.video_output_format,
-            on_success=self.log_convert,
-            on_error=self.logerr_convert,
+            preset=self.get_encoder_preset(),
+            on_success=self.log_success,
+            on_error=self.log_error,
+            on_progress=self.log_progress,
+            job=self.start_job(),
         ))
 
-    async def log_convert(self, f: FileItem, result: str) -> None:
-        await asynckivy.sleep(0)
-        self.ids.log.text += (f'{f.index:02}. '
-                              f'{_(f.fullname, is_filename=True).bold().color(config.gui.colors.BLACK.hex)} '
-                              f'{_(result).color(config.gui.colors.SUCCESS.hex).bold()}\n')
-
-    async def logerr_convert(self, f: FileItem, result: str) -> None:
-        await asynckivy.sleep(0)
-        self.ids.log.text += (f'{f.index:02}. '
-                              f'{_(f.fullname, is_filename=True).bold().color(config.gui.colors.BLACK.hex)} '
-                              f'{_(result).color(config.gui.colors.DANGER.hex).bold()}\n')
-
 
 class SubtitleExtractionPage(VideoInputMixin, OutputMixin, Page):
     input_area_columns: int = 1
+    journal_operation: str | None = 'extract_subtitles'
 
     def do_extract(self) -> None:
-        ffmpeg = FFmpeg(output=self.output_dir)
+        ffmpeg = FFmpeg(output=self.output_dir, settings=config.ffmpeg)
         asynckivy.start(ffmpeg.extract_subtitles(
             self.video_input_files.active,
-            on_success=self.log_extract,
-            on_error=self.logerr_extract,
+            on_success=self.log_success,
+            on_error=self.log_error,
+            on_progress=self.log_progress,
+            job=self.start_job(),
         ))
 
-    async def log_extract(self, f: FileItem, result: str) -> None:
-        await asynckivy.sleep(0)
-        self.ids.log.text += (f'{f.index:02}. '
-                              f'{_(f.fullname, is_filename=True).bold().color(config.gui.colors.BLACK.hex)} '
-                              f'{_(result).color(config.gui.colors.SUCCESS.hex).bold()}\n')
-
-    async def logerr_extract(self, f: FileItem, result: str) -> None:
-        await asynckivy.sleep(0)
-        self.ids.log.text += (f'{f.index:02}. '
-                              f'{_(f.fullname, is_filename=True).bold().color(config.gui.colors.BLACK.hex)} '
-                              f'{_(result).color(config.gui.colors.DANGER.hex).bold()}\n')
-
 
 class SubtitleAddingPage(VideoInputMixin, SubtitleInputMixin, OutputMixin, Page):
     input_area_columns: int = 2
+    journal_operation: str | None = 'add_subtitles'
     subtitle_shift_seconds: float = NumericProperty(0)
+    # автоподбор сдвига требует numpy
+    sync_available: bool = BooleanProperty(sync_available())
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # подобранные сдвиги файлов субтитров (ключ - str(abs_path)), остальные сдвигаются на subtitle_shift_seconds
+        self.subtitle_shifts: dict[str, float] = {}
+
+    def do_sync(self) -> None:
+        """ Подбирает сдвиг каждого файла субтитров по звуку видео, результаты применяются при добавлении """
+        asynckivy.start(self.__sync(self.video_input_files.active, self.subtitle_input_files.active))
+
+    async def __sync(self, videos: list[FileItem], subtitles: list[FileItem]) -> None:
+        ffmpeg = FFmpeg(settings=config.ffmpeg)
+        estimates = await ffmpeg.estimate_subtitle_shifts(
+            videos,
+            subtitles,
+            on_success=self.log_success,
+            on_error=self.log_error,
+            job=self.start_job(),
+        )
+        self.subtitle_shifts = {path: estimate.shift for path, estimate in estimates.items()}
+        self.write_log(LogStatus.INFO, f'Сдвиг подобран для {len(estimates)} из {len(subtitles)} файлов субтитров')
 
     def do_add(self) -> None:
-        ffmpeg = FFmpeg(output=self.output_dir)
+        """ Показывает предлагаемые пары видео - субтитры и запускает добавление после подтверждения """
+        videos = self.video_input_files.active
+        subtitles = self.subtitle_input_files.active
+        lines = describe_pairs(pair_tracks(videos, subtitles), subtitles)
+        lines += [
+            f'Сдвиг {subtitle.fullname}: {self.subtitle_shifts[str(subtitle.abs_path)]:+.2f} с'
+            for subtitle in subtitles if str(subtitle.abs_path) in self.subtitle_shifts
+        ]
+        for line in lines:
+            self.write_log(LogStatus.INFO, line)
+        preview = lines[:config.gui.PAIRING_PREVIEW_LINES]
+        if len(lines) > len(preview):
+            preview.append(f'... и еще {len(lines) - len(preview)} (см. журнал)')
+        dialog = ConfirmDialog(headline=config.titles.PAIRING_HEADLINE, text='\n'.join(preview))
+        dialog.bind(on_confirm=lambda *args: self.add_subtitles(videos, subtitles))
+        dialog.open()
+
+    def add_subtitles(self, videos: list[FileItem], subtitles: list[FileItem]) -> None:
+        ffmpeg = FFmpeg(output=self.output_dir, settings=config.ffmpeg)
         try:
             shift = float(self.subtitle_shift_seconds)
         except ValueError:
             shift = 0
         asynckivy.start(ffmpeg.add_subtitles(
-            videos=self.video_input_files.active,
-            subtitles=self.subtitle_input_files.active,
+            videos=videos,
+            subtitles=subtitles,
             subtitle_shift=shift,
-            on_success=self.log_add_subtitles,
-            on_error=self.logerr_add_subtitles,
+            subtitle_shifts=self.subtitle_shifts,
+            on_success=self.log_success,
+            on_error=self.log_error,
+            on_progress=self.log_progress,
+            job=self.start_job(),
         ))
 
-    async def log_add_subtitles(self, f: FileItem, result: str) -> None:
-        await asynckivy.sleep(0)
-        self.ids.log.text += (f'{f.index:02}. '
-                              f'{_(f.fullname, is_filename=True).bold().color(config.gui.colors.BLACK.hex)} '
-                              f'{_(result).color(config.gui.colors.SUCCESS.hex).bold()}\n')
-
-    async def logerr_add_subtitles(self, f: FileItem, result: str) -> None:
-        await asynckivy.sleep(0)
-        self.ids.log.text += (f'{f.index:02}. '
-                              f'{_(f.fullname, is_filename=True).bold().color(config.gui.colors.BLACK.hex)} '
-                              f'{_(result).color(config.gui.colors.DANGER.hex).bold()}\n')
-
     def on_subtitle_shift_seconds(self, instance, value: str) -> None:
         try:
             self.subtitle_shift_seconds = float(value)
@@ -145,5 +275,32 @@ class SubtitleAddingPage(VideoInputMixin, SubtitleInputMixin, OutputMixin, Page)
             self.ids.subtitle_shift_note.text = 'Будет интерпретировано как 0'
 
 
-class AudiotrackAddingPage(Page):
+class AudiotrackAddingPage(VideoInputMixin, AudiotrackInputMixin, OutputMixin, Page):
     input_area_columns: int = 2
+    journal_operation: str | None = 'add_audiotracks'
+    audiotrack_shift_seconds: float = NumericProperty(0)
+
+    def do_add(self) -> None:
+        ffmpeg = FFmpeg(output=self.output_dir, settings=config.ffmpeg)
+        try:
+            shift = float(self.audiotrack_shift_seconds)
+        except ValueError:
+            shift = 0
+        asynckivy.start(ffmpeg.add_audiotracks(
+            videos=self.video_input_files.active,
+            audiotracks=self.audiotrack_input_files.active,
+            audiotrack_shift=shift,
+            on_success=self.log_success,
+            on_error=self.log_error,
+            on_progress=self.log_progress,
+            job=self.start_job(),
+        ))
+
+    def on_audiotrack_shift_seconds(self, instance, value: str) -> None:
+        try:
+            self.audiotrack_shift_seconds = float(value)
+            self.ids.audiotrack_shift.error = False
+            self.ids.audiotrack_shift_note.text = 'Сдвинуть аудиодорожки'
+        except ValueError:
+            self.ids.audiotrack_shift.error = True
+            self.ids.audiotrack_shift_note.text = 'Будет интерпретировано как 0'
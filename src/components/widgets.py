@@ -1,21 +1,29 @@
 from typing import Literal, Callable
 
+from collections import deque
+
+import asynckivy
+from kivy.clock import Clock
 from kivy.properties import (
     StringProperty,
     ListProperty,
+    ObjectProperty,
+    BooleanProperty,
+    NumericProperty,
 )
 from kivy.uix.filechooser import FileChooserIconView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivymd.uix.widget import MDWidget
 from kivymd.uix.screenmanager import MDScreenManager
 from kivymd.uix.menu import MDDropdownMenu
 from kivymd.uix.dialog import MDDialog
 from kivymd.uix.relativelayout import MDRelativeLayout
-from kivymd.uix.selectioncontrol import MDCheckbox
 from kivymd.uix.label import MDLabel
 from kivymd.uix.boxlayout import MDBoxLayout
 
-from config import config, PageData, Color
-from src.schemas import FileItem
+from config import config, PageData
+from src.schemas import FileItem, FileList
 from src.utils.string import KivyLabelString as _
 
 
@@ -54,6 +62,17 @@ class Paginator(MDWidget):
         sm.switch_to(page.content, direction=direction)
         self.current_page_name = page.verbose
 
+    async def prewarm(self, delay: float = 0) -> None:
+        """
+        Заранее загружает еще не показанные страницы, по одной за кадр,
+        чтобы первый переход на них не задерживался компиляцией .kv
+        :param delay: пауза перед загрузкой каждой страницы (в секундах)
+        """
+        for page in self.pages.all:
+            await asynckivy.sleep(delay)
+            if page.content is None:
+                page.load()
+
     def go_hierarchy_previous(self) -> None:
         """ Переключает страницу на предыдущую """
         if len(self.hierarchy) == 1:
@@ -105,6 +124,28 @@ class FlexibleDialog(MDDialog):
         return
 
 
+class ResumeDialog(FlexibleDialog):
+    """ Предлагает продолжить операцию, прерванную в предыдущем запуске приложения """
+    text = StringProperty('')
+    __events__ = ('on_resume', 'on_discard')
+
+    def on_resume(self) -> None:
+        pass
+
+    def on_discard(self) -> None:
+        pass
+
+
+class ConfirmDialog(FlexibleDialog):
+    """ Показывает, что будет сделано, и запускает операцию только после подтверждения """
+    headline = StringProperty('')
+    text = StringProperty('')
+    __events__ = ('on_confirm',)
+
+    def on_confirm(self) -> None:
+        pass
+
+
 class FlexibleLabel(MDLabel):
     pass
 
@@ -114,70 +155,118 @@ class BlockContainer(MDRelativeLayout):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.content: MDWidget = args[0]
+        self.content: MDWidget | None = args[0] if args else None
+
 
+class FileItemWidget(RecycleDataViewBehavior, MDBoxLayout):
+    """
+    Строка списка файлов. Экземпляры создаются ``FileListView`` только для видимых строк
+    и переиспользуются при прокрутке, поэтому все состояние берется из ``FileItem``
+    """
+    file: FileItem | None = ObjectProperty(None, allownone=True)
+    active: bool = BooleanProperty(True)
+    index_text: str = StringProperty(' ')
+    title: str = StringProperty('')
+    input_area_columns: int = NumericProperty(1)
 
-class FileItemWidget(MDBoxLayout):
-    """ Виджет файла в списке """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.view: 'FileListView | None' = None
 
-    def __init__(self, *args, filename: str, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.selector: BlockContainer = args[0]
-        self.index_label: BlockContainer = args[1]
-        self.title_label: BlockContainer = args[2]
-        self.filename = filename
-
-    @classmethod
-    def from_file_item(
-        cls,
-        file: FileItem,
-        index_label_num_symbols: int,
-        index_label_color: Color,
-        checkbox_callback: Callable[[str, str, bool], None],
-        input_area_columns: int = 1,
-    ) -> 'FileItemWidget':
-        """
-        Создает виджет для файла
-        :param file: данные файла
-        :param index_label_num_symbols:
-        :param index_label_color: цвет контейнера индекса файла
-        :param checkbox_callback: выполнится при переключении чекбокса выбора
-        :param input_area_columns: число столбцов, в которые организованы списки файлов на странице
-        :return: экземпляр виджета
-        """
-        selector = BlockContainer(
-            MDCheckbox(
-                active=file.active,
-                pos_hint={'center_y': 0.5},
-            ),
-            size_hint_x=0.02 * input_area_columns,
-        )
-        selector.content.bind(active=lambda _, check: checkbox_callback(file.name, file.fmt, check))
-
-        index = BlockContainer(
-            FlexibleLabel(
-                text=str(file.index) if file.index else ' ',
-                pos_hint={'center_y': 0.5, 'center_x': 0.5},
-            ),
-            size_hint_x=0.02 * input_area_columns,
-            md_bg_color=index_label_color.rgba,
-        )
+    @property
+    def filename(self) -> str:
+        return self.file.fullname if self.file is not None else ''
 
-        title = BlockContainer(
-            FlexibleLabel(
-                text=_(file.abs_path.name, escape=False, is_filename=True).shorten().data,
-                pos_hint={'center_y': 0.5, 'x': 0.02},
-            ),
-            size_hint_x=1 - 0.02 * 2 * input_area_columns,
-        )
+    def refresh_view_attrs(self, rv: 'FileListView', index: int, data: dict) -> None:
+        self.view = rv
+        file: FileItem = data['file']
+        self.active = file.active
+        self.index_text = str(file.index) if file.index else ' '
+        self.title = _(file.abs_path.name, escape=False, is_filename=True).shorten().data
+        self.input_area_columns = rv.input_area_columns
+        super().refresh_view_attrs(rv, index, data)
+
+    def toggle(self, active: bool) -> None:
+        """ Вызывается при переключении чекбокса пользователем """
+        self.active = active
+        if self.view is not None and self.file is not None:
+            self.view.dispatch('on_toggle', self.file, active)
+
+
+class FileListView(RecycleView):
+    """
+    Виртуализированный список файлов: виджеты создаются только для видимых строк,
+    а данными служит ``FileList``. Состояние выбора и индексы хранятся в модели
+    """
+    files: FileList | None = ObjectProperty(None, allownone=True)
+    input_area_columns: int = NumericProperty(1)
+
+    def __init__(self, **kwargs):
+        self.register_event_type('on_toggle')
+        super().__init__(**kwargs)
+
+    def on_files(self, instance, value: FileList | None) -> None:
+        self.data = [{'file': file} for file in value.all] if value is not None else []
+
+    def refresh(self) -> None:
+        """ Перерисовывает видимые строки после изменения модели """
+        self.refresh_from_data()
+
+    def extend(self, files: list[FileItem]) -> None:
+        """ Дописывает файлы в модель и в конец списка, не пересоздавая уже показанные строки """
+        self.files.extend(files)
+        self.data.extend({'file': file} for file in files)
+
+    def sort(self) -> None:
+        """ Сортирует модель и показывает строки в новом порядке """
+        self.files.sort()
+        self.data = [{'file': file} for file in self.files.all]
+
+    def on_toggle(self, file: FileItem, active: bool) -> None:
+        """ Событие переключения выбора файла пользователем """
+        pass
+
+
+class LogView(RecycleView):
+    """
+    Виртуализированный журнал: строки хранятся как данные, а виджеты создаются только для видимых.
+    Изменения накапливаются и применяются не чаще раза в кадр
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.__line_counts: deque[int] = deque()
+        self.__pending: list[str] = []
+        self.__drop = 0
+        self.__flush_trigger = Clock.create_trigger(self.__flush)
+
+    def push(self, lines: list[str]) -> None:
+        """ Добавляет в конец журнала группу строк (одну запись) """
+        self.__line_counts.append(len(lines))
+        self.__pending.extend(lines)
+        self.__flush_trigger()
+
+    def pop_oldest(self) -> None:
+        """ Удаляет из начала журнала самую старую группу строк """
+        if self.__line_counts:
+            self.__drop += self.__line_counts.popleft()
+            self.__flush_trigger()
+
+    def clear(self) -> None:
+        self.__line_counts.clear()
+        self.__pending.clear()
+        self.__drop = 0
+        self.data = []
+
+    def __flush(self, dt) -> None:
+        # прокручиваем к новым строкам, только если журнал и так был прокручен до конца
+        layout = self.children[0] if self.children else None
+        follow = layout is None or layout.height <= self.height or self.scroll_y <= 0.01
+        dropped_from_data = min(self.__drop, len(self.data))
+        dropped_from_pending = self.__drop - dropped_from_data
+        self.data = self.data[dropped_from_data:] + [{'text': line} for line in self.__pending[dropped_from_pending:]]
+        self.__pending.clear()
+        self.__drop = 0
+        if follow:
+            self.scroll_y = 0
 
-        instance = cls(
-            selector,
-            index,
-            title,
-            filename=f'{file.name}.{file.fmt}',
-            padding=config.gui.FILE_VIEWER_CHECKBOX_MARGIN_LEFT,
-            size_hint_y=None,
-            height=40,
-        )
-        return instance
@@ -1,2 +1,5 @@
 from .file import FileList, FileItem
-from .ffmpeg import FFprobeFileData, StreamType
+from .ffmpeg import FFprobeFileData, FFprobeFullData, StreamType, FFPROBE_BRIEF_ENTRIES
+from .progress import FileProgress, BatchProgress
+from .log import LogEntry, LogStatus
+from .journal import JobStatus, JournalEntry, JournalBatch
@@ -1,7 +1,7 @@
 from enum import Enum
 from typing import NamedTuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from src.utils.filesystem import format_file_size, format_duration
 from src.utils.string import KivyLabelString as _
@@ -38,12 +38,17 @@ class FFprobeFileStreamTags(BaseModel):
         return lang
 
 
-class FFprobeFileStream(BaseModel):
+class FFprobeStreamBrief(BaseModel):
+    """ Поля потока, которые запрашиваются у ``ffprobe`` по умолчанию (см. ``FFPROBE_BRIEF_ENTRIES``) """
     index: int
     codec_name: str = 'UNKNOWN'
+    codec_type: str
+    tags: FFprobeFileStreamTags = FFprobeFileStreamTags()
+
+
+class FFprobeFileStream(FFprobeStreamBrief):
     codec_long_name: str | None = None
     profile: str | None = None
-    codec_type: str
     codec_tag_string: str | None = None
     codec_tag: str | None = None
     width: int | None = None
@@ -66,7 +71,6 @@ class FFprobeFileStream(BaseModel):
     start_pts: int | None = None
     start_time: str | None = None
     extradata_size: int | None = None
-    tags: FFprobeFileStreamTags = FFprobeFileStreamTags()
 
 
 class FFprobeFileFormatTags(BaseModel):
@@ -74,29 +78,51 @@ class FFprobeFileFormatTags(BaseModel):
     creation_time: str | None = None
 
 
-class FFprobeFileFormat(BaseModel):
+class FFprobeFormatBrief(BaseModel):
+    """ Поля контейнера, которые запрашиваются у ``ffprobe`` по умолчанию (см. ``FFPROBE_BRIEF_ENTRIES``) """
+    format_long_name: str | None = None
+    duration: str | None = None
+    size: str | None = None
+
+
+class FFprobeFileFormat(FFprobeFormatBrief):
     filename: str | None = None
     nb_streams: int | None = None
     nb_programs: int | None = None
     nb_stream_groups: int | None = None
     format_name: str | None = None
-    format_long_name: str | None = None
     start_time: str | None = None
-    duration: str | None = None
-    size: str | None = None
     bit_rate: str | None = None
     probe_score: int | None = None
     tags: FFprobeFileFormatTags = FFprobeFileFormatTags()
 
 
-class FFprobeFileData(BaseModel):
-    """ Содержит данные о файле, получаемые от ``ffprobe``, и методы для их обработки """
-    streams: list[FFprobeFileStream] = []
-    format: FFprobeFileFormat = FFprobeFileFormat()
+# поля, которых достаточно для описания файла и планирования операций ffmpeg (аргумент ffprobe -show_entries)
+FFPROBE_BRIEF_ENTRIES = (
+    'format=format_long_name,duration,size'
+    ':stream=index,codec_name,codec_type'
+    ':stream_tags=language,title'
+)
+
 
-    def get_streams_of_type(self, stream_type: StreamType) -> list[FFprobeFileStream]:
-        """ Возвращает данные о потоках заданного типа """
-        return [s for s in self.streams if s.codec_type == stream_type]
+class FFprobeFileData(BaseModel):
+    """
+    Содержит данные о файле, получаемые от ``ffprobe``, и методы для их обработки.
+    Хранит только поля из ``FFPROBE_BRIEF_ENTRIES``, полный вывод - ``FFprobeFullData``.
+    Создается напрямую из вывода ffprobe: ``FFprobeFileData.model_validate_json(stdout)``
+    """
+    streams: list[FFprobeStreamBrief] = []
+    format: FFprobeFormatBrief = FFprobeFormatBrief()
+    # потоки, сгруппированные по типу: строятся один раз при создании модели
+    _streams_by_type: dict[str, list[FFprobeStreamBrief]] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context) -> None:
+        for s in self.streams:
+            self._streams_by_type.setdefault(s.codec_type, []).append(s)
+
+    def get_streams_of_type(self, stream_type: StreamType) -> list[FFprobeStreamBrief]:
+        """ Возвращает данные о потоках заданного типа (общий для всех вызовов список - не изменять) """
+        return self._streams_by_type.get(stream_type, [])
 
     def describe_stream(self, stream_type: StreamType) -> str:
         """ Возвращает перечисление через запятую информации о потоках заданного типа """
@@ -139,8 +165,14 @@ class FFprobeFileData(BaseModel):
         Возвращает индекс последнего потока заданного типа
         либо ``-1``, если таких потоков нет
         """
-        last_stream = max(self.get_streams_of_type(stream_type), key=lambda x: x.index)
-        if not last_stream:
+        streams = self.get_streams_of_type(stream_type)
+        if not streams:
             return -1
 
-        return last_stream.index
+        return max(s.index for s in streams)
+
+
+class FFprobeFullData(FFprobeFileData):
+    """ Полный вывод ``ffprobe -show_format -show_streams`` """
+    streams: list[FFprobeFileStream] = []
+    format: FFprobeFileFormat = FFprobeFileFormat()
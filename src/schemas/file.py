@@ -1,5 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Iterable
+
+from src.utils.filesystem import scan_dir
 
 
 @dataclass
@@ -23,28 +26,80 @@ class FileItem:
 
 @dataclass
 class FileList:
-    """ Методы работы со списком файлов """
+    """
+    Методы работы со списком файлов.
+    Поддерживает словарь ``(имя, формат) -> файл`` и позиции файлов в списке,
+    поэтому поиск файла и смена его выбора не требуют обхода всего списка
+    """
     all: list[FileItem]
+    _by_key: dict[tuple[str, str], FileItem] = field(default_factory=dict, init=False, repr=False)
+    _positions: dict[int, int] = field(default_factory=dict, init=False, repr=False)
+    _active_count: int = field(default=0, init=False, repr=False)
 
     def __post_init__(self):
+        self.__rebuild()
+
+    def __rebuild(self) -> None:
+        self._by_key.clear()
+        self._positions.clear()
+        for pos, fi in enumerate(self.all):
+            self.__register(fi, pos)
         self.resolve_indexes()
 
-    def resolve_indexes(self):
+    def __register(self, fi: FileItem, pos: int) -> None:
+        # при совпадении имен (например, при рекурсивном поиске) находится первый из файлов
+        self._by_key.setdefault((fi.name, fi.fmt), fi)
+        self._positions[id(fi)] = pos
+
+    def resolve_indexes(self, start: int = 0) -> None:
+        """
+        Нумерует активные файлы по порядку
+        :param start: позиция, начиная с которой нумерация могла измениться
+        """
         idx = 1
-        for fi in self.all:
+        for pos in range(start - 1, -1, -1):
+            if self.all[pos].index is not None:
+                idx = self.all[pos].index + 1
+                break
+        for pos in range(start, len(self.all)):
+            fi = self.all[pos]
             if fi.active:
                 fi.index = idx
                 idx += 1
             else:
                 fi.index = None
+        self._active_count = idx - 1
 
     def get(self, name: str, fmt: str) -> FileItem:
         """ Возвращает данные файла по имени и формату """
-        for fi in self.all:
-            if fi.name == name and fi.fmt == fmt:
-                return fi
+        try:
+            return self._by_key[(name, fmt)]
+        except KeyError:
+            raise IndexError(f'FileItem "{name}.{fmt}" не обнаружен.\nFILES: {self.all}') from None
+
+    def position(self, file: FileItem) -> int:
+        """ Возвращает позицию файла в списке """
+        return self._positions[id(file)]
+
+    def set_active(self, file: FileItem, active: bool) -> None:
+        """ Отмечает файл (или снимает отметку), перенумеровывая только последующие файлы """
+        self.set_active_many([file], active)
+
+    def set_active_many(self, files: Iterable[FileItem], active: bool) -> None:
+        """ Отмечает множество файлов (или снимает отметку) с единственной перенумерацией """
+        start = None
+        for fi in files:
+            if fi.active == active:
+                continue
+            fi.active = active
+            pos = self.position(fi)
+            start = pos if start is None else min(start, pos)
+        if start is not None:
+            self.resolve_indexes(start)
 
-        raise IndexError(f'FileItem "{name}.{fmt}" не обнаружен.\nFILES: {self.all}')
+    def select_all(self, active: bool = True) -> None:
+        """ Отмечает все файлы (или снимает со всех отметку) """
+        self.set_active_many(self.all, active)
 
     @classmethod
     def from_path(
@@ -62,22 +117,30 @@ class FileList:
         :param sort: сортировать ли результат по имени файла
         :return: список путей к файлам каталога
         """
-        if isinstance(path, str):
-            path = Path(path)
-        files: list[FileItem] = []
-        search_method = 'rglob' if recursively else 'glob'
-        search = getattr(path, search_method)
-        formats = [f'*.{f}' for f in formats] if formats else ['*']
-        for fmt in formats:
-            for fpath in search(fmt):
-                if fpath.is_file():
-                    files.append(FileItem(abs_path=fpath))
-
+        files = [FileItem(abs_path=fpath) for fpath in scan_dir(path, formats, recursively)]
         if sort:
             files.sort(key=lambda x: x.name)
 
         return cls(all=files)
 
+    def extend(self, files: list[FileItem]) -> None:
+        """ Добавляет файлы в конец списка, индексируя только добавленные """
+        idx = self._active_count + 1
+        for fi in files:
+            self.__register(fi, len(self.all))
+            self.all.append(fi)
+            if fi.active:
+                fi.index = idx
+                idx += 1
+            else:
+                fi.index = None
+        self._active_count = idx - 1
+
+    def sort(self) -> None:
+        """ Сортирует список по имени файла и переиндексирует его """
+        self.all.sort(key=lambda x: x.name)
+        self.__rebuild()
+
     @property
     def active(self) -> list[FileItem]:
         """ Возвращает список активных (отмеченных галочкой в GUI) файлов """
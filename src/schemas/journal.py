@@ -0,0 +1,45 @@
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any
+
+
+class JobStatus(str, Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+@dataclass
+class JournalEntry:
+    """ Состояние обработки одного файла (или пары файлов) в журнале операций """
+    position: int
+    # входные файлы: видео и, например, добавляемые к нему субтитры
+    inputs: list[Path]
+    status: JobStatus = JobStatus.QUEUED
+    outputs: list[Path] = field(default_factory=list)
+    error: str | None = None
+
+
+@dataclass
+class JournalBatch:
+    """ Операция ``FFmpeg`` над множеством файлов, записанная в журнал """
+    id: int
+    # имя метода ``FFmpeg``
+    operation: str
+    params: dict[str, Any]
+    output: Path
+    entries: list[JournalEntry]
+    created: float = field(default_factory=time.time)
+
+    @property
+    def pending(self) -> list[JournalEntry]:
+        """ Файлы, которые еще не были успешно обработаны """
+        return [entry for entry in self.entries if entry.status != JobStatus.DONE]
+
+    def describe(self) -> str:
+        created = time.strftime('%d.%m.%Y %H:%M', time.localtime(self.created))
+        return (f'#{self.id} {self.operation} от {created}: '
+                f'не обработано {len(self.pending)} из {len(self.entries)}, каталог {self.output}')
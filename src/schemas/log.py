@@ -0,0 +1,38 @@
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+
+from .file import FileItem
+from src.utils.string import strip_markup
+
+
+class LogStatus(str, Enum):
+    INFO = 'info'
+    SUCCESS = 'success'
+    ERROR = 'error'
+
+
+@dataclass
+class LogEntry:
+    """ Запись журнала операций """
+    status: LogStatus
+    # может содержать разметку Kivy
+    message: str
+    file: FileItem | None = None
+    # страница либо команда, сделавшая запись
+    source: str | None = None
+    created: float = field(default_factory=time.time)
+
+    @property
+    def title(self) -> str:
+        """ ``%index%. %name%.%format%`` либо пустая строка, если запись не относится к файлу """
+        if self.file is None:
+            return ''
+        if self.file.index is None:
+            return self.file.fullname
+        return f'{self.file.index:02}. {self.file.fullname}'
+
+    def as_text(self) -> str:
+        """ Возвращает запись одной строкой без разметки (для записи в файл) """
+        parts = [f'[{self.source}]' if self.source else '', self.title, strip_markup(self.message)]
+        return ' '.join(part for part in parts if part).replace('\n', ' | ')
@@ -0,0 +1,159 @@
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.utils.filesystem import format_file_size, format_duration
+from .file import FileItem
+
+
+def _parse_float(value: str | None) -> float | None:
+    """ Разбирает числовое значение из вывода ``-progress`` (``N/A``, ``1.5x``, ``1024.0kbits/s``) """
+    if value is None:
+        return None
+    value = value.strip().removesuffix('x').removesuffix('kbits/s')
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+@dataclass
+class FileProgress:
+    """ Прогресс обработки одного файла, собираемый из вывода ``ffmpeg -progress`` """
+    file: FileItem
+    duration: float | None = None
+    size: int | None = None
+    out_time: float = 0
+    fps: float | None = None
+    speed: float | None = None
+    bitrate: float | None = None
+    total_size: int = 0
+    finished: bool = False
+    started: float = field(default_factory=time.monotonic)
+
+    def update(self, block: dict[str, str]) -> None:
+        """ Обновляет прогресс по очередному блоку ``key=value`` из вывода ``-progress`` """
+        out_time_us = _parse_float(block.get('out_time_us'))
+        if out_time_us is not None and out_time_us >= 0:
+            self.out_time = out_time_us / 1_000_000
+        self.fps = _parse_float(block.get('fps'))
+        self.speed = _parse_float(block.get('speed'))
+        self.bitrate = _parse_float(block.get('bitrate'))
+        total_size = _parse_float(block.get('total_size'))
+        if total_size is not None:
+            self.total_size = int(total_size)
+        if block.get('progress') == 'end':
+            self.finished = True
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def ratio(self) -> float:
+        """ Доля выполненной работы от ``0`` до ``1`` """
+        if self.finished:
+            return 1.0
+        if not self.duration:
+            return 0.0
+        return min(self.out_time / self.duration, 1.0)
+
+    @property
+    def percent(self) -> float:
+        return self.ratio * 100
+
+    @property
+    def processed_bytes(self) -> float:
+        """ Оценка числа прочитанных байтов входного файла """
+        if self.size and self.duration:
+            return self.size * self.ratio
+        return self.total_size
+
+    @property
+    def throughput(self) -> float:
+        """ Скорость обработки (байт/с) """
+        elapsed = self.elapsed
+        return self.processed_bytes / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        """ Оценка оставшегося времени (с) либо ``None``, если ее пока нельзя посчитать """
+        ratio = self.ratio
+        if ratio <= 0:
+            return None
+        return self.elapsed * (1 - ratio) / ratio
+
+    def describe(self) -> str:
+        """ Возвращает однострочное описание прогресса """
+        eta = format_duration(self.eta) if self.eta is not None else '--:--:--'
+        speed = f'{self.speed:.2f}x' if self.speed is not None else '-'
+        return (f'{self.percent:5.1f}% | {format_file_size(self.throughput)}/с | '
+                f'{speed} | осталось {eta}')
+
+
+@dataclass
+class BatchProgress:
+    """ Прогресс обработки множества файлов одной операцией ``FFmpeg`` """
+    total: int
+    files: dict[Path, FileProgress] = field(default_factory=dict)
+    started: float = field(default_factory=time.monotonic)
+
+    def start(self, f: FileItem, duration: float | str | None = None, size: int | str | None = None) -> FileProgress:
+        """ Регистрирует начало обработки файла """
+        progress = FileProgress(
+            file=f,
+            duration=float(duration) if duration else None,
+            size=int(size) if size else None,
+        )
+        self.files[f.abs_path] = progress
+        return progress
+
+    def get(self, f: FileItem) -> FileProgress:
+        return self.files[f.abs_path]
+
+    def finish(self, f: FileItem) -> FileProgress:
+        """ Отмечает обработку файла завершенной (успешно или нет) """
+        progress = self.files.get(f.abs_path) or self.start(f)
+        progress.finished = True
+        return progress
+
+    @property
+    def done(self) -> int:
+        return sum(1 for p in self.files.values() if p.finished)
+
+    @property
+    def active(self) -> list[FileProgress]:
+        return [p for p in self.files.values() if not p.finished]
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def ratio(self) -> float:
+        if not self.total:
+            return 1.0
+        return min(sum(p.ratio for p in self.files.values()) / self.total, 1.0)
+
+    @property
+    def percent(self) -> float:
+        return self.ratio * 100
+
+    @property
+    def throughput(self) -> float:
+        elapsed = self.elapsed
+        processed = sum(p.processed_bytes for p in self.files.values())
+        return processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        ratio = self.ratio
+        if ratio <= 0:
+            return None
+        return self.elapsed * (1 - ratio) / ratio
+
+    def describe(self) -> str:
+        """ Возвращает однострочное описание прогресса всей операции """
+        eta = format_duration(self.eta) if self.eta is not None else '--:--:--'
+        return (f'{self.done}/{self.total} | {self.percent:5.1f}% | '
+                f'{format_file_size(self.throughput)}/с | осталось {eta}')
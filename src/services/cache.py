@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from src.schemas import FFprobeFileData, FFprobeFullData
+
+
+class ProbeCache:
+    """
+    Дисковый кэш вывода ``ffprobe`` на SQLite.
+    Запись считается актуальной, пока у файла не изменились размер и время модификации.
+    Для каждого файла хранится краткий либо полный вывод: полный подходит и для кратких запросов.
+    При превышении ``max_entries`` вытесняются давно не запрашивавшиеся записи (LRU)
+    """
+
+    def __init__(self, path: Path | str, max_entries: int = 10_000) -> None:
+        """
+        :param path: путь к файлу базы данных
+        :param max_entries: максимальное число хранимых записей
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute(
+            'CREATE TABLE IF NOT EXISTS probe ('
+            'path TEXT PRIMARY KEY, '
+            'size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL, '
+            'data TEXT NOT NULL, '
+            'full INTEGER NOT NULL, '
+            'accessed REAL NOT NULL)'
+        )
+        self.__db.execute('CREATE INDEX IF NOT EXISTS probe_accessed ON probe (accessed)')
+
+    @staticmethod
+    def __key(path: Path) -> tuple[str, int, int]:
+        path = path.resolve()
+        stat = path.stat()
+        return str(path), stat.st_size, stat.st_mtime_ns
+
+    def get(self, path: Path, full: bool = False) -> FFprobeFileData | None:
+        """
+        Возвращает закэшированные метаданные файла либо ``None``, если их нет или они устарели
+        :param full: ``True`` -> нужен полный вывод ``ffprobe`` (``FFprobeFullData``)
+        """
+        try:
+            key, size, mtime_ns = self.__key(path)
+        except OSError:
+            return None
+
+        with self.__lock:
+            row = self.__db.execute(
+                'SELECT size, mtime_ns, data, full FROM probe WHERE path = ?', (key,),
+            ).fetchone()
+            if row is None or (full and not row[3]):
+                return None
+            if row[0] != size or row[1] != mtime_ns:
+                self.__db.execute('DELETE FROM probe WHERE path = ?', (key,))
+                return None
+            self.__db.execute('UPDATE probe SET accessed = ? WHERE path = ?', (time.time(), key))
+
+        if full:
+            return FFprobeFullData.model_validate_json(row[2])
+        return FFprobeFileData.model_validate_json(row[2])
+
+    def put(self, path: Path, data: FFprobeFileData) -> None:
+        """ Сохраняет метаданные файла. Краткий вывод не заменяет уже сохраненный полный """
+        try:
+            key, size, mtime_ns = self.__key(path)
+        except OSError:
+            return
+
+        with self.__lock:
+            full = isinstance(data, FFprobeFullData)
+            if not full:
+                row = self.__db.execute(
+                    'SELECT size, mtime_ns, full FROM probe WHERE path = ?', (key,),
+                ).fetchone()
+                if row == (size, mtime_ns, 1):
+                    return
+            self.__db.execute(
+                'INSERT OR REPLACE INTO probe (path, size, mtime_ns, data, accessed, full) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, size, mtime_ns, data.model_dump_json(), time.time(), int(full)),
+            )
+            self.__evict()
+
+    def invalidate(self, path: Path) -> None:
+        """ Удаляет запись о файле """
+        with self.__lock:
+            self.__db.execute('DELETE FROM probe WHERE path = ?', (str(path.resolve()),))
+
+    def invalidate_dir(self, path: Path) -> None:
+        """ Удаляет записи обо всех файлах каталога и его подкаталогов """
+        prefix = str(path.resolve()).rstrip('/\\')
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        with self.__lock:
+            self.__db.execute(
+                "DELETE FROM probe WHERE path LIKE ? ESCAPE '\\' OR path LIKE ? ESCAPE '\\'",
+                (f'{pattern}/%', f'{pattern}\\\\%'),
+            )
+
+    def clear(self) -> None:
+        """ Полностью очищает кэш """
+        with self.__lock:
+            self.__db.execute('DELETE FROM probe')
+
+    def __evict(self) -> None:
+        (count,) = self.__db.execute('SELECT COUNT(*) FROM probe').fetchone()
+        if count > self.max_entries:
+            self.__db.execute(
+                'DELETE FROM probe WHERE path IN (SELECT path FROM probe ORDER BY accessed LIMIT ?)',
+                (count - self.max_entries,),
+            )
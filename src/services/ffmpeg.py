@@ -1,11 +1,42 @@
-import json
-import re
-from subprocess import Popen, PIPE
+import shutil
+import tempfile
+from subprocess import PIPE
 from pathlib import Path
-from typing import Awaitable, Protocol
+from typing import Awaitable, Callable, Protocol
 
-from config import config, Defaults
-from src.schemas import FileItem, FFprobeFileData, StreamType
+import asyncgui
+
+from settings import Defaults, FFmpegSettings, EncoderPreset
+from src.schemas import (
+    FileItem,
+    FFprobeFileData,
+    FFprobeFullData,
+    FFPROBE_BRIEF_ENTRIES,
+    StreamType,
+    FileProgress,
+    BatchProgress,
+    JobStatus,
+    JournalBatch,
+)
+from .cache import ProbeCache
+from .jobs import Job, RetryPolicy
+from .journal import JobJournal, partial_path, commit_partial
+from .loop import run_in_thread
+from .manifest import BuildManifest
+from .pairing import language_tag, pair_tracks, parse_track_name, track_language, track_title
+from .pipeline import Pipeline
+from .pool import run_pooled
+from .process import run_process, ProcessResult
+from .subtitles import SubtitleParseError, Subtitles, prepare_subtitles
+from .sync import SyncEstimate, estimate_shift, pcm_command, speech_envelope, subtitle_timeline
+from .transcode import (
+    plan_streams,
+    plan_subtitle_extraction,
+    video_encoder_args,
+    merge_segment_progress,
+    IncompatiblePresetError,
+    StreamPlan,
+)
 
 
 class FFprobeCallback(Protocol):
@@ -26,77 +57,420 @@ class FFmpegCallback(Protocol):
         ...
 
 
+class FFmpegProgressCallback(Protocol):
+    def __call__(self, f: FileItem, progress: FileProgress, batch: BatchProgress) -> Awaitable[None]:
+        """
+        :param f: данные файла
+        :param progress: прогресс обработки файла
+        :param batch: прогресс всей операции
+        """
+        ...
+
+
 class FFmpeg:
     """
-    Применяет ffmpeg ко множеству файлов. Вызывает коллбэки в процессе
+    Применяет ffmpeg ко множеству файлов. Вызывает коллбэки в процессе.
+    Процессы ffmpeg выполняются в отдельных потоках, поэтому главный цикл приложения не блокируется
     """
-    __ffmpeg = str(config.BASE_DIR / 'data' / 'tools' / 'ffmpeg')
-    __ffprobe = str(config.BASE_DIR / 'data' / 'tools' / 'ffprobe')
+    __ffmpeg = Defaults.tool('ffmpeg')
+    __ffprobe = Defaults.tool('ffprobe')
+    __probe_cache: ProbeCache | None = None
+    __build_manifest: BuildManifest | None = None
+    __job_journal: JobJournal | None = None
 
     def __init__(
             self,
             output: str | None = None,
             stdout=PIPE,
             stderr=PIPE,
+            use_cache: bool = True,
+            retry: RetryPolicy | None = None,
+            settings: FFmpegSettings | None = None,
+            incremental: bool = True,
+            use_journal: bool = True,
     ) -> None:
         """
         :param output: каталог, в котором создаются результирующие файлы
         :param stdout: куда перенаправлять ``Popen`` stdout
         :param stderr: куда перенаправлять ``Popen`` stderr
+        :param use_cache: ``True`` -> брать метаданные файлов из кэша ffprobe, если файл не изменился
+        :param retry: политика перезапуска процессов после временных сбоев
+        :param settings: настройки ffmpeg (по умолчанию - значения ``FFmpegSettings``)
+        :param incremental: ``True`` -> пропускать файлы, результаты которых уже получены с теми же параметрами
+            и с тех пор не изменялись (см. ``BuildManifest``)
+        :param use_journal: ``True`` -> записывать ход операций в журнал, чтобы прерванную
+            (например, падением приложения) операцию можно было продолжить (см. ``JobJournal``)
         """
         self.output = output or Defaults.output()
         self.output = Path(self.output)
+        self.output.mkdir(exist_ok=True, parents=True)
         self.stdout = stdout
         self.stderr = stderr
+        self.settings = settings or FFmpegSettings()
+        self.cache = self.probe_cache(self.settings.PROBE_CACHE_MAX_ENTRIES) if use_cache else None
+        self.retry = retry or RetryPolicy(
+            attempts=self.settings.RETRY_ATTEMPTS,
+            delay=self.settings.RETRY_DELAY_SECONDS,
+        )
+        self.manifest = self.build_manifest() if incremental else None
+        self.journal = self.job_journal() if use_journal else None
+
+    @classmethod
+    def probe_cache(cls, max_entries: int | None = None) -> ProbeCache:
+        """ Возвращает общий для всех экземпляров кэш метаданных ffprobe """
+        if cls.__probe_cache is None:
+            cls.__probe_cache = ProbeCache(
+                Defaults.cache() / 'ffprobe.sqlite3',
+                max_entries=max_entries or FFmpegSettings().PROBE_CACHE_MAX_ENTRIES,
+            )
+        return cls.__probe_cache
+
+    @classmethod
+    def build_manifest(cls) -> BuildManifest:
+        """ Возвращает общий для всех экземпляров манифест результирующих файлов """
+        if cls.__build_manifest is None:
+            cls.__build_manifest = BuildManifest(Defaults.cache() / 'manifest.sqlite3')
+        return cls.__build_manifest
+
+    @classmethod
+    def job_journal(cls) -> JobJournal:
+        """ Возвращает общий для всех экземпляров журнал операций """
+        if cls.__job_journal is None:
+            cls.__job_journal = JobJournal(Defaults.cache() / 'journal.sqlite3')
+        return cls.__job_journal
+
+    async def __run(
+            self,
+            command: list[str | Path],
+            job: Job,
+            f: FileItem | None = None,
+            batch: BatchProgress | None = None,
+            on_progress: FFmpegProgressCallback | None = None,
+            outputs: list[Path] | None = None,
+            timeout: float | None = None,
+            on_block: Callable[[dict[str, str]], None] | None = None,
+    ) -> ProcessResult:
+        """
+        Выполняет команду в фоновом потоке, не блокируя интерфейс.
+        Временные сбои повторяются согласно ``self.retry``.
+        ``outputs`` пишутся под временными именами и переименовываются только при успехе,
+        поэтому прерванный процесс не оставляет обрезанных результатов.
+        Если передан ``on_progress``, ffmpeg отчитывается о прогрессе обработки ``f`` через ``-progress``.
+        ``on_block`` получает необработанные блоки ``-progress`` (прогресс ``f`` при этом не завершается)
+        """
+        kwargs = {'stdout': self.stdout, 'stderr': self.stderr, 'job': job, 'timeout': timeout}
+        partials = {output: partial_path(output) for output in outputs or []}
+        command = [partials.get(part, part) if isinstance(part, Path) else part for part in command]
+        progress = None
+        if on_block is None and f is not None and batch is not None and on_progress is not None:
+            progress = batch.get(f)
+
+            def on_block(block: dict[str, str]) -> None:
+                progress.update(block)
+                asyncgui.start(on_progress(f, progress=progress, batch=batch))
+
+        if on_block is not None:
+            command = [command[0], '-progress', 'pipe:1', '-nostats', *command[1:]]
+            kwargs['on_progress'] = on_block
+
+        proc = await run_process(command, **kwargs)
+        for delay in self.retry.delays():
+            if proc.ok or job.cancelled or not self.retry.is_transient(proc.stderr):
+                break
+            if await run_in_thread(lambda: job.wait_cancelled(delay)):
+                break
+            proc = await run_process(command, **kwargs)
+
+        for output, partial in partials.items():
+            if proc.ok:
+                commit_partial(output)
+            else:
+                partial.unlink(missing_ok=True)
+        if progress is not None:
+            batch.finish(f)
+            await on_progress(f, progress=progress, batch=batch)
+        return proc
+
+    # манифест читает stat() файлов и пишет в SQLite, поэтому обращения к нему выполняются в фоновом потоке
+
+    async def __signature(self, inputs: list[Path], params: list) -> str | None:
+        """ Подпись операции для манифеста. ``None``, если инкрементальная обработка отключена """
+        if self.manifest is None:
+            return None
+        return await run_in_thread(lambda: self.manifest.signature(inputs, params))
+
+    async def __is_current(self, outputs: list[Path], signature: str | None) -> bool:
+        """ Получены ли ``outputs`` операцией с той же подписью и не изменялись ли с тех пор """
+        return signature is not None and await run_in_thread(lambda: self.manifest.is_current(outputs, signature))
+
+    async def __record(self, outputs: list[Path], signature: str | None) -> None:
+        if signature is not None:
+            await run_in_thread(lambda: self.manifest.record(outputs, signature))
+
+    # запись в журнал тоже выполняется в фоновом потоке: на медленном диске она заметно задерживала бы интерфейс
+
+    async def __journal_begin(self, operation: str, params: dict, inputs: list[list[Path]]) -> int | None:
+        """ Записывает операцию в журнал. ``None``, если журнал отключен """
+        if self.journal is None:
+            return None
+        return await run_in_thread(lambda: self.journal.begin(operation, params, self.output, inputs))
+
+    async def __journal_update(
+            self,
+            batch_id: int | None,
+            position: int,
+            status: JobStatus,
+            outputs: list[Path] | None = None,
+            error: str | None = None,
+    ) -> None:
+        if batch_id is not None:
+            await run_in_thread(lambda: self.journal.update(batch_id, position, status, outputs=outputs, error=error))
+
+    async def __journal_finish(self, batch_id: int | None) -> None:
+        if batch_id is not None:
+            await run_in_thread(lambda: self.journal.finish(batch_id))
+
+    def __job_timeout(self, encodes: bool) -> float | None:
+        """ Предел времени работы процесса: перекодирование не ограничивается (см. ``JOB_TIMEOUT_SECONDS``) """
+        return None if encodes else self.settings.JOB_TIMEOUT_SECONDS
 
     @staticmethod
-    def __extract_language_from_subtitle_filename(filename: str) -> str:
-        pattern = rf'^.+\((.+?)--(.+?)\)$'
-        match = re.search(pattern, filename)
-        if match:
-            return match.group(1)
+    def __error_message(proc: ProcessResult, job: Job, message: str) -> str:
+        """ Дополняет сообщение об ошибке причиной прерывания процесса """
+        if job.cancelled:
+            return f'{message}: отменено'
+        if proc.timed_out:
+            return f'{message}: превышено время ожидания'
+        # последняя строка вывода ffmpeg обычно и есть причина ошибки
+        lines = proc.stderr.decode('utf-8', errors='replace').strip().splitlines()
+        if lines:
+            return f'{message}: {lines[-1].strip()}'
+        return message
+
+    async def __shift_subtitles(
+            self,
+            subtitles: list[FileItem],
+            shifts: list[float],
+            workdir: Path,
+    ) -> list[tuple[Path, float]]:
+        """
+        Сдвигает субтитры без ffmpeg (см. ``Subtitles``), сохраняя копии в ``workdir``:
+        при сшивании не нужен ``-itsoffset``, а события до начала видео обрезаются, а не уходят в минус
+        :param shifts: сдвиг каждого файла (в секундах)
+        :return: для каждого файла - путь входа ffmpeg и сдвиг, который осталось выполнить через ``-itsoffset``
+            (для файлов, которые не удалось разобрать)
+        """
+        def prepare() -> list[tuple[Path, float]]:
+            inputs = []
+            for i, (subtitle, shift) in enumerate(zip(subtitles, shifts)):
+                if not shift:
+                    inputs.append((subtitle.abs_path, 0.0))
+                    continue
+                try:
+                    inputs.append((prepare_subtitles(subtitle.abs_path, workdir / str(i), shift=shift), 0.0))
+                except (OSError, SubtitleParseError):
+                    inputs.append((subtitle.abs_path, shift))
+            return inputs
+
+        if not any(shifts):
+            return [(subtitle.abs_path, 0.0) for subtitle in subtitles]
+        workdir.mkdir(parents=True, exist_ok=True)
+        return await run_in_thread(prepare)
+
+    async def __track(
+            self,
+            f: FileItem,
+            batch: BatchProgress,
+            on_progress: FFmpegProgressCallback | None,
+            job: Job,
+            f_info: FFprobeFileData | None = None,
+    ) -> None:
+        """ Регистрирует файл в прогрессе операции. Длительность и размер нужны для расчета процентов и ETA """
+        if on_progress is None:
+            return
+        if f_info is None:
+            f_info = (await self.info([f], job=job)).get(f.index)
+        if f_info is None:
+            batch.start(f)
+        else:
+            batch.start(f, duration=f_info.format.duration, size=f_info.format.size)
+
+    def __should_segment(self, f_info: FFprobeFileData, plan: StreamPlan | None) -> bool:
+        """ Стоит ли кодировать файл частями (см. ``FFmpegSettings.SEGMENT_COUNT``) """
+        if plan is None or self.settings.SEGMENT_COUNT < 2 or len(plan.encoded_video) != 1:
+            return False
+        if len(f_info.get_streams_of_type(StreamType.VIDEO)) != 1:
+            return False
+        try:
+            duration = float(f_info.format.duration)
+        except (TypeError, ValueError):
+            return False
+        return duration >= self.settings.SEGMENT_MIN_DURATION_SECONDS
+
+    async def __encode_segmented(
+            self,
+            v: FileItem,
+            f_info: FFprobeFileData,
+            output_format: str,
+            preset: EncoderPreset,
+            output: Path,
+            job: Job,
+            batch: BatchProgress,
+            on_progress: FFmpegProgressCallback | None,
+    ) -> ProcessResult:
+        """
+        Кодирует видео частями: видеопоток без перекодирования режется по ключевым кадрам,
+        части кодируются параллельно, затем склеиваются без перекодирования
+        вместе с остальными потоками исходного файла
+        """
+        segment_time = float(f_info.format.duration) / self.settings.SEGMENT_COUNT
+        workdir = Path(tempfile.mkdtemp(prefix=f'.{v.name}.', dir=self.output))
+        progress = batch.get(v) if on_progress is not None else None
+        try:
+            proc = await self.__run([
+                self.__ffmpeg,
+                '-y',
+                '-i', str(v.abs_path),
+                '-map', '0:v:0',
+                '-c', 'copy',
+                '-f', 'segment',
+                # сегментер режет только по ключевым кадрам, поэтому части склеиваются без швов
+                '-segment_time', f'{segment_time:.3f}',
+                '-segment_format', 'matroska',
+                '-reset_timestamps', '1',
+                workdir / 'source_%04d.mkv',
+            ], job, timeout=self.settings.JOB_TIMEOUT_SECONDS)
+            if not proc.ok:
+                return proc
+
+            blocks: dict[int, dict[str, str]] = {}
+            results: list[ProcessResult] = []
 
-        return 'неизвестно'
+            def progress_handler(i: int) -> Callable[[dict[str, str]], None]:
+                def handle(block: dict[str, str]) -> None:
+                    blocks[i] = block
+                    progress.update(merge_segment_progress(blocks.values()))
+                    asyncgui.start(on_progress(v, progress=progress, batch=batch))
+
+                return handle
+
+            async def encode(item: tuple[int, Path]) -> None:
+                i, segment = item
+                if job.cancelled or any(not r.ok for r in results):
+                    return
+                results.append(await self.__run(
+                    [
+                        self.__ffmpeg,
+                        '-y',
+                        '-i', segment,
+                        *video_encoder_args(preset, 0),
+                        *preset.EXTRA_ARGS,
+                        workdir / f'encoded_{i:04d}.mkv',
+                    ],
+                    job,
+                    on_block=progress_handler(i) if progress is not None else None,
+                    timeout=self.__job_timeout(encodes=True),
+                ))
+
+            segments = sorted(workdir.glob('source_*.mkv'))
+            await run_pooled(enumerate(segments), encode, limit=self.settings.SEGMENT_WORKERS)
+            failed = next((r for r in results if not r.ok), None)
+            if failed is not None:
+                return failed
+            if job.cancelled or len(results) != len(segments):
+                return ProcessResult(returncode=-1, stdout=b'', stderr=b'')
+
+            concat_list = workdir / 'segments.txt'
+            concat_list.write_text(
+                ''.join(f"file 'encoded_{i:04d}.mkv'\n" for i in range(len(segments))),
+                encoding='utf-8',
+            )
+            # видео берется из склеенных частей, остальные потоки - из исходного файла
+            rest = plan_streams(f_info, output_format, preset, input_index=1, skip_video=True, first_output=1)
+            return await self.__run([
+                self.__ffmpeg,
+                '-y',
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', concat_list,
+                '-i', str(v.abs_path),
+                '-map', '0:v:0',
+                '-c:0', 'copy',
+                *rest.args,
+                output,
+            ], job, outputs=[output], timeout=self.settings.JOB_TIMEOUT_SECONDS)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+            if progress is not None:
+                batch.finish(v)
+                await on_progress(v, progress=progress, batch=batch)
 
     async def info(
             self,
             files: list[FileItem],
             on_success: FFprobeCallback | None = None,
             on_error: FFprobeCallback | None = None,
+            job: Job | None = None,
+            full: bool = False,
     ) -> dict[int, FFprobeFileData]:
         """
-        С помощью ffprobe получает метаданные медиафайлов
+        С помощью ffprobe получает метаданные медиафайлов.
+        Файлы опрашиваются параллельно (не более ``MAX_CONCURRENT_PROBES`` одновременно),
+        коллбэки при этом вызываются в порядке ``files``
         :param files: данные медиафайлов
         :param on_success: корутина, выполняемая при успехе операции с файлом
         :param on_error: корутина, выполняемая при ошибке операции с файлом
+        :param job: операция, отмена которой прерывает получение метаданных
+        :param full: ``True`` -> полный вывод ffprobe (``FFprobeFullData``),
+            иначе - только поля ``FFPROBE_BRIEF_ENTRIES``, которых достаточно для всех операций
         :return: словарь с метаданными
         """
+        job = job or Job()
         result = {}
-        for f in files:
-            command = [
-                self.__ffprobe,
-                '-v', 'quiet',
-                '-print_format', 'json',
-                '-show_format',
-                '-show_streams',
-                str(f.abs_path),
-            ]
-            proc = Popen(
-                command,
-                stdout=self.stdout,
-                stderr=self.stderr,
-            )
-            out, err = proc.communicate()
-            if proc.returncode == 0:
-                output = FFprobeFileData(**json.loads(out.decode('utf-8')))
-                if on_success is not None:
-                    await on_success(f, output=output)
-                print(f'{out.decode('utf-8')}\n\n')
-                result[f.index] = output
-            if proc.returncode != 0 and on_error is not None:
-                await on_error(f, output=json.loads(err.decode('utf-8')))
-                print(f'ERROR!! {err.decode('utf-8')}')
+        outputs: list[FFprobeFileData | None] = [None] * len(files)
+        finished = [False] * len(files)
+        emitted = 0
+
+        async def emit() -> None:
+            # результат передается в коллбэк, только когда обработаны все предшествующие файлы
+            nonlocal emitted
+            while emitted < len(files) and finished[emitted]:
+                f, output = files[emitted], outputs[emitted]
+                emitted += 1
+                if output is not None:
+                    result[f.index] = output
+                    if on_success is not None:
+                        await on_success(f, output=output)
+                elif on_error is not None and not job.cancelled:
+                    await on_error(f, output=FFprobeFileData())
 
+        async def probe(item: tuple[int, FileItem]) -> None:
+            i, f = item
+            output = None
+            if self.cache is not None:
+                # stat() файла и запись в SQLite не должны задерживать главный цикл
+                output = await run_in_thread(lambda: self.cache.get(f.abs_path, full=full))
+            if output is None and not job.cancelled:
+                command = [self.__ffprobe, '-v', 'quiet', '-print_format', 'json']
+                if full:
+                    command += ['-show_format', '-show_streams']
+                else:
+                    command += ['-show_entries', FFPROBE_BRIEF_ENTRIES]
+                command.append(str(f.abs_path))
+                proc = await self.__run(command, job, timeout=self.settings.PROBE_TIMEOUT_SECONDS)
+                if proc.ok:
+                    model = FFprobeFullData if full else FFprobeFileData
+                    try:
+                        output = model.model_validate_json(proc.stdout)
+                    except ValueError:
+                        output = None
+                if output is not None and self.cache is not None:
+                    await run_in_thread(lambda: self.cache.put(f.abs_path, output))
+            outputs[i] = output
+            finished[i] = True
+            await emit()
+
+        await run_pooled(enumerate(files), probe, limit=self.settings.MAX_CONCURRENT_PROBES)
         return result
 
     async def convert_video(
@@ -105,135 +479,780 @@ class FFmpeg:
             output_format: str,
             on_success: FFmpegCallback | None = None,
             on_error: FFmpegCallback | None = None,
-    ) -> None:
+            on_progress: FFmpegProgressCallback | None = None,
+            job: Job | None = None,
+            preset: EncoderPreset | None = None,
+    ) -> Job:
         """
-
-        :param videos:
-        :param output_format:
-        :param on_success:
-        :param on_error:
-        :return:
+        С помощью ``ffmpeg`` перепаковывает видеофайлы в контейнер ``output_format``.
+        Без ``preset`` все потоки копируются. С ``preset`` копируются только совместимые с контейнером потоки,
+        остальные перекодируются согласно пресету. Сохраняет результаты в ``self.output``
+        :param videos: данные видеофайлов
+        :param output_format: формат результирующих файлов
+        :param on_success: корутина, выполняемая при успехе операции с файлом
+        :param on_error: корутина, выполняемая при ошибке операции с файлом
+        :param on_progress: корутина, выполняемая при обновлении прогресса обработки файла
+        :param job: дескриптор, через который операцию можно отменить
+        :param preset: параметры перекодирования несовместимых потоков
+        :return: дескриптор операции
         """
-        for v in videos:
+        job = job or Job()
+        batch = BatchProgress(total=len(videos))
+        batch_id = await self.__journal_begin(
+            'convert_video',
+            {'output_format': output_format, 'preset': preset.model_dump() if preset is not None else None},
+            [[v.abs_path] for v in videos],
+        )
+        positions = {id(v): position for position, v in enumerate(videos)}
+        remuxes: list[tuple[FileItem, StreamPlan | None, FFprobeFileData | None]] = []
+        encodes: list[tuple[FileItem, StreamPlan | None, FFprobeFileData | None]] = []
+
+        if preset is None:
+            remuxes = [(v, None, None) for v in videos]
+        else:
+            # план потоков зависит от содержимого файла, поэтому сначала читаются метаданные всех файлов
+            infos = await self.info(videos, job=job)
+            for v in videos:
+                f_info = infos.get(v.index)
+                if f_info is None:
+                    batch.finish(v)
+                    if not job.cancelled:
+                        await self.__journal_update(batch_id, positions[id(v)], JobStatus.FAILED, error='metadata')
+                    if on_error is not None and not job.cancelled:
+                        await on_error(v, result='Ошибка чтения метаданных')
+                    continue
+                try:
+                    plan = plan_streams(f_info, output_format, preset)
+                except IncompatiblePresetError as e:
+                    batch.finish(v)
+                    await self.__journal_update(batch_id, positions[id(v)], JobStatus.FAILED, error=str(e))
+                    if on_error is not None:
+                        await on_error(v, result=str(e))
+                    continue
+                (encodes if plan.encodes else remuxes).append((v, plan, f_info))
+
+        async def convert(item: tuple[FileItem, StreamPlan | None, FFprobeFileData | None]) -> None:
+            if job.cancelled:
+                return
+            v, plan, f_info = item
             output_filename = f'{v.name}.{output_format}'
-            command = [
-                self.__ffmpeg,
-                '-y',
-                '-i', str(v.abs_path),
-                '-c', 'copy',
-                self.output / output_filename,
-            ]
-            proc = Popen(
-                command,
-                stdout=self.stdout,
-                stderr=self.stderr,
-            )
-            out, err = proc.communicate()
-            proc.wait()
-            if proc.returncode == 0 and on_success is not None:
+            outputs = [self.output / output_filename]
+            stream_args = plan.args if plan is not None else ['-c', 'copy']
+            signature = await self.__signature([v.abs_path], ['convert', output_format, stream_args])
+            position = positions[id(v)]
+            if await self.__is_current(outputs, signature):
+                batch.finish(v)
+                await self.__journal_update(batch_id, position, JobStatus.DONE, outputs=outputs)
+                if on_success is not None:
+                    await on_success(v, result=f'Файл {output_filename} не изменился, пропущен')
+                return
+            await self.__track(v, batch, on_progress, job, f_info=f_info)
+            await self.__journal_update(batch_id, position, JobStatus.RUNNING, outputs=outputs)
+            if f_info is not None and self.__should_segment(f_info, plan):
+                proc = await self.__encode_segmented(
+                    v, f_info, output_format, preset, self.output / output_filename, job, batch, on_progress,
+                )
+            else:
+                command = [
+                    self.__ffmpeg,
+                    '-y',
+                    '-i', str(v.abs_path),
+                    *stream_args,
+                    self.output / output_filename,
+                ]
+                proc = await self.__run(
+                    command, job, v, batch, on_progress,
+                    outputs=outputs,
+                    timeout=self.__job_timeout(encodes=plan is not None and plan.encodes),
+                )
+            await self.__journal_update(batch_id, position, JobStatus.DONE if proc.ok else JobStatus.FAILED)
+            if proc.ok:
+                await self.__record(outputs, signature)
+            if proc.ok and on_success is not None:
                 await on_success(v, result=f'Создан файл {output_filename}')
-            if proc.returncode != 0 and on_error is not None:
-                print(f'ERROR!! {err.decode('utf-8')}')
-                await on_error(v, result=f'Ошибка конвертации видео в {output_format}')
+            if not proc.ok and on_error is not None:
+                await on_error(v, result=self.__error_message(proc, job, f'Ошибка конвертации видео в {output_format}'))
+
+        # перепаковка упирается в диск, перекодирование - в процессор, поэтому у них раздельные лимиты
+        await asyncgui.wait_all(
+            run_pooled(remuxes, convert, limit=self.settings.MAX_CONCURRENT_REMUXES),
+            run_pooled(encodes, convert, limit=self.settings.MAX_CONCURRENT_ENCODES),
+        )
+        await self.__journal_finish(batch_id)
+        return job
 
     async def extract_subtitles(
             self,
             videos: list[FileItem],
             on_success: FFmpegCallback | None = None,
             on_error: FFmpegCallback | None = None,
-    ) -> None:
+            on_progress: FFmpegProgressCallback | None = None,
+            job: Job | None = None,
+            languages: list[str] | None = None,
+    ) -> Job:
         """
         С помощью ``ffmpeg`` извлекает субтитры из множества видеофайлов и сохраняет в папку ``self.output``
         :param videos: данные видеофайлов
         :param on_success: корутина, выполняемая при успехе операции с файлом
         :param on_error: корутина, выполняемая при ошибке операции с файлом
+        :param on_progress: корутина, выполняемая при обновлении прогресса обработки файла
+        :param job: дескриптор, через который операцию можно отменить
+        :param languages: языки извлекаемых субтитров (по умолчанию - ``SUBTITLE_LANGUAGES_TO_EXTRACT``)
+        :return: дескриптор операции
         """
-        for f in videos:
-            f_info = (await self.info([f]))[f.index]
-            for subtitle_stream in f_info.get_streams_of_type(StreamType.SUBTITLE):
-                if subtitle_stream.tags.language not in config.ffmpeg.SUBTITLE_LANGUAGES_TO_EXTRACT:
+        job = job or Job()
+        batch = BatchProgress(total=len(videos))
+        languages = languages or self.settings.SUBTITLE_LANGUAGES_TO_EXTRACT
+        batch_id = await self.__journal_begin('extract_subtitles', {'languages': languages}, [[v.abs_path] for v in videos])
+        positions = {id(v): position for position, v in enumerate(videos)}
+
+        async def extract(f: FileItem) -> None:
+            if job.cancelled:
+                return
+            position = positions[id(f)]
+            f_info = (await self.info([f], job=job)).get(f.index)
+            if f_info is None:
+                batch.finish(f)
+                if not job.cancelled:
+                    await self.__journal_update(batch_id, position, JobStatus.FAILED, error='metadata')
+                if on_error is not None and not job.cancelled:
+                    await on_error(f, result='Ошибка чтения метаданных')
+                return
+            # все выбранные потоки извлекаются одним процессом, поэтому видеофайл читается ровно один раз
+            plan = plan_subtitle_extraction(f_info, f.name, languages, self.output)
+            if on_error is not None and plan.dropped:
+                codecs = {s.index: s.codec_name for s in f_info.streams}
+                for index in plan.dropped:
+                    await on_error(f, result=f'Поток {index} ({codecs[index]}) пропущен: субтитры не текстовые')
+            output_filenames = plan.filenames
+            if not output_filenames:
+                batch.finish(f)
+                await self.__journal_update(batch_id, position, JobStatus.DONE)
+                return
+
+            command = [self.__ffmpeg, '-y', '-i', str(f.abs_path), *plan.args]
+            outputs = [self.output / output_filename for output_filename in output_filenames]
+            # команда включает выбранные потоки, кодеки и имена файлов, поэтому однозначно описывает операцию
+            signature = await self.__signature([f.abs_path], ['extract', [str(part) for part in command[1:]]])
+            if await self.__is_current(outputs, signature):
+                batch.finish(f)
+                await self.__journal_update(batch_id, position, JobStatus.DONE, outputs=outputs)
+                if on_success is not None:
+                    for output_filename in output_filenames:
+                        await on_success(f, result=f'Файл {output_filename} не изменился, пропущен')
+                return
+
+            await self.__track(f, batch, on_progress, job, f_info=f_info)
+            await self.__journal_update(batch_id, position, JobStatus.RUNNING, outputs=outputs)
+            proc = await self.__run(
+                command, job, f, batch, on_progress,
+                outputs=outputs,
+                timeout=self.settings.JOB_TIMEOUT_SECONDS,
+            )
+            await self.__journal_update(batch_id, position, JobStatus.DONE if proc.ok else JobStatus.FAILED)
+            if proc.ok:
+                await self.__record(outputs, signature)
+            if proc.ok and on_success is not None:
+                for output_filename in output_filenames:
+                    await on_success(f, result=f'Создан файл {output_filename}')
+            if not proc.ok and on_error is not None:
+                await on_error(f, result=self.__error_message(
+                    proc, job, f'Ошибка извлечения субтитров ({len(output_filenames)} шт.)',
+                ))
+
+        await run_pooled(videos, extract, limit=self.settings.MAX_CONCURRENT_REMUXES)
+        await self.__journal_finish(batch_id)
+        return job
+
+    async def convert_subtitles(
+            self,
+            subtitles: list[FileItem],
+            output_format: str | None = None,
+            shift: float = 0,
+            scale: float = 1,
+            on_success: FFmpegCallback | None = None,
+            on_error: FFmpegCallback | None = None,
+            job: Job | None = None,
+    ) -> Job:
+        """
+        Сдвигает, масштабирует время и конвертирует субтитры ASS и SRT без запуска ffmpeg (см. ``Subtitles``).
+        Сохраняет результаты в ``self.output`` под исходными именами
+        :param subtitles: данные субтитров
+        :param output_format: формат результатов (по умолчанию - формат исходного файла)
+        :param shift: сдвиг (в секундах)
+        :param scale: коэффициент масштабирования времени (например, ``25 / 23.976`` при смене частоты кадров)
+        :param on_success: корутина, выполняемая при успехе операции с файлом
+        :param on_error: корутина, выполняемая при ошибке операции с файлом
+        :param job: дескриптор, через который операцию можно отменить
+        :return: дескриптор операции
+        """
+        job = job or Job()
+
+        def convert(f: FileItem) -> Path:
+            output = self.output / f'{f.name}.{output_format or f.fmt}'
+            if output.resolve() == f.abs_path.resolve():
+                raise SubtitleParseError('Результат совпадает с исходным файлом, укажите другой каталог')
+            return prepare_subtitles(f.abs_path, output, shift=shift, scale=scale, fmt=output_format)
+
+        for f in subtitles:
+            if job.cancelled:
+                break
+            try:
+                output = await run_in_thread(lambda: convert(f))
+            except (OSError, SubtitleParseError) as e:
+                if on_error is not None:
+                    await on_error(f, result=f'Ошибка обработки субтитров: {e}')
+                continue
+            if on_success is not None:
+                await on_success(f, result=f'Создан файл {output.name}')
+        return job
+
+    async def estimate_subtitle_shifts(
+            self,
+            videos: list[FileItem],
+            subtitles: list[FileItem],
+            on_success: FFmpegCallback | None = None,
+            on_error: FFmpegCallback | None = None,
+            job: Job | None = None,
+    ) -> dict[str, SyncEstimate]:
+        """
+        Подбирает сдвиг для каждого файла субтитров (см. ``src.services.sync``): звук видео читается одним
+        процессом ffmpeg (только первые ``SYNC_ANALYZE_SECONDS`` секунд), остальное считается в памяти.
+        Требует numpy (см. ``sync_available``)
+        :param videos: данные видеофайлов
+        :param subtitles: данные субтитров, сопоставляются с видео так же, как в ``add_subtitles``
+        :param on_success: корутина, выполняемая для каждого подобранного сдвига
+        :param on_error: корутина, выполняемая при ошибке или если сдвиг не удалось подобрать уверенно
+        :param job: дескриптор, через который операцию можно отменить
+        :return: сдвиги с уверенностью не ниже ``SYNC_MIN_CONFIDENCE``, ключ - ``str(subtitle.abs_path)``
+            (см. параметр ``subtitle_shifts`` метода ``add_subtitles``)
+        """
+        job = job or Job()
+        settings = self.settings
+        groups = [(video, files) for video, files in pair_tracks(videos, subtitles) if files]
+        result: dict[str, SyncEstimate] = {}
+
+        def analyze(pcm: bytes, files: list[FileItem]) -> list[SyncEstimate | str]:
+            envelope = speech_envelope(pcm, settings.SYNC_SAMPLE_RATE, settings.SYNC_FRAME_RATE)
+            frames = len(envelope) + round(settings.SYNC_MAX_SHIFT_SECONDS * settings.SYNC_FRAME_RATE)
+            estimates: list[SyncEstimate | str] = []
+            for subtitle in files:
+                try:
+                    timeline = subtitle_timeline(Subtitles.load(subtitle.abs_path), settings.SYNC_FRAME_RATE, frames)
+                except (OSError, SubtitleParseError) as e:
+                    estimates.append(str(e))
                     continue
+                estimates.append(estimate_shift(
+                    envelope, timeline, settings.SYNC_FRAME_RATE, settings.SYNC_MAX_SHIFT_SECONDS,
+                ))
+            return estimates
 
-                if subtitle_stream.codec_name in Defaults.subtitle_supported_formats:
-                    output_format = subtitle_stream.codec_name
+        async def estimate(group: tuple[FileItem, list[FileItem]]) -> None:
+            if job.cancelled:
+                return
+            video, files = group
+            proc = await self.__run(
+                pcm_command(self.__ffmpeg, video.abs_path, settings.SYNC_SAMPLE_RATE, settings.SYNC_ANALYZE_SECONDS),
+                job,
+                timeout=self.settings.JOB_TIMEOUT_SECONDS,
+            )
+            if not proc.ok or not proc.stdout:
+                if on_error is not None and not job.cancelled:
+                    await on_error(video, result=self.__error_message(proc, job, 'Ошибка чтения звуковой дорожки'))
+                return
+            for subtitle, estimated in zip(files, await run_in_thread(lambda: analyze(proc.stdout, files))):
+                if isinstance(estimated, str):
+                    if on_error is not None:
+                        await on_error(video, result=f'{subtitle.fullname}: {estimated}')
+                elif estimated.confidence < settings.SYNC_MIN_CONFIDENCE:
+                    if on_error is not None:
+                        await on_error(video, result=(
+                            f'{subtitle.fullname}: сдвиг не подобран '
+                            f'(уверенность {estimated.confidence:.2f}, лучший сдвиг {estimated.shift:+.2f} с)'
+                        ))
                 else:
-                    output_format = Defaults.subtitle_supported_formats[0]
+                    result[str(subtitle.abs_path)] = estimated
+                    if on_success is not None:
+                        await on_success(video, result=(
+                            f'{subtitle.fullname}: сдвиг {estimated.shift:+.2f} с '
+                            f'(уверенность {estimated.confidence:.2f})'
+                        ))
 
-                output_filename = f'{f.name} ({subtitle_stream.tags.name}).{output_format}'
-                # TODO: сохранять метаданные из потока субтитров
-                command = [
-                    self.__ffmpeg,
-                    '-y',
-                    '-i', str(f.abs_path),
-                    '-map', f'0:{subtitle_stream.index}',
-                    '-c', 'copy',
-                    '-f', 'ass',
-                    self.output / output_filename,
-                ]
-                proc = Popen(
-                    command,
-                    stdout=self.stdout,
-                    stderr=self.stderr,
-                )
-                out, err = proc.communicate()
-                proc.wait()
-                if proc.returncode == 0 and on_success is not None:
-                    await on_success(f, result=f'Создан файл {output_filename}')
-                if proc.returncode != 0 and on_error is not None:
-                    print(f'ERROR!! {err.decode('utf-8')}')
-                    await on_error(f, result=f'Ошибка извлечения субтитров .{output_format}')
+        await run_pooled(groups, estimate, limit=self.settings.MAX_CONCURRENT_REMUXES)
+        return result
 
     async def add_subtitles(
             self,
             videos: list[FileItem],
             subtitles: list[FileItem],
             subtitle_shift: float = 0,
+            language: str = 'rus',
+            subtitle_shifts: dict[str, float] | None = None,
             on_success: FFmpegCallback | None = None,
             on_error: FFmpegCallback | None = None,
-    ) -> None:
+            on_progress: FFmpegProgressCallback | None = None,
+            job: Job | None = None,
+    ) -> Job:
         """
-        С помощью ``ffmpeg`` сшивает попарно видеофайлы и субтитры. Сохраняет результаты в ``self.output``
+        С помощью ``ffmpeg`` добавляет к видеофайлам субтитры, сопоставленные по именам и номерам серий
+        (см. ``pair_tracks``). Все субтитры видео добавляются одним процессом. Сохраняет результаты в ``self.output``
         :param videos: данные видеофайлов
         :param subtitles: данные субтитров
         :param subtitle_shift: сдвиг дорожки субтитров (в секундах)
+        :param language: язык субтитров, в имени файла которых язык не указан
+        :param subtitle_shifts: сдвиги отдельных файлов субтитров, ключ - ``str(abs_path)``
+            (например, из ``estimate_subtitle_shifts``). Остальные файлы сдвигаются на ``subtitle_shift``
         :param on_success: корутина, выполняемая при успехе операции с файлом
         :param on_error: корутина, выполняемая при ошибке операции с файлом
+        :param on_progress: корутина, выполняемая при обновлении прогресса обработки файла
+        :param job: дескриптор, через который операцию можно отменить
+        :return: дескриптор операции
         """
-        for video in videos:
-            subtitle = None
-            for s in subtitles:
-                if s.index == video.index:
-                    subtitle = s
-            if not subtitle:
-                continue
+        job = job or Job()
+        subtitle_shifts = subtitle_shifts or {}
+        groups = [(video, files) for video, files in pair_tracks(videos, subtitles) if files]
+        batch = BatchProgress(total=len(groups))
+        batch_id = await self.__journal_begin(
+            'add_subtitles',
+            {'subtitle_shift': subtitle_shift, 'language': language, 'subtitle_shifts': subtitle_shifts},
+            [[video.abs_path, *(subtitle.abs_path for subtitle in files)] for video, files in groups],
+        )
+        positions = {id(video): position for position, (video, _) in enumerate(groups)}
+
+        async def add(group: tuple[FileItem, list[FileItem]]) -> None:
+            if job.cancelled:
+                return
+            video, files = group
+            position = positions[id(video)]
+            output_filename = f'{video.name}{language_tag(files, language, "SUB")}.{video.fmt}'
+            outputs = [self.output / output_filename]
+            shifts = [subtitle_shifts.get(str(subtitle.abs_path), subtitle_shift) for subtitle in files]
+            signature = await self.__signature(
+                [video.abs_path, *(subtitle.abs_path for subtitle in files)],
+                ['add_subtitles', shifts, language],
+            )
+            if await self.__is_current(outputs, signature):
+                batch.finish(video)
+                await self.__journal_update(batch_id, position, JobStatus.DONE, outputs=outputs)
+                if on_success is not None:
+                    await on_success(video, result=f'Файл {output_filename} не изменился, пропущен')
+                return
+
+            # номера новых дорожек субтитров идут после уже имеющихся в видео
+            f_info = (await self.info([video], job=job)).get(video.index)
+            if f_info is None:
+                batch.finish(video)
+                if not job.cancelled:
+                    await self.__journal_update(batch_id, position, JobStatus.FAILED, error='metadata')
+                if on_error is not None and not job.cancelled:
+                    await on_error(video, result='Ошибка чтения метаданных')
+                return
+            await self.__track(video, batch, on_progress, job, f_info=f_info)
+            await self.__journal_update(batch_id, position, JobStatus.RUNNING, outputs=outputs)
+            # субтитры сдвигаются без ffmpeg во временные копии (см. __shift_subtitles)
+            workdir = Path(tempfile.mkdtemp(prefix=f'.{video.name}.', dir=self.output))
+            try:
+                inputs = await self.__shift_subtitles(files, shifts, workdir)
+                command = [
+                    self.__ffmpeg,
+                    '-y',                                   # автозамена существующих файлов
+                    '-i', str(video.abs_path),              # первый инпут-файл (видео)
+                ]
+                for path, shift in inputs:
+                    command += ['-itsoffset', str(shift), '-i', str(path)]
+                command += ['-c', 'copy', '-map', '0']      # копирование всех потоков видеофайла без перекодирования
+                command += [arg for i in range(1, len(files) + 1) for arg in ('-map', f'{i}:s')]
+                n = len(f_info.get_streams_of_type(StreamType.SUBTITLE))
+                for subtitle in files:
+                    # язык и заголовок берутся из суффикса имени файла: "Ep01 (eng--Full).ass", "Ep01.rus.srt"
+                    parsed = parse_track_name(subtitle.name)
+                    subtitle_language = track_language(subtitle, language)
+                    command += [
+                        f'-metadata:s:s:{n}', f'language={subtitle_language}',
+                        f'-metadata:s:s:{n}', f'title={parsed.title or subtitle_language.upper()}',
+                    ]
+                    n += 1
+                command.append(self.output / output_filename)
+
+                proc = await self.__run(
+                    command, job, video, batch, on_progress,
+                    outputs=outputs,
+                    timeout=self.settings.JOB_TIMEOUT_SECONDS,
+                )
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            await self.__journal_update(batch_id, position, JobStatus.DONE if proc.ok else JobStatus.FAILED)
+            if proc.ok:
+                await self.__record(outputs, signature)
+            if proc.ok and on_success is not None:
+                await on_success(video, result=f'Создан файл {output_filename} (субтитров: {len(files)})')
+            if not proc.ok and on_error is not None:
+                await on_error(video, result=self.__error_message(proc, job, 'Ошибка добавления субтитров'))
+
+        await run_pooled(groups, add, limit=self.settings.MAX_CONCURRENT_REMUXES)
+        await self.__journal_finish(batch_id)
+        return job
+
+    async def __plan_pipeline(
+            self,
+            video: FileItem,
+            subtitles: list[FileItem],
+            audiotracks: list[FileItem],
+            pipeline: Pipeline,
+            audiotrack_language: str,
+            workdir: Path,
+            job: Job,
+    ) -> tuple[list[str | Path], bool, FFprobeFileData]:
+        """
+        Составляет аргументы ffmpeg для выполнения ``pipeline`` над видео: входы и выбор потоков всех файлов.
+        Сдвинутые копии субтитров сохраняются в ``workdir``
+        :return: аргументы (без имени результата), требуется ли перекодирование, метаданные видео
+        :raises IncompatiblePresetError: если потоки нельзя поместить в контейнер
+        :raises FileNotFoundError: если не удалось прочитать метаданные одного из файлов
+        """
+        f_info = (await self.info([video], job=job)).get(video.index)
+        if f_info is None:
+            raise FileNotFoundError(video.fullname)
+        output_format = pipeline.output_format or video.fmt
+        plan = plan_streams(f_info, output_format, pipeline.preset)
+        inputs: list[str | Path] = ['-i', str(video.abs_path)]
+        args = list(plan.args)
+        encodes = plan.encodes
+        out = len(plan.mapped)
+        audio_streams = {s.index for s in f_info.get_streams_of_type(StreamType.AUDIO)}
+        first_added_audio = sum(1 for index in plan.mapped if index in audio_streams)
+        added_audio = 0
+        input_index = 1
+
+        additions = (
+            (StreamType.AUDIO, audiotracks, pipeline.audiotrack_shift, audiotrack_language),
+            (StreamType.SUBTITLE, subtitles, pipeline.subtitle_shift, pipeline.subtitle_language),
+        )
+        subtitle_inputs = await self.__shift_subtitles(
+            subtitles, [pipeline.subtitle_shift] * len(subtitles), workdir,
+        )
+        for stream_type, files, shift, language in additions:
+            for i, f in enumerate(files):
+                t_info = (await self.info([f], job=job)).get(f.index)
+                if t_info is None:
+                    raise FileNotFoundError(f.fullname)
+                t_plan = plan_streams(
+                    t_info, output_format, pipeline.preset,
+                    input_index=input_index,
+                    first_output=out,
+                    stream_types=[stream_type],
+                )
+                if not t_plan.mapped:
+                    raise IncompatiblePresetError(f'{f.fullname}: нет потоков, которые можно поместить в {output_format}')
+                # -itsoffset сдвигает следующий за ним вход
+                path = f.abs_path
+                if stream_type == StreamType.SUBTITLE:
+                    path, shift = subtitle_inputs[i]
+                inputs += ['-itsoffset', str(shift), '-i', str(path)]
+                input_index += 1
+                args += t_plan.args
+                # язык из имени файла ("Ep01.eng.ass"), иначе - язык из настроек цепочки
+                track_lang = track_language(f, language)
+                if stream_type == StreamType.AUDIO:
+                    title = track_title(video, f)
+                else:
+                    title = parse_track_name(f.name).title or track_lang.upper()
+                for n in range(out, out + len(t_plan.mapped)):
+                    args += [f'-metadata:s:{n}', f'language={track_lang}', f'-metadata:s:{n}', f'title={title}']
+                out += len(t_plan.mapped)
+                encodes = encodes or t_plan.encodes
+                if stream_type == StreamType.AUDIO:
+                    added_audio += len(t_plan.mapped)
+
+        if added_audio and self.settings.AUDIOTRACK_MAKE_DEFAULT:
+            for i in range(first_added_audio + added_audio):
+                args += [f'-disposition:a:{i}', 'default' if i == first_added_audio else '0']
+        return [*inputs, *args], encodes, f_info
+
+    async def run_pipeline(
+            self,
+            videos: list[FileItem],
+            pipeline: Pipeline,
+            on_success: FFmpegCallback | None = None,
+            on_error: FFmpegCallback | None = None,
+            on_progress: FFmpegProgressCallback | None = None,
+            job: Job | None = None,
+    ) -> Job:
+        """
+        Выполняет над каждым видео цепочку операций ``pipeline`` (перепаковка, добавление субтитров
+        и аудиодорожек) одним процессом ``ffmpeg``: видео читается один раз, промежуточные файлы не создаются.
+        Сохраняет результаты в ``self.output``
+        :param videos: данные видеофайлов
+        :param pipeline: цепочка операций
+        :param on_success: корутина, выполняемая при успехе операции с файлом
+        :param on_error: корутина, выполняемая при ошибке операции с файлом
+        :param on_progress: корутина, выполняемая при обновлении прогресса обработки файла
+        :param job: дескриптор, через который операцию можно отменить
+        :return: дескриптор операции
+        """
+        job = job or Job()
+        audiotrack_language = pipeline.audiotrack_language or self.settings.AUDIOTRACK_LANGUAGE
+        subtitles = {id(video): files for video, files in pair_tracks(videos, pipeline.subtitles)}
+        audiotracks = {id(video): files for video, files in pair_tracks(videos, pipeline.audiotracks)}
+        items = [(video, subtitles[id(video)], audiotracks[id(video)]) for video in videos]
+        if pipeline.output_format is None:
+            # без смены формата обрабатываются только видео, к которым есть что добавить
+            items = [item for item in items if item[1] or item[2]]
+
+        batch = BatchProgress(total=len(items))
+        batch_id = await self.__journal_begin(
+            'run_pipeline',
+            pipeline.params(),
+            [[video.abs_path, *(f.abs_path for f in (*subs, *tracks))] for video, subs, tracks in items],
+        )
+        positions = {id(video): position for position, (video, _, _) in enumerate(items)}
+        # сдвинутые копии субтитров (см. __shift_subtitles) удаляются после выполнения всей цепочки
+        workdir = Path(tempfile.mkdtemp(prefix='.pipeline.', dir=self.output))
+        try:
+            remuxes: list[tuple[FileItem, list[str | Path], FFprobeFileData, str, str | None]] = []
+            encodes: list[tuple[FileItem, list[str | Path], FFprobeFileData, str, str | None]] = []
+
+            for video, subs, tracks in items:
+                if job.cancelled:
+                    break
+                position = positions[id(video)]
+                output_filename = pipeline.output_filename(video, subs, tracks, audiotrack_language)
+                outputs = [self.output / output_filename]
+                signature = await self.__signature(
+                    [video.abs_path, *(f.abs_path for f in (*subs, *tracks))],
+                    ['run_pipeline', pipeline.params(), audiotrack_language, self.settings.AUDIOTRACK_MAKE_DEFAULT],
+                )
+                if await self.__is_current(outputs, signature):
+                    batch.finish(video)
+                    await self.__journal_update(batch_id, position, JobStatus.DONE, outputs=outputs)
+                    if on_success is not None:
+                        await on_success(video, result=f'Файл {output_filename} не изменился, пропущен')
+                    continue
+                try:
+                    args, encoded, f_info = await self.__plan_pipeline(
+                        video, subs, tracks, pipeline, audiotrack_language, workdir / str(position), job,
+                    )
+                except (FileNotFoundError, IncompatiblePresetError) as e:
+                    batch.finish(video)
+                    if job.cancelled:
+                        break
+                    message = f'Ошибка чтения метаданных {e}' if isinstance(e, FileNotFoundError) else str(e)
+                    await self.__journal_update(batch_id, position, JobStatus.FAILED, error=message)
+                    if on_error is not None:
+                        await on_error(video, result=message)
+                    continue
+                (encodes if encoded else remuxes).append((video, args, f_info, output_filename, signature))
+
+            async def run(
+                    item: tuple[FileItem, list[str | Path], FFprobeFileData, str, str | None],
+                    encodes: bool = False,
+            ) -> None:
+                if job.cancelled:
+                    return
+                video, args, f_info, output_filename, signature = item
+                position = positions[id(video)]
+                outputs = [self.output / output_filename]
+                await self.__track(video, batch, on_progress, job, f_info=f_info)
+                await self.__journal_update(batch_id, position, JobStatus.RUNNING, outputs=outputs)
+                proc = await self.__run(
+                    [self.__ffmpeg, '-y', *args, self.output / output_filename],
+                    job, video, batch, on_progress,
+                    outputs=outputs,
+                    timeout=self.__job_timeout(encodes),
+                )
+                await self.__journal_update(batch_id, position, JobStatus.DONE if proc.ok else JobStatus.FAILED)
+                if proc.ok:
+                    await self.__record(outputs, signature)
+                if proc.ok and on_success is not None:
+                    await on_success(video, result=f'Создан файл {output_filename}')
+                if not proc.ok and on_error is not None:
+                    await on_error(video, result=self.__error_message(proc, job, 'Ошибка обработки видео'))
+
+            await asyncgui.wait_all(
+                run_pooled(remuxes, run, limit=self.settings.MAX_CONCURRENT_REMUXES),
+                run_pooled(encodes, lambda item: run(item, encodes=True), limit=self.settings.MAX_CONCURRENT_ENCODES),
+            )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        await self.__journal_finish(batch_id)
+        return job
+
+    async def resume(
+            self,
+            batch: JournalBatch,
+            on_success: FFmpegCallback | None = None,
+            on_error: FFmpegCallback | None = None,
+            on_progress: FFmpegProgressCallback | None = None,
+            job: Job | None = None,
+    ) -> Job:
+        """
+        Продолжает прерванную операцию из журнала: обрабатываются только файлы, не обработанные успешно.
+        Результаты сохраняются в ``self.output``, поэтому экземпляр следует создавать с ``output=batch.output``
+        :param batch: прерванная операция (см. ``JobJournal.interrupted``)
+        :param on_success: корутина, выполняемая при успехе операции с файлом
+        :param on_error: корутина, выполняемая при ошибке операции с файлом
+        :param on_progress: корутина, выполняемая при обновлении прогресса обработки файла
+        :param job: дескриптор, через который операцию можно отменить
+        :return: дескриптор операции
+        """
+        job = job or Job()
+        pending = batch.pending
+        # продолжение записывается в журнал как новая операция
+        if self.journal is not None:
+            await run_in_thread(lambda: self.journal.discard(batch.id))
+        inputs = [[FileItem(path, index=index) for path in entry.inputs] for index, entry in enumerate(pending, 1)]
+        callbacks = {'on_success': on_success, 'on_error': on_error, 'on_progress': on_progress, 'job': job}
+
+        match batch.operation:
+            case 'convert_video':
+                preset = batch.params.get('preset')
+                return await self.convert_video(
+                    [files[0] for files in inputs],
+                    output_format=batch.params['output_format'],
+                    preset=EncoderPreset(**preset) if preset is not None else None,
+                    **callbacks,
+                )
+            case 'extract_subtitles':
+                return await self.extract_subtitles(
+                    [files[0] for files in inputs],
+                    languages=batch.params.get('languages'),
+                    **callbacks,
+                )
+            case 'add_subtitles':
+                return await self.add_subtitles(
+                    [files[0] for files in inputs],
+                    [subtitle for files in inputs for subtitle in files[1:]],
+                    subtitle_shift=batch.params.get('subtitle_shift', 0),
+                    language=batch.params.get('language', 'rus'),
+                    subtitle_shifts=batch.params.get('subtitle_shifts'),
+                    **callbacks,
+                )
+            case 'add_audiotracks':
+                return await self.add_audiotracks(
+                    [files[0] for files in inputs],
+                    [track for files in inputs for track in files[1:]],
+                    audiotrack_shift=batch.params.get('audiotrack_shift', 0),
+                    language=batch.params.get('language'),
+                    **callbacks,
+                )
+            case 'run_pipeline':
+                return await self.run_pipeline(
+                    [files[0] for files in inputs],
+                    Pipeline.from_params(batch.params, [track for files in inputs for track in files[1:]]),
+                    **callbacks,
+                )
+            case _:
+                raise ValueError(f'Неизвестная операция {batch.operation}')
+
+    async def add_audiotracks(
+            self,
+            videos: list[FileItem],
+            audiotracks: list[FileItem],
+            audiotrack_shift: float = 0,
+            language: str | None = None,
+            on_success: FFmpegCallback | None = None,
+            on_error: FFmpegCallback | None = None,
+            on_progress: FFmpegProgressCallback | None = None,
+            job: Job | None = None,
+    ) -> Job:
+        """
+        С помощью ``ffmpeg`` добавляет к видеофайлам внешние аудиодорожки (см. ``pair_tracks``).
+        Все дорожки видео добавляются одним процессом без перекодирования. Сохраняет результаты в ``self.output``
+        :param videos: данные видеофайлов
+        :param audiotracks: данные аудиофайлов
+        :param audiotrack_shift: сдвиг аудиодорожек (в секундах)
+        :param language: язык дорожек, в имени файла которых язык не указан (по умолчанию - ``AUDIOTRACK_LANGUAGE``)
+        :param on_success: корутина, выполняемая при успехе операции с файлом
+        :param on_error: корутина, выполняемая при ошибке операции с файлом
+        :param on_progress: корутина, выполняемая при обновлении прогресса обработки файла
+        :param job: дескриптор, через который операцию можно отменить
+        :return: дескриптор операции
+        """
+        job = job or Job()
+        language = language or self.settings.AUDIOTRACK_LANGUAGE
+        groups = [(video, tracks) for video, tracks in pair_tracks(videos, audiotracks) if tracks]
+        batch = BatchProgress(total=len(groups))
+        batch_id = await self.__journal_begin(
+            'add_audiotracks',
+            {'audiotrack_shift': audiotrack_shift, 'language': language},
+            [[video.abs_path, *(track.abs_path for track in tracks)] for video, tracks in groups],
+        )
+        positions = {id(video): position for position, (video, _) in enumerate(groups)}
+
+        async def add(group: tuple[FileItem, list[FileItem]]) -> None:
+            if job.cancelled:
+                return
+            video, tracks = group
+            position = positions[id(video)]
+            output_filename = f'{video.name}{language_tag(tracks, language, "DUB")}.{video.fmt}'
+            outputs = [self.output / output_filename]
+            signature = await self.__signature(
+                [video.abs_path, *(track.abs_path for track in tracks)],
+                ['add_audiotracks', audiotrack_shift, language, self.settings.AUDIOTRACK_MAKE_DEFAULT],
+            )
+            if await self.__is_current(outputs, signature):
+                batch.finish(video)
+                await self.__journal_update(batch_id, position, JobStatus.DONE, outputs=outputs)
+                if on_success is not None:
+                    await on_success(video, result=f'Файл {output_filename} не изменился, пропущен')
+                return
+
+            # номера новых дорожек зависят от числа аудиопотоков в видео и в каждом из добавляемых файлов
+            f_info = (await self.info([video], job=job)).get(video.index)
+            if f_info is None:
+                batch.finish(video)
+                if not job.cancelled:
+                    await self.__journal_update(batch_id, position, JobStatus.FAILED, error='metadata')
+                if on_error is not None and not job.cancelled:
+                    await on_error(video, result='Ошибка чтения метаданных')
+                return
+            await self.__track(video, batch, on_progress, job, f_info=f_info)
+            await self.__journal_update(batch_id, position, JobStatus.RUNNING, outputs=outputs)
 
-            output_filename = f'{video.name} [RUS SUB].{video.fmt}'
             command = [
                 self.__ffmpeg,
-                '-y',                                   # автозамена существующих файлов
-                '-i', str(video.abs_path),              # первый инпут-файл (видео)
-                '-itsoffset', str(subtitle_shift),      # сдвиг субтитров
-                '-i', str(subtitle.abs_path),           # второй инпут-файл (субтитры)
-                '-c', 'copy',                           # копирование всех потоков без перекодирования
-                '-map', '0',                            # выбор всех потоков видеофайла
-                '-map', '1',                            # выбор всех потоков из файла субтитров
-                '-metadata:s:s:0', 'language=rus',      # указание языка для первой дорожки субтитров
-                '-metadata:s:s:0', 'title="RUS"',       # указание заголовка для первой дорожки субтитров
-                self.output / output_filename,
+                '-y',
+                '-i', str(video.abs_path),
             ]
-            proc = Popen(
-                command,
-                stdout=self.stdout,
-                stderr=self.stderr,
+            for track in tracks:
+                command += ['-itsoffset', str(audiotrack_shift), '-i', str(track.abs_path)]
+            command += ['-map', '0']
+            command += [arg for i in range(1, len(tracks) + 1) for arg in ('-map', f'{i}:a')]
+            command += ['-c', 'copy']
+
+            first_added = len(f_info.get_streams_of_type(StreamType.AUDIO))
+            n = first_added
+            for track in tracks:
+                # дорожка без метаданных считается одним аудиопотоком
+                t_info = (await self.info([track], job=job)).get(track.index)
+                streams = (len(t_info.get_streams_of_type(StreamType.AUDIO)) if t_info is not None else 0) or 1
+                title = track_title(video, track)
+                # язык из имени файла ("Ep01.eng.mka"), иначе - общий язык операции
+                track_lang = track_language(track, language)
+                for _ in range(streams):
+                    command += [
+                        f'-metadata:s:a:{n}', f'language={track_lang}',
+                        f'-metadata:s:a:{n}', f'title={title}',
+                    ]
+                    n += 1
+            if self.settings.AUDIOTRACK_MAKE_DEFAULT:
+                for i in range(n):
+                    command += [f'-disposition:a:{i}', 'default' if i == first_added else '0']
+            command.append(self.output / output_filename)
+
+            proc = await self.__run(
+                command, job, video, batch, on_progress,
+                outputs=outputs,
+                timeout=self.settings.JOB_TIMEOUT_SECONDS,
             )
-            out, err = proc.communicate()
-            proc.wait()
-            if proc.returncode == 0 and on_success is not None:
-                await on_success(video, result=f'Создан файл {output_filename}')
-            if proc.returncode != 0 and on_error is not None:
-                print(f'ERROR!! {err.decode('utf-8')}')
-                await on_error(video, result=f'Ошибка добавления субтитров')
-
-    def add_audiotracks(self, videos: list[FileItem], audiotracks: list[FileItem]) -> None:
-        # TODO
-        pass
+            await self.__journal_update(batch_id, position, JobStatus.DONE if proc.ok else JobStatus.FAILED)
+            if proc.ok:
+                await self.__record(outputs, signature)
+            if proc.ok and on_success is not None:
+                await on_success(video, result=f'Создан файл {output_filename} (аудиодорожек: {len(tracks)})')
+            if not proc.ok and on_error is not None:
+                await on_error(video, result=self.__error_message(proc, job, 'Ошибка добавления аудиодорожек'))
+
+        await run_pooled(groups, add, limit=self.settings.MAX_CONCURRENT_REMUXES)
+        await self.__journal_finish(batch_id)
+        return job
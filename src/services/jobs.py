@@ -0,0 +1,77 @@
+import threading
+from dataclasses import dataclass
+from subprocess import Popen
+from typing import Iterator
+
+
+class Job:
+    """
+    Дескриптор операции ``FFmpeg``, выполняемой над множеством файлов.
+    Позволяет отменить операцию: еще не начатые файлы пропускаются, запущенные процессы завершаются
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__processes: set[Popen] = set()
+        self.__cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.__cancelled.is_set()
+
+    def cancel(self) -> None:
+        """ Отменяет операцию, завершая все запущенные ею процессы """
+        self.__cancelled.set()
+        with self.__lock:
+            for proc in self.__processes:
+                proc.terminate()
+
+    def attach(self, proc: Popen) -> None:
+        """ Регистрирует запущенный процесс. Если операция уже отменена - сразу завершает его """
+        with self.__lock:
+            self.__processes.add(proc)
+            if self.cancelled:
+                proc.terminate()
+
+    def detach(self, proc: Popen) -> None:
+        with self.__lock:
+            self.__processes.discard(proc)
+
+    def wait_cancelled(self, timeout: float) -> bool:
+        """
+        Блокирует поток на ``timeout`` секунд либо до отмены операции
+        :return: ``True``, если операция была отменена
+        """
+        return self.__cancelled.wait(timeout)
+
+
+@dataclass
+class RetryPolicy:
+    """ Политика повторного запуска процессов, завершившихся из-за временных сбоев """
+    attempts: int = 0
+    delay: float = 1.0
+    backoff: float = 2.0
+    # фрагменты stderr, указывающие на сбой ввода-вывода (например, сетевого диска), а не на ошибку в данных
+    transient_errors: tuple[str, ...] = (
+        'Input/output error',
+        'Resource temporarily unavailable',
+        'Connection reset',
+        'Connection timed out',
+        'Network is unreachable',
+        'Stale file handle',
+    )
+
+    def is_transient(self, stderr: bytes) -> bool:
+        """
+        Можно ли рассчитывать, что повторный запуск пройдет успешно.
+        Превышение времени ожидания временным сбоем не считается: повтор упрется в тот же предел
+        """
+        text = stderr.decode('utf-8', errors='replace')
+        return any(error in text for error in self.transient_errors)
+
+    def delays(self) -> Iterator[float]:
+        """ Паузы перед каждой из повторных попыток """
+        delay = self.delay
+        for _ in range(self.attempts):
+            yield delay
+            delay *= self.backoff
@@ -0,0 +1,177 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from src.schemas import JobStatus, JournalEntry, JournalBatch
+
+
+def partial_path(output: Path) -> Path:
+    """
+    Временное имя, под которым ffmpeg пишет результат до успешного завершения.
+    Расширение сохраняется, чтобы ffmpeg по нему определял формат
+    """
+    return output.with_name(f'.{output.stem}.partial{output.suffix}')
+
+
+def commit_partial(output: Path) -> None:
+    """ Атомарно переименовывает временный файл в результирующий """
+    partial = partial_path(output)
+    if partial.exists():
+        os.replace(partial, output)
+
+
+class JobJournal:
+    """
+    Журнал операций ``FFmpeg`` на SQLite, переживающий падение приложения.
+    Для каждого файла операции хранится состояние (в очереди, выполняется, готово, ошибка)
+    и результирующие файлы. Завершенные операции удаляются из журнала, поэтому оставшиеся в нем
+    операции, начатые не текущим процессом, были прерваны и могут быть продолжены
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        """
+        :param path: путь к файлу базы данных
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.__lock = threading.Lock()
+        # операции текущего процесса: пока они выполняются, они не считаются прерванными
+        self.__own: set[int] = set()
+        self.__db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        # в режиме WAL изменения переживают падение процесса и без fsync на каждой записи;
+        # при отключении питания теряются лишь последние состояния, и такие файлы просто обрабатываются заново
+        self.__db.execute('PRAGMA synchronous=NORMAL')
+        self.__db.execute('PRAGMA foreign_keys=ON')
+        self.__db.execute(
+            'CREATE TABLE IF NOT EXISTS batches ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'operation TEXT NOT NULL, '
+            'params TEXT NOT NULL, '
+            'output TEXT NOT NULL, '
+            'created REAL NOT NULL)'
+        )
+        self.__db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'batch_id INTEGER NOT NULL REFERENCES batches (id) ON DELETE CASCADE, '
+            'position INTEGER NOT NULL, '
+            'inputs TEXT NOT NULL, '
+            'status TEXT NOT NULL, '
+            'outputs TEXT NOT NULL, '
+            'error TEXT, '
+            'updated REAL NOT NULL, '
+            'PRIMARY KEY (batch_id, position))'
+        )
+
+    def begin(self, operation: str, params: dict[str, Any], output: Path, inputs: list[list[Path]]) -> int:
+        """
+        Записывает новую операцию, все ее файлы - в очереди
+        :param operation: имя метода ``FFmpeg``
+        :param params: параметры, необходимые для продолжения операции (сериализуемые в JSON)
+        :param output: каталог результатов
+        :param inputs: входные файлы для каждой позиции операции
+        :return: идентификатор операции в журнале
+        """
+        now = time.time()
+        with self.__lock:
+            self.__db.execute('BEGIN')
+            try:
+                cursor = self.__db.execute(
+                    'INSERT INTO batches (operation, params, output, created) VALUES (?, ?, ?, ?)',
+                    (operation, json.dumps(params, ensure_ascii=False), str(output), now),
+                )
+                batch_id = cursor.lastrowid
+                self.__db.executemany(
+                    'INSERT INTO entries (batch_id, position, inputs, status, outputs, updated) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [
+                        (batch_id, position, json.dumps([str(p) for p in paths], ensure_ascii=False),
+                         JobStatus.QUEUED.value, '[]', now)
+                        for position, paths in enumerate(inputs)
+                    ],
+                )
+                self.__db.execute('COMMIT')
+            except BaseException:
+                self.__db.execute('ROLLBACK')
+                raise
+            self.__own.add(batch_id)
+        return batch_id
+
+    def update(
+            self,
+            batch_id: int,
+            position: int,
+            status: JobStatus,
+            outputs: list[Path] | None = None,
+            error: str | None = None,
+    ) -> None:
+        """ Меняет состояние файла операции. ``outputs`` сохраняются, если переданы """
+        with self.__lock:
+            if outputs is None:
+                self.__db.execute(
+                    'UPDATE entries SET status = ?, error = ?, updated = ? WHERE batch_id = ? AND position = ?',
+                    (status.value, error, time.time(), batch_id, position),
+                )
+            else:
+                self.__db.execute(
+                    'UPDATE entries SET status = ?, outputs = ?, error = ?, updated = ? '
+                    'WHERE batch_id = ? AND position = ?',
+                    (status.value, json.dumps([str(p) for p in outputs], ensure_ascii=False), error,
+                     time.time(), batch_id, position),
+                )
+
+    def finish(self, batch_id: int) -> None:
+        """ Удаляет завершенную операцию из журнала """
+        with self.__lock:
+            self.__db.execute('DELETE FROM batches WHERE id = ?', (batch_id,))
+            self.__own.discard(batch_id)
+
+    def discard(self, batch_id: int) -> None:
+        """ Удаляет прерванную операцию из журнала вместе с недописанными ею файлами """
+        for batch in self.interrupted():
+            if batch.id != batch_id:
+                continue
+            for entry in batch.pending:
+                for output in entry.outputs:
+                    partial_path(output).unlink(missing_ok=True)
+        self.finish(batch_id)
+
+    def interrupted(self, operation: str | None = None) -> list[JournalBatch]:
+        """
+        Возвращает операции, прерванные в предыдущих запусках приложения
+        :param operation: только операции с этим именем
+        """
+        with self.__lock:
+            batches = self.__db.execute(
+                'SELECT id, operation, params, output, created FROM batches ORDER BY id',
+            ).fetchall()
+            rows = self.__db.execute(
+                'SELECT batch_id, position, inputs, status, outputs, error FROM entries ORDER BY batch_id, position',
+            ).fetchall()
+            own = set(self.__own)
+
+        entries: dict[int, list[JournalEntry]] = {}
+        for batch_id, position, inputs, status, outputs, error in rows:
+            entries.setdefault(batch_id, []).append(JournalEntry(
+                position=position,
+                inputs=[Path(p) for p in json.loads(inputs)],
+                status=JobStatus(status),
+                outputs=[Path(p) for p in json.loads(outputs)],
+                error=error,
+            ))
+        return [
+            JournalBatch(
+                id=batch_id,
+                operation=name,
+                params=json.loads(params),
+                output=Path(output),
+                entries=entries.get(batch_id, []),
+                created=created,
+            )
+            for batch_id, name, params, output, created in batches
+            if batch_id not in own and (operation is None or name == operation)
+        ]
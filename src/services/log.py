@@ -0,0 +1,84 @@
+import logging
+import queue
+from collections import deque
+from logging.handlers import QueueListener, RotatingFileHandler
+from pathlib import Path
+
+from src.schemas import LogEntry, LogStatus
+
+_LEVELS = {
+    LogStatus.INFO: logging.INFO,
+    LogStatus.SUCCESS: logging.INFO,
+    LogStatus.ERROR: logging.ERROR,
+}
+
+
+class LogSpill:
+    """
+    Асинхронная запись журнала в ротируемый файл.
+    Запись на диск выполняется в фоновом потоке, вызывающий поток только кладет запись в очередь
+    """
+
+    def __init__(self, path: Path | str, max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3) -> None:
+        """
+        :param path: путь к файлу журнала
+        :param max_bytes: размер файла, по достижении которого он ротируется
+        :param backup_count: сколько ротированных файлов хранить
+        """
+        self.__handler = RotatingFileHandler(
+            path,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding='utf-8',
+            delay=True,
+        )
+        self.__handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        self.__queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        self.__listener = QueueListener(self.__queue, self.__handler)
+        self.__listener.start()
+
+    def write(self, entry: LogEntry) -> None:
+        level = _LEVELS[entry.status]
+        self.__queue.put(logging.makeLogRecord({
+            'msg': entry.as_text(),
+            'levelno': level,
+            'levelname': logging.getLevelName(level),
+            'created': entry.created,
+        }))
+
+    def close(self) -> None:
+        """ Дописывает оставшиеся в очереди записи и закрывает файл """
+        self.__listener.stop()
+        self.__handler.close()
+
+
+class LogBuffer:
+    """ Кольцевой буфер записей журнала: хранятся только последние ``max_entries`` записей """
+
+    def __init__(self, max_entries: int = 2000, spill: LogSpill | None = None) -> None:
+        """
+        :param max_entries: максимальное число хранимых записей
+        :param spill: куда дублировать записи для долгого хранения
+        """
+        self.entries: deque[LogEntry] = deque(maxlen=max_entries)
+        self.spill = spill
+
+    def append(self, entry: LogEntry) -> LogEntry | None:
+        """
+        Добавляет запись
+        :return: вытесненная из буфера запись, если буфер был заполнен
+        """
+        evicted = self.entries[0] if len(self.entries) == self.entries.maxlen else None
+        self.entries.append(entry)
+        if self.spill is not None:
+            self.spill.write(entry)
+        return evicted
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
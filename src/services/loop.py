@@ -0,0 +1,117 @@
+import queue
+from threading import Event, Thread
+from typing import Any, Awaitable, Callable, Iterable, Protocol, TypeVar
+
+import asyncgui
+
+T = TypeVar('T')
+
+
+class Scheduler(Protocol):
+    def __call__(self, callback: Callable[[], None]) -> None:
+        """ Планирует вызов ``callback`` в главном потоке приложения """
+        ...
+
+
+_scheduler: Scheduler | None = None
+
+
+def set_scheduler(scheduler: Scheduler) -> None:
+    """ Задает способ вернуть управление в главный поток (по умолчанию - через ``kivy.clock.Clock``) """
+    global _scheduler
+    _scheduler = scheduler
+
+
+def call_soon(callback: Callable[[], None]) -> None:
+    """ Потокобезопасно планирует вызов ``callback`` в главном потоке приложения """
+    if _scheduler is None:
+        # сервисы могут работать и без GUI, поэтому Kivy импортируется, только если цикл не задан явно
+        from kivy.clock import Clock
+        set_scheduler(lambda cb: Clock.schedule_once(lambda dt: cb()))
+    _scheduler(callback)
+
+
+async def run_in_thread(func: Callable[[], T], daemon: bool = True) -> T:
+    """
+    Выполняет ``func`` в отдельном потоке и дожидается результата, не блокируя главный цикл.
+    Выполнение корутины продолжается в главном потоке
+    """
+    box = asyncgui.AsyncBox()
+
+    def target() -> None:
+        result, exc = None, None
+        try:
+            result = func()
+        except Exception as e:
+            exc = e
+        call_soon(lambda: box.put(result, exc))
+
+    Thread(target=target, daemon=daemon).start()
+    (result, exc), _ = await box.get()
+    if exc is not None:
+        raise exc
+    return result
+
+
+async def stream_from_thread(produce: Callable[[], Iterable[T]], consume: Callable[[T], None]) -> None:
+    """
+    Перебирает ``produce()`` в отдельном потоке, передавая каждый элемент в ``consume`` в главном потоке.
+    Завершается, когда перебор окончен. При отмене корутины перебор останавливается
+    на следующем элементе, а еще не доставленные элементы отбрасываются
+    :param produce: возвращает итерируемый объект, перебор которого может быть долгим (например, обход каталога)
+    :param consume: вызывается в главном потоке для каждого элемента
+    """
+    stopped = Event()
+
+    def deliver(item: T) -> None:
+        if not stopped.is_set():
+            consume(item)
+
+    def target() -> None:
+        for item in produce():
+            if stopped.is_set():
+                return
+            call_soon(lambda i=item: deliver(i))
+
+    try:
+        # завершение потока также передается через call_soon, поэтому все элементы доставлены раньше
+        await run_in_thread(target)
+    finally:
+        stopped.set()
+
+
+class HeadlessLoop:
+    """ Минимальный главный цикл для запуска сервисов без Kivy """
+
+    def __init__(self) -> None:
+        self.__callbacks: queue.SimpleQueue[Callable[[], None]] = queue.SimpleQueue()
+
+    def __call__(self, callback: Callable[[], None]) -> None:
+        self.__callbacks.put(callback)
+
+    def __process_next(self) -> None:
+        try:
+            # ожидание с таймаутом, чтобы Ctrl+C обрабатывался и на Windows
+            callback = self.__callbacks.get(timeout=0.5)
+        except queue.Empty:
+            return
+        callback()
+
+    def run(self, aw: Awaitable[T], on_interrupt: Callable[[], None] | None = None) -> T | Any:
+        """
+        Выполняет корутину до завершения, обрабатывая запланированные из фоновых потоков вызовы
+        :param aw: корутина
+        :param on_interrupt: вызывается при ``KeyboardInterrupt``, после чего цикл продолжает работу,
+            пока корутина не завершится
+        :return: результат корутины
+        """
+        set_scheduler(self)
+        task = asyncgui.start(aw)
+        while not (task.finished or task.cancelled):
+            try:
+                self.__process_next()
+            except KeyboardInterrupt:
+                if on_interrupt is None:
+                    raise
+                on_interrupt()
+        return task.result
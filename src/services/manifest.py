@@ -0,0 +1,95 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Iterable
+
+
+class BuildManifest:
+    """
+    Манифест результатов ``FFmpeg`` на SQLite (по аналогии с системами сборки).
+    Для каждого результирующего файла хранится подпись - входные файлы (путь, размер, время модификации)
+    и параметры операции. Пока подпись совпадает, а сам результат не изменялся, повторная обработка не нужна
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        """
+        :param path: путь к файлу базы данных
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute(
+            'CREATE TABLE IF NOT EXISTS outputs ('
+            'path TEXT PRIMARY KEY, '
+            'signature TEXT NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL)'
+        )
+
+    @staticmethod
+    def signature(inputs: Iterable[Path], params: Any) -> str | None:
+        """
+        Вычисляет подпись операции
+        :param inputs: входные файлы
+        :param params: параметры операции (любые данные, сериализуемые в JSON)
+        :return: подпись либо ``None``, если какой-либо из входных файлов недоступен
+        """
+        identities = []
+        try:
+            for path in inputs:
+                path = path.resolve()
+                stat = path.stat()
+                identities.append((str(path), stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            return None
+        payload = json.dumps([identities, params], ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def is_current(self, outputs: Iterable[Path], signature: str) -> bool:
+        """ Все ли результаты существуют, не изменялись и получены операцией с подписью ``signature`` """
+        outputs = list(outputs)
+        if not outputs:
+            return False
+        for output in outputs:
+            try:
+                output = output.resolve()
+                stat = output.stat()
+            except OSError:
+                return False
+            with self.__lock:
+                row = self.__db.execute(
+                    'SELECT signature, size, mtime_ns FROM outputs WHERE path = ?', (str(output),),
+                ).fetchone()
+            if row != (signature, stat.st_size, stat.st_mtime_ns):
+                return False
+        return True
+
+    def record(self, outputs: Iterable[Path], signature: str) -> None:
+        """ Запоминает, что результаты получены операцией с подписью ``signature`` """
+        rows = []
+        for output in outputs:
+            try:
+                output = output.resolve()
+                stat = output.stat()
+            except OSError:
+                continue
+            rows.append((str(output), signature, stat.st_size, stat.st_mtime_ns))
+        with self.__lock:
+            self.__db.executemany(
+                'INSERT OR REPLACE INTO outputs (path, signature, size, mtime_ns) VALUES (?, ?, ?, ?)', rows,
+            )
+
+    def forget(self, outputs: Iterable[Path]) -> None:
+        """ Удаляет записи о результатах """
+        with self.__lock:
+            self.__db.executemany(
+                'DELETE FROM outputs WHERE path = ?', [(str(output.resolve()),) for output in outputs],
+            )
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__db.execute('DELETE FROM outputs')
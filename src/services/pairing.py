@@ -0,0 +1,202 @@
+import re
+from typing import NamedTuple
+
+from src.schemas import FileItem
+
+# символы, которыми подпись дорожки обычно отделена от имени видео: "Ep01.AniDub.mka", "Ep01 [AniDub].mka"
+NAME_SEPARATORS = ' ._-[('
+# двухбуквенные и альтернативные коды языков -> ISO 639-2, как их записывает ffmpeg
+LANGUAGE_ALIASES: dict[str, str] = {
+    'ru': 'rus', 'en': 'eng', 'ja': 'jpn', 'jp': 'jpn', 'uk': 'ukr', 'ua': 'ukr',
+    'de': 'ger', 'deu': 'ger', 'fr': 'fre', 'fra': 'fre', 'es': 'spa', 'it': 'ita',
+    'zh': 'chi', 'zho': 'chi', 'ko': 'kor', 'pt': 'por', 'pl': 'pol',
+}
+KNOWN_LANGUAGES = frozenset({*LANGUAGE_ALIASES, *LANGUAGE_ALIASES.values()})
+
+# суффикс, с которым субтитры сохраняет extract_subtitles: "Ep01 (eng--Full)", "Ep01 (eng)", "Ep01 (eng--Full-3)"
+_EXTRACTED_SUFFIX = re.compile(r'\s*\((?P<language>[^()\-]+?)(?:--(?P<title>[^()]+?))?(?:-\d+)?\)$')
+# суффикс-код языка: "Ep01.rus", "Ep01_en"
+_LANGUAGE_SUFFIX = re.compile(r'[ ._\-](?P<language>[a-z]{2,3})$', re.IGNORECASE)
+_BRACKETS = re.compile(r'\[[^\]]*]|\([^)]*\)|\{[^}]*}')
+_SEPARATORS = re.compile(r'[\s._\-]+')
+# "_" - символ слова для \b, поэтому перед поиском номера серии заменяется пробелом, как и точка
+_WORD_SEPARATORS = re.compile(r'[._]+')
+_EPISODE_PATTERNS = (
+    re.compile(r's(?P<season>\d{1,2})\s*e(?P<episode>\d{1,4})', re.IGNORECASE),
+    re.compile(r'\b(?P<season>\d{1,2})x(?P<episode>\d{2,3})\b', re.IGNORECASE),
+    re.compile(r'\b(?:ep?|episode|серия)\s*\.?\s*(?P<episode>\d{1,4})\b', re.IGNORECASE),
+    re.compile(r'\s-\s(?P<episode>\d{1,4})(?:v\d)?\b'),
+    # последнее отдельно стоящее число (не год и не разрешение)
+    re.compile(r'.*\b(?P<episode>\d{1,3})(?:v\d)?\b'),
+)
+
+
+class TrackName(NamedTuple):
+    """ Имя файла дорожки, разобранное на имя видео и суффикс языка """
+    stem: str
+    language: str | None = None
+    title: str | None = None
+
+
+class Episode(NamedTuple):
+    season: int | None
+    number: int
+
+
+def parse_track_name(name: str) -> TrackName:
+    """ Отделяет от имени файла суффикс языка ("Ep01 (eng--Full)", "Ep01.rus") """
+    match = _EXTRACTED_SUFFIX.search(name)
+    if match is not None:
+        language = match.group('language').strip().casefold()
+        if language in KNOWN_LANGUAGES:
+            return TrackName(name[:match.start()], LANGUAGE_ALIASES.get(language, language), match.group('title'))
+    match = _LANGUAGE_SUFFIX.search(name)
+    if match is not None:
+        language = match.group('language').casefold()
+        if language in KNOWN_LANGUAGES:
+            return TrackName(name[:match.start()], LANGUAGE_ALIASES.get(language, language))
+    return TrackName(name)
+
+
+def track_language(track: FileItem, default: str) -> str:
+    """ Язык дорожки из суффикса имени файла (см. ``parse_track_name``), если он не указан - ``default`` """
+    return parse_track_name(track.name).language or default
+
+
+def language_tag(tracks: list[FileItem], default: str, kind: str) -> str:
+    """
+    Пометка для имени результата о добавленных дорожках: " [RUS SUB]", " [ENG+RUS SUB]"
+    :param tracks: дорожки, действительно добавленные к видео
+    :param default: язык дорожек, в имени которых язык не указан
+    :param kind: вид дорожек (``SUB``, ``DUB``)
+    :return: пустая строка, если дорожек нет
+    """
+    languages = dict.fromkeys(track_language(track, default).upper() for track in tracks)
+    return f' [{"+".join(languages)} {kind}]' if languages else ''
+
+
+def normalize_name(name: str) -> str:
+    """ Имя без тегов в скобках ("[SubsPlease]", "(1080p)"), регистра и разделителей """
+    name = _BRACKETS.sub(' ', name.casefold())
+    return _SEPARATORS.sub(' ', name).strip()
+
+
+def parse_episode(name: str) -> Episode | None:
+    """ Номер серии из имени файла: "S01E05", "1x05", "Ep 5", "Show - 05" либо последнее число в имени """
+    name = _WORD_SEPARATORS.sub(' ', _BRACKETS.sub(' ', name))
+    for pattern in _EPISODE_PATTERNS:
+        match = pattern.search(name)
+        if match is not None:
+            season = match.groupdict().get('season')
+            return Episode(int(season) if season is not None else None, int(match.group('episode')))
+    return None
+
+
+def _find_by_prefix(name: str, videos: dict[str, FileItem]) -> FileItem | None:
+    """ Видео, имя которого совпадает с ``name`` либо является самым длинным его префиксом до разделителя """
+    video = videos.get(name)
+    if video is not None:
+        return video
+    for i in range(len(name) - 1, 0, -1):
+        if name[i] in NAME_SEPARATORS:
+            video = videos.get(name[:i])
+            if video is not None:
+                return video
+    return None
+
+
+class _VideoIndex:
+    """ Словари для поиска видео по имени, нормализованному имени и номеру серии """
+
+    def __init__(self, videos: list[FileItem]) -> None:
+        self.by_name: dict[str, FileItem] = {}
+        self.by_normalized: dict[str, FileItem] = {}
+        self.by_episode: dict[Episode, FileItem | None] = {}
+        # номер серии без сезона; None - номер неоднозначен (например, серии разных сезонов)
+        self.by_number: dict[int, FileItem | None] = {}
+        for video in videos:
+            self.by_name.setdefault(video.name.casefold(), video)
+            self.by_normalized.setdefault(normalize_name(video.name), video)
+            episode = parse_episode(video.name)
+            if episode is None:
+                continue
+            self.by_episode[episode] = None if episode in self.by_episode else video
+            self.by_number[episode.number] = None if episode.number in self.by_number else video
+
+    def find(self, track: FileItem) -> FileItem | None:
+        name = track.name.casefold()
+        video = _find_by_prefix(name, self.by_name)
+        if video is not None:
+            return video
+        stem = parse_track_name(track.name).stem
+        video = self.by_name.get(stem.casefold()) or self.by_normalized.get(normalize_name(stem))
+        if video is not None:
+            return video
+        episode = parse_episode(stem)
+        if episode is None:
+            return None
+        if episode.season is not None and self.by_episode.get(episode) is not None:
+            return self.by_episode[episode]
+        return self.by_episode.get(Episode(None, episode.number)) or self.by_number.get(episode.number)
+
+
+def pair_tracks(videos: list[FileItem], tracks: list[FileItem]) -> list[tuple[FileItem, list[FileItem]]]:
+    """
+    Сопоставляет видеофайлам внешние дорожки (к одному видео может относиться несколько дорожек).
+    Дорожка относится к видео, если (в порядке приоритета):
+
+    - ее имя совпадает с именем видео либо начинается с него и разделителя ("Ep01.AniDub.mka");
+    - совпадают имена без суффикса языка, тегов в скобках и разделителей ("[Group] Show - 01 (eng).ass");
+    - совпадает номер серии ("S01E05", "Show - 05").
+
+    Если ни одна дорожка не сопоставлена, дорожки сопоставляются видео с тем же порядковым номером.
+    Словари строятся один раз, поэтому время работы линейно по числу файлов
+    :param videos: данные видеофайлов
+    :param tracks: данные файлов дорожек
+    :return: пары видео - дорожки в порядке ``videos``
+    """
+    index = _VideoIndex(videos)
+    groups: dict[int, list[FileItem]] = {id(video): [] for video in videos}
+
+    matched = False
+    for track in tracks:
+        video = index.find(track)
+        if video is not None:
+            groups[id(video)].append(track)
+            matched = True
+
+    if not matched:
+        by_index = {video.index: video for video in videos if video.index is not None}
+        for track in tracks:
+            video = by_index.get(track.index)
+            if video is not None:
+                groups[id(video)].append(track)
+
+    return [(video, groups[id(video)]) for video in videos]
+
+
+def unpaired_tracks(pairs: list[tuple[FileItem, list[FileItem]]], tracks: list[FileItem]) -> list[FileItem]:
+    """ Дорожки, не сопоставленные ни одному видео """
+    paired = {id(track) for _, group in pairs for track in group}
+    return [track for track in tracks if id(track) not in paired]
+
+
+def track_title(video: FileItem, track: FileItem) -> str:
+    """
+    Подпись дорожки: часть имени после имени видео ("Ep01 [AniDub]" -> "AniDub"),
+    если ее нет - имя каталога дорожки (озвучки часто раскладывают по каталогам студий)
+    """
+    if not track.name.casefold().startswith(video.name.casefold()):
+        return track.name
+    title = track.name[len(video.name):].strip(NAME_SEPARATORS + ')]')
+    return title or track.abs_path.parent.name
+
+
+def describe_pairs(pairs: list[tuple[FileItem, list[FileItem]]], tracks: list[FileItem]) -> list[str]:
+    """ Строки с предлагаемыми парами для показа пользователю перед запуском операции """
+    lines = [
+        f'{video.fullname} <- {", ".join(track.fullname for track in group)}'
+        for video, group in pairs if group
+    ]
+    lines += [f'Без пары: {track.fullname}' for track in unpaired_tracks(pairs, tracks)]
+    return lines
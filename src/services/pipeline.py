@@ -0,0 +1,101 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+from settings import Defaults, EncoderPreset
+from src.schemas import FileItem
+from .pairing import language_tag
+
+
+@dataclass
+class Pipeline:
+    """
+    Операции над видеофайлами, выполняемые одним процессом ffmpeg на каждое видео:
+    исходный файл читается один раз, на диск пишется только итоговый результат.
+    Операции добавляются цепочкой и выполняются ``FFmpeg.run_pipeline``::
+
+        Pipeline().convert('mp4', preset).add_subtitles(subtitles, shift=1.5).add_audiotracks(dubs)
+    """
+    # формат результата, None - формат исходного видео
+    output_format: str | None = None
+    # параметры перекодирования несовместимых с контейнером потоков, None - только копирование
+    preset: EncoderPreset | None = None
+    subtitles: list[FileItem] = field(default_factory=list)
+    subtitle_shift: float = 0
+    subtitle_language: str = 'rus'
+    audiotracks: list[FileItem] = field(default_factory=list)
+    audiotrack_shift: float = 0
+    # None - FFmpegSettings.AUDIOTRACK_LANGUAGE
+    audiotrack_language: str | None = None
+
+    def convert(self, output_format: str, preset: EncoderPreset | None = None) -> 'Pipeline':
+        """ Перепаковать видео в контейнер ``output_format``, перекодируя несовместимые потоки согласно ``preset`` """
+        self.output_format = output_format
+        self.preset = preset
+        return self
+
+    def add_subtitles(self, subtitles: list[FileItem], shift: float = 0, language: str = 'rus') -> 'Pipeline':
+        """ Добавить к видео субтитры (сопоставляются с видео так же, как аудиодорожки - см. ``pair_tracks``) """
+        self.subtitles = subtitles
+        self.subtitle_shift = shift
+        self.subtitle_language = language
+        return self
+
+    def add_audiotracks(
+            self,
+            audiotracks: list[FileItem],
+            shift: float = 0,
+            language: str | None = None,
+    ) -> 'Pipeline':
+        """ Добавить к видео внешние аудиодорожки """
+        self.audiotracks = audiotracks
+        self.audiotrack_shift = shift
+        self.audiotrack_language = language
+        return self
+
+    def output_filename(
+            self,
+            video: FileItem,
+            subtitles: list[FileItem],
+            audiotracks: list[FileItem],
+            audiotrack_language: str,
+    ) -> str:
+        """
+        Имя результата: имя видео с пометками о языках добавленных дорожек (см. ``language_tag``)
+        :param video: данные видеофайла
+        :param subtitles: субтитры, добавляемые к этому видео
+        :param audiotracks: аудиодорожки, добавляемые к этому видео
+        :param audiotrack_language: язык аудиодорожек, в имени файла которых язык не указан
+        """
+        name = video.name
+        name += language_tag(subtitles, self.subtitle_language, 'SUB')
+        name += language_tag(audiotracks, audiotrack_language, 'DUB')
+        return f'{name}.{self.output_format or video.fmt}'
+
+    def params(self) -> dict[str, Any]:
+        """ Параметры цепочки без входных файлов (сериализуемые в JSON), например, для журнала операций """
+        return {
+            'output_format': self.output_format,
+            'preset': self.preset.model_dump() if self.preset is not None else None,
+            'subtitle_shift': self.subtitle_shift,
+            'subtitle_language': self.subtitle_language,
+            'audiotrack_shift': self.audiotrack_shift,
+            'audiotrack_language': self.audiotrack_language,
+        }
+
+    @classmethod
+    def from_params(cls, params: dict[str, Any], tracks: list[FileItem]) -> 'Pipeline':
+        """
+        Восстанавливает цепочку по ``params()``
+        :param tracks: добавляемые файлы - субтитры и аудиодорожки различаются по формату
+        """
+        preset = params.get('preset')
+        return cls(
+            output_format=params.get('output_format'),
+            preset=EncoderPreset(**preset) if preset is not None else None,
+            subtitles=[t for t in tracks if t.fmt in Defaults.subtitle_supported_formats],
+            subtitle_shift=params.get('subtitle_shift', 0),
+            subtitle_language=params.get('subtitle_language', 'rus'),
+            audiotracks=[t for t in tracks if t.fmt not in Defaults.subtitle_supported_formats],
+            audiotrack_shift=params.get('audiotrack_shift', 0),
+            audiotrack_language=params.get('audiotrack_language'),
+        )
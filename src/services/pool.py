@@ -0,0 +1,27 @@
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+import asyncgui
+
+T = TypeVar('T')
+
+
+async def run_pooled(
+        items: Iterable[T],
+        job: Callable[[T], Awaitable[None]],
+        limit: int = 1,
+) -> None:
+    """
+    Выполняет ``job`` для каждого элемента ``items``, не более ``limit`` одновременно.
+    Порядок завершения задач не гарантируется
+    :param items: элементы для обработки
+    :param job: корутина, обрабатывающая один элемент
+    :param limit: максимальное число одновременно выполняемых задач
+    """
+    queue = iter(items)
+
+    async def worker() -> None:
+        # все воркеры разбирают общий итератор, пока он не опустеет
+        for item in queue:
+            await job(item)
+
+    await asyncgui.wait_all(*(worker() for _ in range(max(1, limit))))
@@ -0,0 +1,110 @@
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from subprocess import Popen, PIPE
+from threading import Event, Thread, Timer
+from typing import Callable
+
+from .jobs import Job
+from .loop import call_soon, run_in_thread
+
+# сколько последних строк stderr хранить, когда вывод процесса читается построчно
+STDERR_TAIL_LINES = 200
+
+
+@dataclass
+class ProcessResult:
+    """ Результат работы внешнего процесса """
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+
+def _read_progress(proc: Popen, on_progress: Callable[[dict[str, str]], None]) -> None:
+    """
+    Построчно читает вывод ``ffmpeg -progress pipe:1``.
+    Каждый завершенный блок ``key=value`` передается в ``on_progress`` в главном потоке
+    """
+    block: dict[str, str] = {}
+    for raw_line in proc.stdout:
+        key, _, value = raw_line.decode('utf-8', errors='replace').strip().partition('=')
+        if not key:
+            continue
+        block[key] = value
+        if key == 'progress':
+            call_soon(lambda b=block: on_progress(b))
+            block = {}
+
+
+def _communicate(proc: Popen, on_progress: Callable[[dict[str, str]], None] | None) -> tuple[bytes, bytes]:
+    if on_progress is None:
+        out, err = proc.communicate()
+        return out or b'', err or b''
+
+    err_tail: deque[bytes] = deque(maxlen=STDERR_TAIL_LINES)
+    err_reader = None
+    if proc.stderr is not None:
+        # stderr вычитывается параллельно, иначе заполненный буфер пайпа остановит ffmpeg
+        err_reader = Thread(target=err_tail.extend, args=(proc.stderr,), daemon=True)
+        err_reader.start()
+    _read_progress(proc, on_progress)
+    proc.wait()
+    if err_reader is not None:
+        err_reader.join()
+    return b'', b''.join(err_tail)
+
+
+async def run_process(
+        command: list[str | Path],
+        stdout=PIPE,
+        stderr=PIPE,
+        on_progress: Callable[[dict[str, str]], None] | None = None,
+        job: Job | None = None,
+        timeout: float | None = None,
+) -> ProcessResult:
+    """
+    Запускает процесс и дожидается его завершения в отдельном потоке,
+    не блокируя главный цикл приложения
+    :param command: команда и ее аргументы
+    :param stdout: куда перенаправлять ``Popen`` stdout
+    :param stderr: куда перенаправлять ``Popen`` stderr
+    :param on_progress: вызывается в главном потоке для каждого блока вывода ``-progress pipe:1``.
+        Если передан, stdout читается построчно, а от stderr сохраняются только последние строки
+    :param job: операция, при отмене которой процесс должен быть завершен
+    :param timeout: ограничение времени работы процесса (в секундах), по истечении - процесс убивается
+    :return: код возврата и вывод процесса
+    """
+    def target() -> ProcessResult:
+        proc = Popen(
+            [str(part) for part in command],
+            stdout=stdout if on_progress is None else PIPE,
+            stderr=stderr,
+        )
+        if job is not None:
+            job.attach(proc)
+        expired = Event()
+
+        def expire() -> None:
+            expired.set()
+            proc.kill()
+
+        timer = Timer(timeout, expire) if timeout else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        try:
+            out, err = _communicate(proc, on_progress)
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if job is not None:
+                job.detach(proc)
+
+        return ProcessResult(proc.returncode, out, err, timed_out=expired.is_set())
+
+    return await run_in_thread(target)
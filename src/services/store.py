@@ -0,0 +1,87 @@
+import copy
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable
+
+import yaml
+
+
+class YamlStore:
+    """
+    Словарь, хранимый в YAML-файле.
+    Изменения применяются в памяти, а на диск записываются в фоновом потоке
+    не чаще раза в ``delay`` секунд (серия изменений - одной записью)
+    """
+
+    def __init__(self, path: Path | str, default: Callable[[], dict[str, Any]], delay: float = 0.5) -> None:
+        """
+        :param path: путь к файлу
+        :param default: возвращает содержимое по умолчанию, если файла нет или он пуст
+        :param delay: сколько секунд ждать новых изменений перед записью
+        """
+        self.path = Path(path)
+        self.delay = delay
+        self.__lock = threading.Lock()
+        # запись на диск сериализуется отдельно, чтобы старый снимок не перезаписал более новый
+        self.__write_lock = threading.Lock()
+        self.__timer: threading.Timer | None = None
+        self.__dirty = False
+        self.data: dict[str, Any] = self.__load(default)
+
+    def __load(self, default: Callable[[], dict[str, Any]]) -> dict[str, Any]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f)
+        except FileNotFoundError:
+            data = None
+        if not data:
+            data = default()
+            self.__write(data)
+        return data
+
+    def set(self, keys: tuple[str, ...], value: Any) -> None:
+        """
+        Задает значение по пути из ключей и планирует запись файла
+        :param keys: путь к значению, например ``('page_settings', 'videoconversion', 'output_dir')``
+        :param value: значение, понятное YAML
+        """
+        with self.__lock:
+            node = self.data
+            for key in keys[:-1]:
+                node = node.setdefault(key, {})
+            node[keys[-1]] = value
+            self.__dirty = True
+            if self.__timer is not None:
+                self.__timer.cancel()
+            self.__timer = threading.Timer(self.delay, self.flush)
+            self.__timer.daemon = True
+            self.__timer.start()
+
+    def flush(self) -> None:
+        """ Немедленно записывает несохраненные изменения """
+        with self.__write_lock:
+            with self.__lock:
+                if self.__timer is not None:
+                    self.__timer.cancel()
+                    self.__timer = None
+                if not self.__dirty:
+                    return
+                snapshot = copy.deepcopy(self.data)
+                self.__dirty = False
+            self.__write(snapshot)
+
+    def __write(self, data: dict[str, Any]) -> None:
+        # пишем во временный файл рядом с целевым и атомарно подменяем его,
+        # чтобы сбой посреди записи не оставил конфиг обрезанным
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f'.{self.path.name}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                yaml.safe_dump(data, f, encoding='utf-8', allow_unicode=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
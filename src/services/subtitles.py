@@ -0,0 +1,347 @@
+import re
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Разбор, сдвиг, масштабирование времени и конвертация субтитров ASS и SRT без запуска ffmpeg.
+# Время событий хранится столбцами (array миллисекунд), а не объектами событий:
+# сдвиг и масштабирование - один проход по столбцу. Субтитры серии (сотни событий) обрабатываются
+# за миллисекунды, файл с десятками тысяч событий - за доли секунды
+
+# кодировки, в которых пробуется прочитать файл (cp1251 декодирует любые байты, поэтому последняя)
+SUBTITLE_ENCODINGS = ('utf-8-sig', 'cp1251')
+# codec_name потока субтитров (ffprobe) -> формат файла, в который поток копируется без перекодирования
+SUBTITLE_CODEC_FORMATS: dict[str, str] = {
+    'ass': 'ass',
+    'ssa': 'ass',
+    'subrip': 'srt',
+    'srt': 'srt',
+}
+
+ASS_EVENT_COLUMNS = ['Layer', 'Start', 'End', 'Style', 'Name', 'MarginL', 'MarginR', 'MarginV', 'Effect', 'Text']
+# заголовок ASS для субтитров, сконвертированных из SRT (как у ffmpeg)
+ASS_DEFAULT_HEADER = [
+    '[Script Info]',
+    'ScriptType: v4.00+',
+    'WrapStyle: 0',
+    'ScaledBorderAndShadow: yes',
+    'PlayResX: 384',
+    'PlayResY: 288',
+    '',
+    '[V4+ Styles]',
+    'Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, '
+    'Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, '
+    'MarginL, MarginR, MarginV, Encoding',
+    'Style: Default,Arial,16,&Hffffff,&Hffffff,&H0,&H0,0,0,0,0,100,100,0,0,1,1,0,2,10,10,10,0',
+    '',
+    '[Events]',
+    f'Format: {", ".join(ASS_EVENT_COLUMNS)}',
+]
+
+_SRT_EVENT = re.compile(
+    r'(?:^|\n)\d+[ \t]*\n'
+    r'(\d+):(\d\d):(\d\d)[,.](\d{1,3})[ \t]*-->[ \t]*(\d+):(\d\d):(\d\d)[,.](\d{1,3})[^\n]*\n'
+    r'(.*?)(?=\n[ \t]*\n|\Z)',
+    re.DOTALL,
+)
+_ASS_TIME = re.compile(r'(\d+):(\d\d):(\d\d)\.(\d\d)')
+_ASS_SIMPLE_TAG = re.compile(r'\{\\([ibu])([01])}')
+_ASS_OVERRIDE = re.compile(r'\{[^}]*}')
+_SRT_SIMPLE_TAG = re.compile(r'<(/?)([ibu])>', re.IGNORECASE)
+_SRT_TAG = re.compile(r'</?[^>]+>')
+
+
+class SubtitleParseError(ValueError):
+    """ Файл не удалось разобрать как субтитры ASS или SRT """
+    pass
+
+
+# дробная часть секунды из файла -> миллисекунды ("5" -> 500, "05" -> 50, "005" -> 5)
+_FRACTION_MS = {f'{n:0{width}}': n * 10 ** (3 - width) for width in (1, 2, 3) for n in range(10 ** width)}
+
+
+def _parse_times(times: list[tuple[str, ...]]) -> array:
+    """ Столбец времени (в миллисекундах) из частей (часы, минуты, секунды, дробная часть) """
+    return array('q', [
+        ((int(h) * 60 + int(m)) * 60 + int(s)) * 1000 + _FRACTION_MS[fraction]
+        for h, m, s, fraction in times
+    ])
+
+
+def _format_srt_times(times: array) -> list[str]:
+    return ['%02d:%02d:%02d,%03d' % (t // 3600000, t // 60000 % 60, t // 1000 % 60, t % 1000) for t in times]
+
+
+def _format_ass_times(times: array) -> list[str]:
+    # ASS хранит сотые доли секунды
+    return ['%d:%02d:%02d.%02d' % (cs // 360000, cs // 6000 % 60, cs // 100 % 60, cs % 100)
+            for cs in [(t + 5) // 10 for t in times]]
+
+
+def _ass_text_to_srt(text: str) -> str:
+    text = _ASS_SIMPLE_TAG.sub(lambda m: f'<{"" if m.group(2) == "1" else "/"}{m.group(1)}>', text)
+    text = _ASS_OVERRIDE.sub('', text)
+    return text.replace('\\N', '\n').replace('\\n', '\n').replace('\\h', ' ')
+
+
+def _srt_text_to_ass(text: str) -> str:
+    text = _SRT_SIMPLE_TAG.sub(lambda m: f'{{\\{m.group(2).lower()}{"0" if m.group(1) else "1"}}}', text)
+    return _SRT_TAG.sub('', text).replace('\n', '\\N')
+
+
+def decode_subtitles(raw: bytes) -> str:
+    """ Декодирует файл субтитров, перебирая ``SUBTITLE_ENCODINGS``, и приводит переводы строк к ``\\n`` """
+    # UTF-16 определяется только по BOM: без него как UTF-16 декодируются почти любые байты
+    encodings = ('utf-16',) if raw.startswith((b'\xff\xfe', b'\xfe\xff')) else SUBTITLE_ENCODINGS
+    for encoding in encodings:
+        try:
+            text = raw.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise SubtitleParseError('Неизвестная кодировка субтитров')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+@dataclass
+class Subtitles:
+    """
+    Субтитры в памяти. Операции изменяют объект и возвращают его, поэтому записываются цепочкой::
+
+        Subtitles.load(path).shift(1.5).scale(25 / 23.976).convert('srt').save(output)
+    """
+    fmt: str
+    # время начала и конца событий (в миллисекундах)
+    starts: array = field(default_factory=lambda: array('q'))
+    ends: array = field(default_factory=lambda: array('q'))
+    # текст событий в синтаксисе ``fmt``
+    texts: list[str] = field(default_factory=list)
+    # ASS: строки до событий (Script Info, стили, Format событий) и после них (например, [Fonts])
+    header: list[str] = field(default_factory=list)
+    footer: list[str] = field(default_factory=list)
+    # ASS: столбцы событий из строки Format и для каждого события его тип (Dialogue, Comment) и значения столбцов
+    columns: list[str] = field(default_factory=lambda: list(ASS_EVENT_COLUMNS))
+    kinds: list[str] = field(default_factory=list)
+    fields: list[list[str]] = field(default_factory=list)
+    # ASS: строки среди событий, которые событиями не являются (комментарии "; ...", Picture, Sound,
+    # нераспознанные строки), по номеру события, перед которым они стоят. Записываются обратно как есть
+    raw_lines: dict[int, list[str]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def parse(cls, text: str, fmt: str) -> 'Subtitles':
+        """
+        Разбирает текст субтитров
+        :param text: содержимое файла (см. ``decode_subtitles``)
+        :param fmt: формат - ``ass`` или ``srt``
+        :raises SubtitleParseError: если формат не поддерживается или в файле нет событий
+        """
+        match fmt:
+            case 'srt':
+                return cls.__parse_srt(text)
+            case 'ass' | 'ssa':
+                return cls.__parse_ass(text)
+            case _:
+                raise SubtitleParseError(f'Формат субтитров {fmt} не поддерживается')
+
+    @classmethod
+    def load(cls, path: Path) -> 'Subtitles':
+        """ Читает файл субтитров, формат определяется по расширению """
+        return cls.parse(decode_subtitles(path.read_bytes()), path.suffix.lstrip('.').lower())
+
+    @classmethod
+    def __parse_srt(cls, text: str) -> 'Subtitles':
+        events = _SRT_EVENT.findall(text)
+        if not events and text.strip():
+            raise SubtitleParseError('В файле нет событий SRT')
+        return cls(
+            fmt='srt',
+            starts=_parse_times([e[0:4] for e in events]),
+            ends=_parse_times([e[4:8] for e in events]),
+            texts=[e[8].rstrip('\n') for e in events],
+        )
+
+    @classmethod
+    def __parse_ass(cls, text: str) -> 'Subtitles':
+        subtitles = cls(fmt='ass')
+        starts: list[tuple[str, ...]] = []
+        ends: list[tuple[str, ...]] = []
+        section = ''
+        lines = text.split('\n')
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                if section == '[events]':
+                    # секции после событий сохраняются как есть
+                    subtitles.footer = '\n'.join(lines[i:]).rstrip('\n').split('\n')
+                    break
+                section = stripped.lower()
+            if section != '[events]' or not starts and not stripped.startswith(('Dialogue:', 'Comment:')):
+                if section == '[events]' and stripped.startswith('Format:'):
+                    subtitles.columns = [c.strip() for c in stripped[len('Format:'):].split(',')]
+                subtitles.header.append(line)
+                continue
+            kind, _, values = line.lstrip().partition(':')
+            # Text - последний столбец и может содержать запятые и значимые пробелы:
+            # поля сохраняются как есть, у последнего отбрасывается только перевод строки
+            row = values.removeprefix(' ').split(',', len(subtitles.columns) - 1)
+            start = end = None
+            if kind in ('Dialogue', 'Comment') and len(row) == len(subtitles.columns):
+                row[-1] = row[-1].rstrip('\r\n')
+                start = _ASS_TIME.fullmatch(row[subtitles.__column('Start')].strip())
+                end = _ASS_TIME.fullmatch(row[subtitles.__column('End')].strip())
+            if start is None or end is None:
+                subtitles.raw_lines.setdefault(len(starts), []).append(line)
+                continue
+            starts.append(start.groups())
+            ends.append(end.groups())
+            subtitles.kinds.append(kind)
+            subtitles.texts.append(row[subtitles.__column('Text')])
+            subtitles.fields.append(row)
+        if not subtitles.header or not any(line.strip().lower() == '[events]' for line in subtitles.header):
+            raise SubtitleParseError('В файле нет секции [Events]')
+        while subtitles.header and not subtitles.header[-1].strip():
+            subtitles.header.pop()
+        # пустые строки после событий - разделитель секций, dumps добавляет его сам
+        tail = subtitles.raw_lines.get(len(starts), [])
+        while tail and not tail[-1].strip():
+            tail.pop()
+        if not tail:
+            subtitles.raw_lines.pop(len(starts), None)
+        subtitles.starts = _parse_times(starts)
+        subtitles.ends = _parse_times(ends)
+        return subtitles
+
+    def __column(self, name: str) -> int:
+        try:
+            return self.columns.index(name)
+        except ValueError:
+            raise SubtitleParseError(f'В строке Format событий нет столбца {name}') from None
+
+    def __keep(self, indexes: list[int]) -> None:
+        """
+        Оставляет только события с указанными номерами.
+        Строки ``raw_lines`` перед удаленным событием переходят к следующему оставленному,
+        поэтому при изменении порядка событий (номера не по возрастанию) их нужно очистить отдельно
+        """
+        if self.raw_lines:
+            raw_lines: dict[int, list[str]] = {}
+            for i, lines in sorted(self.raw_lines.items()):
+                raw_lines.setdefault(bisect_left(indexes, i), []).extend(lines)
+            self.raw_lines = raw_lines
+        self.starts = array('q', [self.starts[i] for i in indexes])
+        self.ends = array('q', [self.ends[i] for i in indexes])
+        self.texts = [self.texts[i] for i in indexes]
+        if self.fields:
+            self.kinds = [self.kinds[i] for i in indexes]
+            self.fields = [self.fields[i] for i in indexes]
+
+    def shift(self, seconds: float) -> 'Subtitles':
+        """
+        Сдвигает все события на ``seconds`` секунд (отрицательный сдвиг - раньше).
+        События, закончившиеся до начала видео, удаляются, начавшиеся раньше - начинаются с нуля
+        """
+        delta = round(seconds * 1000)
+        if not delta:
+            return self
+        self.starts = array('q', [t + delta for t in self.starts])
+        self.ends = array('q', [t + delta for t in self.ends])
+        if delta < 0:
+            if min(self.ends, default=1) <= 0:
+                self.__keep([i for i, t in enumerate(self.ends) if t > 0])
+            self.starts = array('q', [t if t > 0 else 0 for t in self.starts])
+        return self
+
+    def scale(self, factor: float) -> 'Subtitles':
+        """ Умножает время событий на ``factor``, например, ``25 / 23.976`` при смене частоты кадров видео """
+        if factor <= 0:
+            raise ValueError('Коэффициент масштабирования должен быть положительным')
+        if factor != 1:
+            self.starts = array('q', [round(t * factor) for t in self.starts])
+            self.ends = array('q', [round(t * factor) for t in self.ends])
+        return self
+
+    def convert(self, fmt: str) -> 'Subtitles':
+        """
+        Конвертирует субтитры в формат ``fmt``. Из ASS в SRT переносятся только реплики (Dialogue),
+        стили и позиционирование теряются, курсив, жирный и подчеркивание сохраняются
+        """
+        if fmt == self.fmt:
+            return self
+        match fmt:
+            case 'srt':
+                self.__keep(sorted(
+                    (i for i, kind in enumerate(self.kinds) if kind == 'Dialogue'),
+                    key=self.starts.__getitem__,
+                ))
+                self.texts = [_ass_text_to_srt(text) for text in self.texts]
+                self.header, self.footer, self.kinds, self.fields, self.raw_lines = [], [], [], [], {}
+                self.columns = list(ASS_EVENT_COLUMNS)
+            case 'ass':
+                self.texts = [_srt_text_to_ass(text) for text in self.texts]
+                self.header = list(ASS_DEFAULT_HEADER)
+                self.columns = list(ASS_EVENT_COLUMNS)
+                self.kinds = ['Dialogue'] * len(self.texts)
+                self.fields = [['0', '', '', 'Default', '', '0', '0', '0', '', ''] for _ in self.texts]
+            case _:
+                raise SubtitleParseError(f'Формат субтитров {fmt} не поддерживается')
+        self.fmt = fmt
+        return self
+
+    def dumps(self) -> str:
+        """ Текст файла субтитров в формате ``self.fmt`` """
+        if self.fmt == 'srt':
+            starts = _format_srt_times(self.starts)
+            ends = _format_srt_times(self.ends)
+            return ''.join(
+                f'{n}\n{start} --> {end}\n{text}\n\n'
+                for n, start, end, text in zip(range(1, len(self.texts) + 1), starts, ends, self.texts)
+            )
+
+        start_column, end_column, text_column = (self.__column(name) for name in ('Start', 'End', 'Text'))
+        lines = list(self.header)
+        starts = _format_ass_times(self.starts)
+        ends = _format_ass_times(self.ends)
+        for n, (kind, row, start, end, text) in enumerate(zip(self.kinds, self.fields, starts, ends, self.texts)):
+            row[start_column] = start
+            row[end_column] = end
+            row[text_column] = text
+            lines += self.raw_lines.get(n, [])
+            lines.append(f'{kind}: {",".join(row)}')
+        lines += self.raw_lines.get(len(self.texts), [])
+        if self.footer:
+            lines.append('')
+            lines += self.footer
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path: Path) -> None:
+        path.write_text(self.dumps(), encoding='utf-8', newline='\n')
+
+
+def prepare_subtitles(
+        source: Path,
+        output: Path,
+        shift: float = 0,
+        scale: float = 1,
+        fmt: str | None = None,
+) -> Path:
+    """
+    Сохраняет в ``output`` сдвинутую, масштабированную и (или) сконвертированную копию субтитров
+    :param source: исходный файл ASS или SRT
+    :param output: путь результата, его расширение заменяется форматом результата
+    :param shift: сдвиг (в секундах)
+    :param scale: коэффициент масштабирования времени
+    :param fmt: формат результата, по умолчанию - формат исходного файла
+    :return: путь результата
+    :raises SubtitleParseError: если файл не удалось разобрать
+    """
+    subtitles = Subtitles.load(source).scale(scale).shift(shift)
+    if fmt is not None:
+        subtitles.convert(fmt)
+    output = output.with_suffix(f'.{subtitles.fmt}')
+    subtitles.save(output)
+    return output
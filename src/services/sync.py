@@ -0,0 +1,111 @@
+from pathlib import Path
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy нужен только для автоподбора сдвига субтитров, остальные операции работают без него
+    np = None
+
+from .subtitles import Subtitles
+
+# Автоподбор сдвига субтитров: огибающая громкости речи из звуковой дорожки видео сравнивается
+# с разметкой "идет реплика / нет реплики" из субтитров. Сдвиг - положение пика их взаимной корреляции,
+# которая для всех сдвигов сразу считается через БПФ
+
+# полоса частот речи (Гц), остальное отфильтровывается ffmpeg до анализа
+SPEECH_BAND = (300, 3000)
+# окно сглаживания огибающей (в секундах): паузы между словами внутри реплики не должны разрывать речь
+ENVELOPE_SMOOTHING_SECONDS = 0.2
+
+
+class SyncEstimate(NamedTuple):
+    """ Предлагаемый сдвиг субтитров """
+    # сдвиг (в секундах), который нужно применить к субтитрам
+    shift: float
+    # коэффициент корреляции речи и реплик при этом сдвиге: около 0 - совпадения нет, 1 - полное совпадение
+    confidence: float
+
+
+def sync_available() -> bool:
+    """ Доступен ли автоподбор сдвига (установлен ли numpy) """
+    return np is not None
+
+
+def pcm_command(ffmpeg: str, video: Path, sample_rate: int, seconds: float) -> list[str | Path]:
+    """
+    Команда ffmpeg, выводящая в stdout первые ``seconds`` секунд первой звуковой дорожки видео:
+    моно, 16 бит, частота ``sample_rate``, только полоса речи
+    """
+    low, high = SPEECH_BAND
+    return [
+        ffmpeg,
+        '-v', 'error',
+        '-t', str(seconds),                     # читается только начало видео
+        '-i', video,
+        '-map', '0:a:0',
+        '-ac', '1',
+        '-ar', str(sample_rate),
+        '-af', f'highpass=f={low},lowpass=f={min(high, sample_rate // 2)}',
+        '-f', 's16le',
+        'pipe:1',
+    ]
+
+
+def speech_envelope(pcm: bytes, sample_rate: int, frame_rate: int) -> 'np.ndarray':
+    """
+    Огибающая речи: громкость (в логарифмической шкале) над фоном для каждого кадра длиной ``1 / frame_rate`` с
+    :param pcm: звук в формате s16le моно (см. ``pcm_command``)
+    :param sample_rate: частота дискретизации ``pcm``
+    :param frame_rate: число кадров огибающей в секунду
+    """
+    samples = np.frombuffer(pcm[:len(pcm) // 2 * 2], dtype='<i2').astype(np.float32)
+    frame = sample_rate // frame_rate
+    frames = len(samples) // frame
+    if not frames:
+        return np.zeros(0, dtype=np.float32)
+    rms = np.sqrt(np.mean(np.square(samples[:frames * frame].reshape(frames, frame)), axis=1))
+    loudness = np.log10(rms + 1)
+    envelope = np.clip(loudness - np.median(loudness), 0, None)
+    window = max(1, round(ENVELOPE_SMOOTHING_SECONDS * frame_rate))
+    return np.convolve(envelope, np.ones(window, dtype=np.float32) / window, mode='same')
+
+
+def subtitle_timeline(subtitles: Subtitles, frame_rate: int, frames: int) -> 'np.ndarray':
+    """
+    Разметка субтитров по кадрам: 1 - в кадре идет реплика, 0 - нет. Комментарии ASS не учитываются
+    :param frames: длина разметки (в кадрах), события за ее пределами отбрасываются
+    """
+    starts = np.frombuffer(subtitles.starts, dtype=np.int64)
+    ends = np.frombuffer(subtitles.ends, dtype=np.int64)
+    if subtitles.kinds:
+        dialogue = np.array([kind == 'Dialogue' for kind in subtitles.kinds], dtype=bool)
+        starts, ends = starts[dialogue], ends[dialogue]
+    # начало реплики +1, конец -1: накопленная сумма больше нуля, пока идет хотя бы одна реплика
+    edges = np.zeros(frames + 1, dtype=np.int32)
+    np.add.at(edges, np.clip(starts * frame_rate // 1000, 0, frames), 1)
+    np.add.at(edges, np.clip(ends * frame_rate // 1000, 0, frames), -1)
+    return (np.cumsum(edges[:frames]) > 0).astype(np.float32)
+
+
+def estimate_shift(envelope: 'np.ndarray', timeline: 'np.ndarray', frame_rate: int, max_shift: float) -> SyncEstimate:
+    """
+    Подбирает сдвиг разметки субтитров, при котором она лучше всего совпадает с огибающей речи
+    :param envelope: огибающая речи (см. ``speech_envelope``)
+    :param timeline: разметка субтитров (см. ``subtitle_timeline``)
+    :param frame_rate: число кадров огибающей и разметки в секунду
+    :param max_shift: наибольший рассматриваемый сдвиг (в секундах) в обе стороны
+    """
+    speech = envelope - envelope.mean()
+    lines = timeline - timeline.mean()
+    norm = float(np.linalg.norm(speech) * np.linalg.norm(lines))
+    if not norm:
+        return SyncEstimate(0.0, 0.0)
+    # длина БПФ не меньше суммы длин, иначе корреляция при больших сдвигах "заворачивается"
+    size = 1 << (len(speech) + len(lines) - 1).bit_length()
+    # correlation[k] = sum(speech[i + k] * lines[i]): отрицательные сдвиги - в конце массива
+    correlation = np.fft.irfft(np.fft.rfft(speech, size) * np.conj(np.fft.rfft(lines, size)), size)
+    max_lag = min(round(max_shift * frame_rate), len(speech) - 1, len(lines) - 1)
+    lags = np.concatenate((correlation[size - max_lag:], correlation[:max_lag + 1]))
+    best = int(np.argmax(lags))
+    return SyncEstimate((best - max_lag) / frame_rate, float(lags[best]) / norm)
@@ -0,0 +1,234 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+from settings import Defaults, EncoderPreset
+from src.schemas import FFprobeFileData, StreamType
+from .subtitles import SUBTITLE_CODEC_FORMATS
+
+# кодеки (имена из вывода ffprobe), которые контейнер принимает без перекодирования.
+# None - любые, пустое множество - потоки этого типа контейнер не поддерживает
+CONTAINER_CODECS: dict[str, dict[str, frozenset[str] | None]] = {
+    'mkv': {
+        StreamType.VIDEO: None,
+        StreamType.AUDIO: None,
+        StreamType.SUBTITLE: None,
+        StreamType.ATTACHMENT: None,
+    },
+    'mp4': {
+        StreamType.VIDEO: frozenset({'h264', 'hevc', 'av1', 'vp9', 'mpeg4', 'mpeg2video', 'mjpeg', 'png'}),
+        StreamType.AUDIO: frozenset({'aac', 'mp3', 'ac3', 'eac3', 'opus', 'flac', 'alac'}),
+        StreamType.SUBTITLE: frozenset({'mov_text'}),
+    },
+    'webm': {
+        StreamType.VIDEO: frozenset({'vp8', 'vp9', 'av1'}),
+        StreamType.AUDIO: frozenset({'opus', 'vorbis'}),
+        StreamType.SUBTITLE: frozenset({'webvtt'}),
+    },
+    'ts': {
+        StreamType.VIDEO: frozenset({'h264', 'hevc', 'mpeg2video'}),
+        StreamType.AUDIO: frozenset({'aac', 'mp3', 'ac3', 'eac3', 'mp2', 'opus'}),
+        StreamType.SUBTITLE: frozenset({'dvb_subtitle'}),
+    },
+    'avi': {
+        StreamType.VIDEO: frozenset({'h264', 'mpeg4', 'msmpeg4v3', 'mjpeg', 'mpeg2video'}),
+        StreamType.AUDIO: frozenset({'mp3', 'ac3', 'aac', 'pcm_s16le'}),
+    },
+}
+# текстовые субтитры, которые можно сконвертировать в формат контейнера без распознавания
+TEXT_SUBTITLE_CODECS = frozenset({'ass', 'ssa', 'subrip', 'srt', 'mov_text', 'webvtt', 'text'})
+CONTAINER_TEXT_SUBTITLE_CODECS: dict[str, str] = {
+    'mkv': 'ass',
+    'mp4': 'mov_text',
+    'webm': 'webvtt',
+}
+
+
+class IncompatiblePresetError(ValueError):
+    """ Пресет кодирует в кодек, который не поддерживается целевым контейнером """
+    pass
+
+
+@dataclass
+class StreamPlan:
+    """ Аргументы ffmpeg, описывающие, какие потоки копировать, а какие перекодировать """
+    args: list[str] = field(default_factory=list)
+    # индексы перекодируемых потоков исходного файла
+    encoded: list[int] = field(default_factory=list)
+    encoded_video: list[int] = field(default_factory=list)
+    # индексы потоков, которые нельзя поместить в контейнер
+    dropped: list[int] = field(default_factory=list)
+    # индексы потоков исходного файла в порядке их выходных потоков
+    mapped: list[int] = field(default_factory=list)
+
+    @property
+    def encodes(self) -> bool:
+        return bool(self.encoded)
+
+
+def is_copyable(codec_name: str, stream_type: str, output_format: str) -> bool:
+    """ Можно ли скопировать поток в контейнер ``output_format`` без перекодирования """
+    codecs = CONTAINER_CODECS.get(output_format, {})
+    if stream_type not in codecs:
+        return False
+    allowed = codecs[stream_type]
+    return allowed is None or codec_name in allowed
+
+
+def video_encoder_args(preset: EncoderPreset, out: int) -> list[str]:
+    """ Аргументы кодирования видеопотока ``out`` результирующего файла согласно ``preset`` """
+    args = [f'-c:{out}', preset.VIDEO_ENCODER]
+    if preset.CRF is not None:
+        args += [f'-crf:{out}', str(preset.CRF)]
+    if preset.VIDEO_BITRATE is not None:
+        args += [f'-b:{out}', preset.VIDEO_BITRATE]
+    if preset.SPEED is not None:
+        args += [f'-preset:{out}', preset.SPEED]
+    return args
+
+
+def audio_encoder_args(preset: EncoderPreset, out: int) -> list[str]:
+    """ Аргументы кодирования аудиопотока ``out`` результирующего файла согласно ``preset`` """
+    args = [f'-c:{out}', preset.AUDIO_ENCODER]
+    if preset.AUDIO_BITRATE is not None:
+        args += [f'-b:{out}', preset.AUDIO_BITRATE]
+    return args
+
+
+def plan_streams(
+        f_info: FFprobeFileData,
+        output_format: str,
+        preset: EncoderPreset | None,
+        input_index: int = 0,
+        skip_video: bool = False,
+        first_output: int = 0,
+        stream_types: Iterable[str] | None = None,
+) -> StreamPlan:
+    """
+    Составляет аргументы ffmpeg для перепаковки файла в ``output_format``:
+    совместимые с контейнером потоки копируются, видео и аудио перекодируются согласно ``preset``,
+    текстовые субтитры конвертируются в формат контейнера, остальные потоки отбрасываются
+    :param f_info: метаданные исходного файла
+    :param output_format: формат результирующего файла
+    :param preset: параметры перекодирования, ``None`` - видео и аудио только копируются
+    :param input_index: номер входа ffmpeg, соответствующего исходному файлу
+    :param skip_video: не включать видеопотоки (их источником служит другой вход)
+    :param first_output: номер первого выходного потока
+    :param stream_types: включать только потоки этих типов (например, только аудио из файла озвучки)
+    :raises IncompatiblePresetError: если перекодировать нужно, но пресет не задан
+        либо кодирует в неподходящий кодек
+    """
+    plan = StreamPlan()
+    out = first_output
+    stream_types = set(stream_types) if stream_types is not None else None
+    for s in sorted(f_info.streams, key=lambda x: x.index):
+        if skip_video and s.codec_type == StreamType.VIDEO:
+            continue
+        if stream_types is not None and s.codec_type not in stream_types:
+            continue
+        source = ['-map', f'{input_index}:{s.index}']
+        if is_copyable(s.codec_name, s.codec_type, output_format):
+            plan.args += [*source, f'-c:{out}', 'copy']
+        elif preset is None and s.codec_type in (StreamType.VIDEO, StreamType.AUDIO):
+            raise IncompatiblePresetError(
+                f'Поток {s.index} ({s.codec_name}) нельзя поместить в {output_format} без перекодирования',
+            )
+        elif s.codec_type == StreamType.VIDEO:
+            if not is_copyable(preset.VIDEO_CODEC, StreamType.VIDEO, output_format):
+                raise IncompatiblePresetError(f'Видеокодек {preset.VIDEO_CODEC} несовместим с {output_format}')
+            plan.args += [*source, *video_encoder_args(preset, out)]
+            plan.encoded.append(s.index)
+            plan.encoded_video.append(s.index)
+        elif s.codec_type == StreamType.AUDIO:
+            if not is_copyable(preset.AUDIO_CODEC, StreamType.AUDIO, output_format):
+                raise IncompatiblePresetError(f'Аудиокодек {preset.AUDIO_CODEC} несовместим с {output_format}')
+            plan.args += [*source, *audio_encoder_args(preset, out)]
+            plan.encoded.append(s.index)
+        elif (
+                s.codec_type == StreamType.SUBTITLE
+                and s.codec_name in TEXT_SUBTITLE_CODECS
+                and output_format in CONTAINER_TEXT_SUBTITLE_CODECS
+        ):
+            # конвертация текстовых субтитров дешевая, поэтому перекодированием не считается
+            plan.args += [*source, f'-c:{out}', CONTAINER_TEXT_SUBTITLE_CODECS[output_format]]
+        else:
+            plan.dropped.append(s.index)
+            continue
+        plan.mapped.append(s.index)
+        out += 1
+
+    if plan.encoded_video:
+        plan.args += preset.EXTRA_ARGS
+    return plan
+
+
+@dataclass
+class SubtitleExtractionPlan:
+    """ Аргументы ffmpeg для извлечения субтитров: для каждого потока своя пара -map/выходной файл """
+    args: list[str | Path] = field(default_factory=list)
+    # имена выходных файлов в порядке потоков
+    filenames: list[str] = field(default_factory=list)
+    # индексы потоков выбранных языков, которые нельзя извлечь в текст (растровые PGS, VobSub и т.п.)
+    dropped: list[int] = field(default_factory=list)
+
+
+def plan_subtitle_extraction(
+        f_info: FFprobeFileData,
+        name: str,
+        languages: list[str],
+        output_dir: Path,
+) -> SubtitleExtractionPlan:
+    """
+    Составляет аргументы ffmpeg для извлечения субтитров заданных языков в отдельные файлы:
+    ASS и SRT копируются, остальные текстовые субтитры конвертируются в ASS, растровые пропускаются -
+    ffmpeg не умеет переводить их в текст, и один такой поток сорвал бы извлечение всех остальных
+    :param f_info: метаданные видеофайла
+    :param name: имя видеофайла без расширения, с него начинаются имена результатов
+    :param languages: языки извлекаемых субтитров
+    :param output_dir: каталог результатов
+    """
+    plan = SubtitleExtractionPlan()
+    for s in f_info.get_streams_of_type(StreamType.SUBTITLE):
+        if s.tags.language not in languages:
+            continue
+        output_format = SUBTITLE_CODEC_FORMATS.get(s.codec_name)
+        if output_format in Defaults.subtitle_supported_formats:
+            codec = 'copy'
+        elif s.codec_name in TEXT_SUBTITLE_CODECS:
+            output_format = codec = Defaults.subtitle_supported_formats[0]
+        else:
+            plan.dropped.append(s.index)
+            continue
+
+        filename = f'{name} ({s.tags.name}).{output_format}'
+        if filename in plan.filenames:
+            filename = f'{name} ({s.tags.name}-{s.index}).{output_format}'
+        plan.filenames.append(filename)
+        # TODO: сохранять метаданные из потока субтитров
+        plan.args += ['-map', f'0:{s.index}', '-c', codec, '-f', output_format, output_dir / filename]
+    return plan
+
+
+def merge_segment_progress(blocks: Iterable[dict[str, str]]) -> dict[str, str]:
+    """
+    Сводит блоки ``-progress`` параллельно кодируемых частей файла в один блок для всего файла:
+    обработанное время, размер и скорость частей суммируются
+    """
+    out_time_us, total_size, speed = 0.0, 0.0, 0.0
+    for block in blocks:
+        out_time_us += max(_to_float(block.get('out_time_us')), 0)
+        total_size += _to_float(block.get('total_size'))
+        speed += _to_float(block.get('speed', '').removesuffix('x'))
+    return {
+        'out_time_us': str(int(out_time_us)),
+        'total_size': str(int(total_size)),
+        'speed': f'{speed:.2f}x',
+        'progress': 'continue',
+    }
+
+
+def _to_float(value: str | None) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
@@ -1,3 +1,8 @@
+import os
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
 def format_file_size(nbytes: int | str | None) -> str:
     """ Переводит количество байтов в человеко-читаемый вид """
     if nbytes is None:
@@ -23,3 +28,54 @@ def format_duration(nsec: int | float | str | None) -> str:
     seconds = int(nsec % 60)
 
     return f'{hours:02}:{minutes:02}:{seconds:02}'
+
+
+def scan_dir(
+        path: Path | str,
+        formats: Iterable[str] | None = None,
+        recursively: bool = False,
+) -> Iterator[Path]:
+    """
+    Обходит каталог за один проход ``os.scandir``, отбирая файлы по расширению.
+    Тип записи берется из данных каталога, без отдельного ``stat`` на каждый файл
+    :param path: целевой каталог
+    :param formats: допустимые расширения (без точки, регистр не важен), ``None`` - все файлы
+    :param recursively: обходить ли подкаталоги
+    """
+    suffixes = {f'.{fmt.lower()}' for fmt in formats} if formats else None
+    stack = [os.fspath(path)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursively:
+                            stack.append(entry.path)
+                        continue
+                    if suffixes is not None and os.path.splitext(entry.name)[1].lower() not in suffixes:
+                        continue
+                    if entry.is_file():
+                        yield Path(entry.path)
+                except OSError:
+                    continue
+
+
+def scan_dir_chunks(
+        path: Path | str,
+        formats: Iterable[str] | None = None,
+        recursively: bool = False,
+        chunk_size: int = 256,
+) -> Iterator[list[Path]]:
+    """ То же, что ``scan_dir``, но отдает найденные файлы порциями по ``chunk_size`` """
+    chunk: list[Path] = []
+    for fpath in scan_dir(path, formats, recursively):
+        chunk.append(fpath)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -2,7 +2,13 @@ import re
 from typing import Callable
 from collections import UserString
 
-from kivy.utils import escape_markup
+
+def escape_markup(text: str) -> str:
+    """
+    Экранирует спецсимволы разметки Kivy (аналог ``kivy.utils.escape_markup``).
+    Своя реализация, чтобы схемы можно было использовать без Kivy
+    """
+    return text.replace('&', '&amp;').replace('[', '&bl;').replace(']', '&br;')
 
 
 class KivyLabelString(UserString):
@@ -84,3 +90,9 @@ def maxlen(items: list, key: Callable = lambda x: x) -> int:
         return 0
 
     return max(len(str(key(i))) for i in items)
+
+
+def strip_markup(text: str) -> str:
+    """ Удаляет из строки разметку Kivy, возвращая экранированные символы """
+    text = re.sub(r'\[/?(?:b|i|u|s|sub|sup|color|size|font|ref|anchor)(?:=[^\]]*)?\]', '', text)
+    return text.replace('&bl;', '[').replace('&br;', ']').replace('&amp;', '&')
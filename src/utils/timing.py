@@ -0,0 +1,28 @@
+import time
+
+
+class Stopwatch:
+    """ Засекает длительность последовательных этапов (например, запуска приложения) """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started = time.perf_counter()
+        self.marks: list[tuple[str, float]] = []
+
+    def mark(self, label: str) -> None:
+        """ Отмечает завершение этапа """
+        self.marks.append((label, time.perf_counter()))
+
+    @property
+    def elapsed(self) -> float:
+        """ Секунд от создания до последней отметки """
+        return self.marks[-1][1] - self.started if self.marks else 0.0
+
+    def report(self) -> str:
+        """ Возвращает длительность каждого этапа и общее время """
+        lines = [f'{self.name}: {self.elapsed * 1000:.0f} мс']
+        previous = self.started
+        for label, moment in self.marks:
+            lines.append(f'  {label}: {(moment - previous) * 1000:.0f} мс')
+            previous = moment
+        return '\n'.join(lines)
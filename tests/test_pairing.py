@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from src.schemas import FileItem
+from src.services.pairing import Episode, language_tag, pair_tracks, parse_episode, unpaired_tracks
+
+
+def items(*names: str) -> list[FileItem]:
+    return [FileItem(abs_path=Path('/media') / name) for name in names]
+
+
+def test_parse_episode():
+    assert parse_episode('[Grp] Show S01E05 [1080p]') == Episode(1, 5)
+    assert parse_episode('Show 2x07') == Episode(2, 7)
+    assert parse_episode('Show - 05v2 (eng)') == Episode(None, 5)
+    assert parse_episode('Show_03') == Episode(None, 3)
+    assert parse_episode('Show Ep.12') == Episode(None, 12)
+    assert parse_episode('Show') is None
+
+
+def test_pair_by_episode_number():
+    videos = items('[Grp] Show S01E01 [1080p].mkv', '[Grp] Show S01E02 [1080p].mkv')
+    tracks = items('Show - 02.rus.ass', 'Show - 01 (eng--Full).ass', 'Show_01.ass', 'Show - 99.ass')
+
+    pairs = pair_tracks(videos, tracks)
+
+    assert [[t.name for t in group] for _, group in pairs] == [
+        ['Show - 01 (eng--Full)', 'Show_01'],
+        ['Show - 02.rus'],
+    ]
+    assert [t.name for t in unpaired_tracks(pairs, tracks)] == ['Show - 99']
+
+
+def test_pair_by_name_takes_priority_over_episode():
+    videos = items('Ep01.mkv', 'Ep02.mkv')
+    tracks = items('Ep02.AniDub.mka', 'Ep01.mka')
+
+    pairs = pair_tracks(videos, tracks)
+
+    assert [[t.fullname for t in group] for _, group in pairs] == [['Ep01.mka'], ['Ep02.AniDub.mka']]
+
+
+def test_language_tag_uses_parsed_languages():
+    assert language_tag(items('Ep01.eng.ass', 'Ep01.srt'), 'rus', 'SUB') == ' [ENG+RUS SUB]'
+    assert language_tag([], 'rus', 'SUB') == ''
@@ -0,0 +1,115 @@
+import pytest
+
+from src.services.subtitles import SubtitleParseError, Subtitles
+
+SRT = (
+    '1\n'
+    '00:00:01,000 --> 00:00:02,500\n'
+    '<i>Hello</i>, world\n'
+    '\n'
+    '2\n'
+    '00:01:03,250 --> 00:01:05,000\n'
+    'two\n'
+    'lines\n'
+    '\n'
+)
+
+ASS = (
+    '[Script Info]\n'
+    'ScriptType: v4.00+\n'
+    '\n'
+    '[Events]\n'
+    'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n'
+    'Dialogue: 0,0:00:00.20,0:00:00.40,Default,,0,0,0,,early\n'
+    'Comment: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,note\n'
+    'Dialogue: 0,0:00:01.00,0:00:02.50,Default,,0,0,0,,  Hello, {\\b1}world{\\b0}  \n'
+)
+
+
+def test_srt_ass_round_trip():
+    ass = Subtitles.parse(SRT, 'srt').convert('ass')
+
+    assert list(ass.starts) == [1000, 63250]
+    assert ass.texts == ['{\\i1}Hello{\\i0}, world', 'two\\Nlines']
+    assert Subtitles.parse(ass.dumps(), 'ass').convert('srt').dumps() == SRT
+
+
+def test_ass_text_is_kept_as_is():
+    assert Subtitles.parse(ASS, 'ass').dumps() == ASS
+
+
+def test_ass_to_srt_keeps_dialogue_only():
+    srt = Subtitles.parse(ASS, 'ass').convert('srt')
+
+    assert srt.texts == ['early', '  Hello, <b>world</b>  ']
+    assert list(srt.starts) == [200, 1000]
+
+
+def test_negative_shift_clamps_to_zero():
+    subtitles = Subtitles.parse(ASS, 'ass').shift(-1.2)
+
+    # "early" закончилась до начала видео, остальные события начинались раньше нуля
+    assert subtitles.texts == ['note', '  Hello, {\\b1}world{\\b0}  ']
+    assert list(subtitles.starts) == [0, 0]
+    assert list(subtitles.ends) == [800, 1300]
+    assert 'Comment: 0,0:00:00.00,0:00:00.80,' in subtitles.dumps()
+
+
+def test_shift_round_trip_through_srt():
+    shifted = Subtitles.parse(SRT, 'srt').shift(1.5).convert('ass').shift(-1.5).convert('srt')
+
+    assert shifted.dumps() == SRT
+
+
+def test_empty_file_is_rejected():
+    with pytest.raises(SubtitleParseError):
+        Subtitles.parse('not subtitles', 'srt')
+
+
+EVENTS_WITH_EXTRA_LINES = (
+    '[Script Info]\n'
+    'ScriptType: v4.00+\n'
+    '\n'
+    '[Events]\n'
+    'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n'
+    'Dialogue: 0,0:00:00.20,0:00:00.40,Default,,0,0,0,,early\n'
+    '; --- part A ---\n'
+    'Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,one\n'
+    'Comment: 0,0:00:02.00,0:00:03.00,Default,,0,0,0,,between\n'
+    '\n'
+    'Picture: 0,0:00:02.00,0:00:03.00,Default,,0,0,0,,logo.png\n'
+    'Dialogue: broken line\n'
+    'Dialogue: 0,0:00:03.00,0:00:04.00,Default,,0,0,0,,two\n'
+    '; end\n'
+    '\n'
+    '[Fonts]\n'
+    'fontname: a.ttf\n'
+)
+
+
+def test_ass_non_event_lines_round_trip():
+    subtitles = Subtitles.parse(EVENTS_WITH_EXTRA_LINES, 'ass')
+
+    assert subtitles.kinds == ['Dialogue', 'Dialogue', 'Comment', 'Dialogue']
+    assert subtitles.dumps() == EVENTS_WITH_EXTRA_LINES
+
+
+def test_ass_non_event_lines_survive_shift():
+    shifted = Subtitles.parse(EVENTS_WITH_EXTRA_LINES, 'ass').shift(-0.5)
+
+    # "early" удалена, а строки перед следующими событиями остались на своих местах (их время не сдвигается)
+    expected = (
+        EVENTS_WITH_EXTRA_LINES
+        .replace('Dialogue: 0,0:00:00.20,0:00:00.40,Default,,0,0,0,,early\n', '')
+        .replace('0:00:01.00,0:00:02.00', '0:00:00.50,0:00:01.50')
+        .replace('Comment: 0,0:00:02.00,0:00:03.00', 'Comment: 0,0:00:01.50,0:00:02.50')
+        .replace('0:00:03.00,0:00:04.00', '0:00:02.50,0:00:03.50')
+    )
+    assert shifted.dumps() == expected
+
+
+def test_ass_to_srt_drops_non_event_lines():
+    srt = Subtitles.parse(EVENTS_WITH_EXTRA_LINES, 'ass').convert('srt')
+
+    assert srt.texts == ['early', 'one', 'two']
+    assert srt.dumps().count('\n\n') == 3
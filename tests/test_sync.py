@@ -0,0 +1,59 @@
+from array import array
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from src.services.subtitles import Subtitles
+from src.services.sync import estimate_shift, speech_envelope, subtitle_timeline
+
+SAMPLE_RATE = 8000
+FRAME_RATE = 100
+DURATION = 120
+
+
+def make_subtitles(rng: 'np.random.Generator') -> Subtitles:
+    """ Реплики по 1-4 с с паузами по 0.5-3 с """
+    starts, ends = array('q'), array('q')
+    t = 1000
+    while t < (DURATION - 10) * 1000:
+        length = int(rng.integers(1000, 4000))
+        starts.append(t)
+        ends.append(t + length)
+        t += length + int(rng.integers(500, 3000))
+    return Subtitles(fmt='srt', starts=starts, ends=ends, texts=['...'] * len(starts))
+
+
+def make_pcm(subtitles: Subtitles, offset: float, rng: 'np.random.Generator') -> bytes:
+    """ Звук, в котором речь (громкий шум) идет на ``offset`` секунд позже реплик, поверх тихого фона """
+    samples = rng.normal(0, 50, DURATION * SAMPLE_RATE)
+    for start, end in zip(subtitles.starts, subtitles.ends):
+        a = max(0, round((start / 1000 + offset) * SAMPLE_RATE))
+        b = min(len(samples), round((end / 1000 + offset) * SAMPLE_RATE))
+        if b > a:
+            samples[a:b] += rng.normal(0, 3000, b - a)
+    return np.clip(samples, -32768, 32767).astype('<i2').tobytes()
+
+
+@pytest.mark.parametrize('offset', [2.37, -4.5, 0])
+def test_estimate_shift_recovers_offset(offset: float):
+    rng = np.random.default_rng(1)
+    subtitles = make_subtitles(rng)
+    envelope = speech_envelope(make_pcm(subtitles, offset, rng), SAMPLE_RATE, FRAME_RATE)
+    timeline = subtitle_timeline(subtitles, FRAME_RATE, len(envelope))
+
+    estimate = estimate_shift(envelope, timeline, FRAME_RATE, max_shift=30)
+
+    assert estimate.shift == pytest.approx(offset, abs=2 / FRAME_RATE)
+    assert estimate.confidence > 0.5
+    # после предложенного сдвига разметка совпадает с речью
+    shifted = subtitle_timeline(subtitles.shift(estimate.shift), FRAME_RATE, len(envelope))
+    assert estimate_shift(envelope, shifted, FRAME_RATE, max_shift=30).shift == pytest.approx(0, abs=2 / FRAME_RATE)
+
+
+def test_estimate_shift_without_speech():
+    timeline = np.zeros(1000, dtype=np.float32)
+
+    estimate = estimate_shift(np.ones(1000, dtype=np.float32), timeline, FRAME_RATE, max_shift=30)
+
+    assert estimate == (0.0, 0.0)
@@ -0,0 +1,42 @@
+from pathlib import Path
+
+from src.schemas import FFprobeFileData
+from src.services.transcode import plan_subtitle_extraction
+
+PROBE = '''{
+    "streams": [
+        {"index": 0, "codec_name": "h264", "codec_type": "video"},
+        {"index": 1, "codec_name": "aac", "codec_type": "audio", "tags": {"language": "jpn"}},
+        {"index": 2, "codec_name": "ass", "codec_type": "subtitle", "tags": {"language": "eng", "title": "Full"}},
+        {"index": 3, "codec_name": "hdmv_pgs_subtitle", "codec_type": "subtitle", "tags": {"language": "eng"}},
+        {"index": 4, "codec_name": "subrip", "codec_type": "subtitle", "tags": {"language": "rus"}},
+        {"index": 5, "codec_name": "dvd_subtitle", "codec_type": "subtitle", "tags": {"language": "rus"}},
+        {"index": 6, "codec_name": "mov_text", "codec_type": "subtitle", "tags": {"language": "rus"}},
+        {"index": 7, "codec_name": "ass", "codec_type": "subtitle", "tags": {"language": "jpn"}}
+    ]
+}'''
+
+
+def test_subtitle_extraction_skips_bitmap_streams():
+    f_info = FFprobeFileData.model_validate_json(PROBE)
+    output = Path('/out')
+
+    plan = plan_subtitle_extraction(f_info, 'Ep01', ['eng', 'rus'], output)
+
+    assert plan.dropped == [3, 5]
+    assert plan.filenames == ['Ep01 (eng--Full).ass', 'Ep01 (rus).srt', 'Ep01 (rus).ass']
+    assert plan.args == [
+        '-map', '0:2', '-c', 'copy', '-f', 'ass', output / 'Ep01 (eng--Full).ass',
+        '-map', '0:4', '-c', 'copy', '-f', 'srt', output / 'Ep01 (rus).srt',
+        '-map', '0:6', '-c', 'ass', '-f', 'ass', output / 'Ep01 (rus).ass',
+    ]
+
+
+def test_subtitle_extraction_drops_each_bitmap_stream():
+    f_info = FFprobeFileData.model_validate_json(PROBE.replace('"mov_text"', '"dvd_subtitle"'))
+
+    plan = plan_subtitle_extraction(f_info, 'Ep01', ['rus'], Path('/out'))
+
+    assert plan.dropped == [5, 6]
+    assert plan.filenames == ['Ep01 (rus).srt']
+    assert plan_subtitle_extraction(f_info, 'Ep01', ['ger'], Path('/out')).args == []